@@ -0,0 +1,475 @@
+"""
+asyncio (ASGI) version of the REST API in rest_api.py
+
+Many connections are served concurrently. Orders are queued for the single matching thread that owns the Exchange, see
+MatchingEngine, and GET /orderBook is served from the summary the matching thread publishes without waiting for it. The
+summary is only encoded once per version of the order book, and has an ETag so pollers can ask for it If-None-Match.
+When the queue is full requests are rejected straight away with 503 so that clients back off. Clients over their rate
+limit, or any client while too many requests are in flight, are rejected with 429 before their orders are parsed, see
+AdmissionController.
+
+GET /orderBook/stream pushes the order book as server sent events instead of polling: a snapshot event with every
+price level and then update events with the new total size of each level that changed, see MarketDataFeed.
+
+Run with an ASGI server, e.g. uvicorn (pip3 install uvicorn, Python 3.8+):
+    uvicorn exchange.asgi_api:app --host 0.0.0.0 --port 5000
+
+With EXCHANGE_ORDER_ENTRY_PORT set, orders are also taken in the binary order entry protocol on that port, see
+OrderEntryGateway, and matched on the same matching thread as the orders of the REST API.
+"""
+import asyncio
+import json
+import math
+import os
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+from exchange.components.admission_control import CLIENT_ID_HEADER
+from exchange.components.exchange import Exchange
+from exchange.components.market_data_feed import MarketDataFeed
+from exchange.components.matching_engine import MatchingEngine, QueueFullError
+from exchange.components.memory_report import TOP_ALLOCATORS, add_top_allocators, create_memory_report, \
+    take_allocation_snapshot
+from exchange.components.order import OrderType
+from exchange.components.trade_tape import TradesUnavailableError
+from exchange.configuration import create_admission_controller, create_exchange, create_memory_monitor, \
+    create_replica_publisher
+from exchange.order_entry_gateway import OrderEntryGateway
+from exchange.serialization import DEFAULT_MATCHES_LIMIT, DEFAULT_TRADES_LIMIT, MAX_MATCHES_LIMIT, MAX_TRADES_LIMIT, \
+    OrderBookJsonCache, OrderBookQuery, order_book_to_json, parse_order, trades_to_json
+
+_exchange = create_exchange()
+
+market_data_feed = MarketDataFeed(_exchange.get_exchange_summary())
+
+engine = MatchingEngine(
+    _exchange,
+    max_queue_size=int(os.environ.get('EXCHANGE_MAX_QUEUED_REQUESTS', 10000)),
+    market_data_feed=market_data_feed,
+    replica_publisher=create_replica_publisher(_exchange)
+)
+
+# Memory is checked on the matching thread after every batch, new orders are rejected while it is over the limit
+memory_monitor = create_memory_monitor(_exchange.get_metrics())
+
+if memory_monitor is not None:
+    engine.add_batch_listener(lambda exchange: memory_monitor.check())
+
+order_entry_gateway = OrderEntryGateway(_exchange, engine, memory_monitor) \
+    if os.environ.get('EXCHANGE_ORDER_ENTRY_PORT') else None
+
+# Only used on the event loop
+admission_controller = create_admission_controller(_exchange.get_metrics())
+order_book_cache = OrderBookJsonCache(json.dumps)
+
+# Set whenever the market data feed publishes, then replaced with a new event for the next publish
+_publish_event = None
+
+
+_CLIENT_ID_HEADER = CLIENT_ID_HEADER.lower().encode('latin-1')
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    if scope['type'] != 'http':
+        return
+
+    method = scope['method']
+    path = scope['path']
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+
+    try:
+        if path == '/order' and method == 'POST':
+            _reject_when_out_of_memory()
+
+            with _admission(scope):
+                body = await submit_limit_order(await _read_json(receive))
+        elif path == '/orders' and method == 'POST':
+            _reject_when_out_of_memory()
+
+            # Admitted before the body is read, a batch then takes one token per order
+            with _admission(scope):
+                orders_json = await _read_json(receive)
+
+                if admission_controller is not None and isinstance(orders_json, list) and len(orders_json) > 1:
+                    admission_controller.charge(_get_client(scope), len(orders_json) - 1)
+
+                body = await submit_limit_orders(orders_json)
+        elif path.startswith('/order/') and method == 'GET':
+            body = await get_order(path[len('/order/'):], query)
+        elif path.startswith('/order/') and method == 'DELETE':
+            with _admission(scope):
+                body = await cancel_order(path[len('/order/'):])
+        elif path == '/orderBook' and method == 'GET':
+            await send_order_book(send, query, scope['headers'])
+            return
+        elif path == '/trades' and method == 'GET':
+            body = await get_trades(query)
+        elif path == '/orderBook/stream' and method == 'GET':
+            await stream_order_book(receive, send)
+            return
+        elif path == '/debug/memory' and method == 'GET':
+            body = await get_memory_report(query)
+        elif path == '/metrics' and method == 'GET':
+            await _send_text(send, 200, await get_metrics(), 'text/plain; version=0.0.4')
+            return
+        else:
+            raise HttpError(404, 'Not Found')
+    except QueueFullError:
+        await _send_json(send, 503, {'error': 'Too many orders waiting to be matched, try again'},
+                         [(b'retry-after', b'1')])
+        return
+    except HttpError as error:
+        await _send_json(send, error.status, {'error': error.message}, error.headers)
+        return
+    except TradesUnavailableError as error:
+        await _send_json(send, 410, {'error': str(error), 'first_available_sequence': error.first_available_sequence})
+        return
+
+    await _send_json(send, 200, body)
+
+
+@contextmanager
+def _admission(scope):
+    """
+    Admit a request that changes the exchange for as long as it is in the block, before its body is read
+    :raises HttpError: 429 if it is not admitted
+    """
+    if admission_controller is None:
+        yield
+        return
+
+    retry_after = admission_controller.admit(_get_client(scope))
+
+    if retry_after:
+        raise HttpError(429, 'Too many requests, try again later',
+                        [(b'retry-after', str(math.ceil(retry_after)).encode('ascii'))])
+
+    try:
+        yield
+    finally:
+        admission_controller.release()
+
+
+def _reject_when_out_of_memory():
+    """:raises HttpError: 503 while the memory monitor rejects new orders"""
+    if memory_monitor is not None and memory_monitor.is_rejecting():
+        raise HttpError(503, 'The exchange is low on memory, new orders are rejected', [(b'retry-after', b'1')])
+
+
+def _get_client(scope):
+    """:return: the client id header of the request, otherwise its remote address"""
+    for name, value in scope['headers']:
+        if name == _CLIENT_ID_HEADER:
+            return value
+
+    return scope['client'][0] if scope.get('client') else None
+
+
+async def submit_limit_order(order_json):
+    try:
+        order_type, size, price = parse_order(order_json)
+    except ValueError as error:
+        raise HttpError(400, str(error))
+
+    submit = Exchange.submit_buy if order_type == OrderType.BUY else Exchange.submit_sell
+
+    try:
+        order_id = await asyncio.wrap_future(engine.execute(submit, size, price))
+    except ValueError as error:
+        raise HttpError(400, str(error))
+
+    return {'order_id': order_id}
+
+
+async def submit_limit_orders(orders_json):
+    if not isinstance(orders_json, list):
+        raise HttpError(400, 'Expected a list of orders')
+
+    results = [None] * len(orders_json)
+    orders = []
+    positions = []
+
+    for position, order_json in enumerate(orders_json):
+        try:
+            orders.append(parse_order(order_json))
+        except ValueError as error:
+            results[position] = {'rejected': str(error)}
+            continue
+
+        positions.append(position)
+
+    batch_results = await asyncio.wrap_future(engine.execute(Exchange.submit_batch, orders))
+
+    for position, result in zip(positions, batch_results):
+        results[position] = result
+
+    return {'orders': results}
+
+
+async def get_order(order_id, query):
+    try:
+        after = int(query.get('after', [0])[0])
+        limit = int(query.get('limit', [DEFAULT_MATCHES_LIMIT])[0])
+    except ValueError:
+        raise HttpError(400, 'after and limit must be ints')
+
+    if after < 0 or limit < 0:
+        raise HttpError(400, 'after and limit must not be negative')
+
+    # Orders keep changing as they are matched, so they are summarised on the matching thread
+    summary = await asyncio.wrap_future(
+        engine.read(_get_order_summary, order_id, after, min(limit, MAX_MATCHES_LIMIT)))
+
+    if summary is None:
+        raise HttpError(404, 'Not Found')
+
+    return summary
+
+
+async def cancel_order(order_id):
+    try:
+        summary = await asyncio.wrap_future(engine.execute(_cancel_order, order_id))
+    except KeyError:
+        raise HttpError(404, 'Not Found')
+
+    if summary is None:
+        raise HttpError(409, 'Order has already been fully matched or cancelled')
+
+    return summary
+
+
+async def send_order_book(send, query, headers):
+    version, summary = engine.get_published_order_book()
+
+    # Optionally only return the best N price levels on each side, the levels between min and max, or the levels added
+    # up into buckets of that many ticks
+    try:
+        order_book_query = OrderBookQuery.from_args({name: values[0] for name, values in query.items()})
+    except ValueError as error:
+        raise HttpError(400, str(error))
+
+    etag, body = order_book_cache.get(version, order_book_query, lambda cached_query: cached_query.summarise(summary))
+    etag = '"{0}"'.format(etag).encode('ascii')
+
+    if _etag_matches(headers, etag):
+        await _send_bytes(send, 304, b'', None, [(b'etag', etag)])
+    else:
+        await _send_bytes(send, 200, body, 'application/json', [(b'etag', etag)])
+
+
+def _etag_matches(headers, etag):
+    """
+    :param headers: list of (bytes name, bytes value) request headers
+    :param etag: bytes quoted ETag of the current response
+    :return: bool True if the request has an If-None-Match for the ETag
+    """
+    for name, value in headers:
+        if name == b'if-none-match':
+            for candidate in value.split(b','):
+                candidate = candidate.strip()
+
+                # Weak comparison, the same as a strong one here because every ETag is strong
+                if candidate == b'*' or candidate == etag or candidate == b'W/' + etag:
+                    return True
+
+    return False
+
+
+async def stream_order_book(receive, send):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')],
+    })
+
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+
+    sequence, summary = market_data_feed.get_snapshot()
+    await _send_event(send, 'snapshot', _snapshot_to_json(sequence, summary))
+
+    while not disconnected.done():
+        publish_event = _publish_event
+
+        if market_data_feed.get_sequence() == sequence:
+            published = asyncio.ensure_future(publish_event.wait())
+            await asyncio.wait([published, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            published.cancel()
+            continue
+
+        # Everything published while this subscriber was sending its last event is conflated into one update
+        try:
+            update = market_data_feed.get_update(sequence)
+        except LookupError:
+            sequence, summary = market_data_feed.get_snapshot()
+            await _send_event(send, 'snapshot', _snapshot_to_json(sequence, summary))
+            continue
+
+        if update is not None:
+            sequence = update.sequence
+            await _send_event(send, 'update', {
+                'sequence': update.sequence,
+                'changes': [{'order_type': order_type.value, 'price': price, 'size': size}
+                            for (order_type, price), size in update.changes.items()],
+            })
+
+
+def _snapshot_to_json(sequence, summary):
+    for_json = order_book_to_json(summary)
+    for_json['sequence'] = sequence
+    return for_json
+
+
+async def _send_event(send, event, data):
+    message = 'event: {0}\ndata: {1}\n\n'.format(event, json.dumps(data))
+    await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def _wake_subscribers():
+    global _publish_event
+
+    publish_event = _publish_event
+    _publish_event = asyncio.Event()
+    publish_event.set()
+
+
+async def get_trades(query):
+    try:
+        since = int(query.get('since', [0])[0])
+        limit = int(query.get('limit', [DEFAULT_TRADES_LIMIT])[0])
+    except ValueError:
+        raise HttpError(400, 'since and limit must be ints')
+
+    if since < 0 or limit < 0:
+        raise HttpError(400, 'since and limit must not be negative')
+
+    # The trade tape is only changed by the matching thread, so it is read there
+    return await asyncio.wrap_future(engine.read(_get_trades, since, min(limit, MAX_TRADES_LIMIT)))
+
+
+async def get_memory_report(query):
+    """See rest_api.get_memory_report"""
+    try:
+        top = int(query.get('top', [TOP_ALLOCATORS])[0])
+    except ValueError:
+        raise HttpError(400, 'top must be an int')
+
+    # The structures are measured and the allocations snapshotted on the matching thread, then the allocations are
+    # grouped by line on another thread so matching is not stopped for seconds
+    report, snapshot = await asyncio.wrap_future(engine.read(_create_memory_report, top > 0))
+    await asyncio.get_running_loop().run_in_executor(None, add_top_allocators, report, snapshot, top)
+
+    return report
+
+
+def _create_memory_report(exchange, snapshot_allocations):
+    return create_memory_report(exchange, memory_monitor), \
+        take_allocation_snapshot() if snapshot_allocations else None
+
+
+async def get_metrics():
+    if _exchange.get_metrics() is None:
+        raise HttpError(404, 'Metrics are disabled')
+
+    # The metrics are recorded by the matching thread, so they are read there
+    return await asyncio.wrap_future(engine.read(_get_metrics))
+
+
+def _get_metrics(exchange):
+    return exchange.get_metrics().to_prometheus()
+
+
+def _cancel_order(exchange, order_id):
+    order = exchange.cancel(order_id)
+    return order.get_summary_page(limit=DEFAULT_MATCHES_LIMIT) if order is not None else None
+
+
+def _get_trades(exchange, since, limit):
+    return trades_to_json(exchange.get_trades(since, limit), exchange.get_last_trade_sequence())
+
+
+def _get_order_summary(exchange, order_id, after, limit):
+    order = exchange.find_order(order_id)
+    return order.get_summary_page(after, limit) if order is not None else None
+
+
+async def _lifespan(receive, send):
+    global _publish_event
+
+    while True:
+        message = await receive()
+
+        if message['type'] == 'lifespan.startup':
+            _publish_event = asyncio.Event()
+
+            # The feed publishes on the matching thread, wake the subscribers up on the event loop
+            loop = asyncio.get_event_loop()
+            market_data_feed.add_publish_listener(lambda: loop.call_soon_threadsafe(_wake_subscribers))
+
+            engine.start()
+
+            if order_entry_gateway is not None:
+                await order_entry_gateway.start_server(os.environ.get('EXCHANGE_ORDER_ENTRY_HOST', '0.0.0.0'),
+                                                       int(os.environ['EXCHANGE_ORDER_ENTRY_PORT']))
+
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            engine.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _read_json(receive):
+    body = b''
+
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+
+        if not message.get('more_body'):
+            break
+
+    try:
+        return json.loads(body.decode('utf-8'))
+    except ValueError:
+        raise HttpError(400, 'Body must be JSON')
+
+
+async def _send_json(send, status, body, headers=()):
+    await _send_text(send, status, json.dumps(body), 'application/json', headers)
+
+
+async def _send_text(send, status, text, content_type, headers=()):
+    await _send_bytes(send, status, text.encode('utf-8'), content_type, headers)
+
+
+async def _send_bytes(send, status, body, content_type, headers=()):
+    """:param content_type: str, or None for a response without a body, e.g. 304 Not Modified"""
+    response_headers = list(headers)
+
+    if content_type is not None:
+        response_headers = [(b'content-type', content_type.encode('ascii')),
+                            (b'content-length', str(len(body)).encode('ascii'))] + response_headers
+
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': response_headers,
+    })
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,82 @@
+"""
+Compare the order book backends: the default SortedDict against the ArrayPriceLadder, on the same synthetic order flow
+
+The flow is clustered around a mid of 10000 and the ladder covers mid +/- band_ticks, so a few prices fall outside it.
+
+Run with: python3 -m exchange.benchmarks.book_backend_benchmark [number_of_orders] [band_ticks]
+"""
+import json
+import sys
+import time
+from functools import partial
+
+from sortedcontainers import SortedDict
+
+from exchange.benchmarks.order_flow import OrderFlowGenerator
+from exchange.components.exchange import Exchange
+from exchange.components.order import Order, OrderType
+from exchange.components.price_ladder import ArrayPriceLadder
+from exchange.components.unmatched_order_book import UnmatchedOrderBook
+
+_MID_PRICE = 10000
+
+
+def run(number_of_orders, band_ticks, seed=1):
+    flow = list(OrderFlowGenerator(seed=seed, mid_price=_MID_PRICE, book_depth=50).orders(number_of_orders))
+    backends = {
+        'sorted_dict': SortedDict,
+        'array_price_ladder': partial(ArrayPriceLadder, _MID_PRICE - band_ticks, _MID_PRICE + band_ticks),
+    }
+
+    return {
+        'orders': number_of_orders,
+        'band_ticks': band_ticks,
+        'backends': {name: _run_backend(flow, price_levels_factory) for name, price_levels_factory in backends.items()},
+    }
+
+
+def _run_backend(flow, price_levels_factory):
+    exchange = Exchange(price_levels_factory=price_levels_factory)
+
+    start = time.perf_counter()
+    for order_type, size, price in flow:
+        if order_type == OrderType.BUY:
+            exchange.submit_buy(size=size, price=price)
+        else:
+            exchange.submit_sell(size=size, price=price)
+    submit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        exchange.get_exchange_depth(10)
+    depth_seconds = time.perf_counter() - start
+
+    # Every order rests on the book, then the best order is popped until the book is empty
+    orders = [Order(price=price, size=size, order_type=order_type) for order_type, size, price in flow]
+    order_book = UnmatchedOrderBook(price_levels_factory)
+
+    start = time.perf_counter()
+    for order in orders:
+        if order.order_type == OrderType.BUY:
+            order_book.add_buy_order(order)
+        else:
+            order_book.add_sell_order(order)
+
+    while order_book.peek_best_buy_order() is not None:
+        order_book.pop_best_buy_order()
+
+    while order_book.peek_best_sell_order() is not None:
+        order_book.pop_best_sell_order()
+    add_pop_seconds = time.perf_counter() - start
+
+    return {
+        'submit_orders_per_second': len(flow) / submit_seconds,
+        'depth_10_us': depth_seconds / 1000 * 1e6,
+        'add_peek_pop_per_second': len(orders) / add_pop_seconds,
+    }
+
+
+if __name__ == '__main__':
+    number_of_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    band_ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    print(json.dumps(run(number_of_orders, band_ticks), indent=4))
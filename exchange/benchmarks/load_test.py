@@ -0,0 +1,141 @@
+"""
+Load test a running exchange API (rest_api.py or asgi_api.py) with many concurrent connections
+
+Each connection submits orders with prices around a mid of 150 and polls GET /orderBook, and the test reports the
+throughput and latency percentiles as JSON. Every connection is its own client for the rate limits (X-Client-Id), and
+the latency of the requests that were let through is reported apart from the ones rejected with 429 or 503.
+
+Run with: python3 -m exchange.benchmarks.load_test --url http://127.0.0.1:5000 --connections 50 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlparse
+
+
+class _Connection:
+    """A keep-alive HTTP/1.1 connection that reconnects whenever the server closes it"""
+    def __init__(self, host, port, client_id):
+        self._host = host
+        self._port = port
+        self._client_id = client_id
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, body=None):
+        """:return: int status code"""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+
+        encoded = json.dumps(body).encode('utf-8') if body is not None else b''
+        self._writer.write('{0} {1} HTTP/1.1\r\nHost: {2}\r\nContent-Type: application/json\r\n'
+                           'X-Client-Id: {3}\r\nContent-Length: {4}\r\n\r\n'
+                           .format(method, path, self._host, self._client_id, len(encoded)).encode('ascii') + encoded)
+
+        status_line = await self._reader.readline()
+        status = int(status_line.split()[1])
+
+        content_length = 0
+        keep_alive = status_line.startswith(b'HTTP/1.1')
+
+        while True:
+            header = await self._reader.readline()
+            if header in (b'\r\n', b''):
+                break
+
+            name, _, value = header.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                content_length = int(value)
+            elif name.lower() == 'connection':
+                keep_alive = value.strip().lower() == 'keep-alive'
+
+        await self._reader.readexactly(content_length)
+
+        if not keep_alive:
+            self.close()
+
+        return status
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+async def _client(url, requests, read_ratio, seed, latencies, accepted_latencies, statuses):
+    rng = random.Random(seed)
+    connection = _Connection(url.hostname, url.port or 80, 'load-test-{0}'.format(seed))
+
+    for _ in range(requests):
+        start = time.perf_counter()
+
+        if rng.random() < read_ratio:
+            status = await connection.request('GET', '/orderBook')
+        else:
+            status = await connection.request('POST', '/order', {
+                'price': rng.randint(145, 155),
+                'size': rng.randint(1, 100),
+                'order_type': rng.choice(['BUY', 'SELL']),
+            })
+
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+
+        if status < 400:
+            accepted_latencies.append(latencies[-1])
+
+    connection.close()
+
+
+async def run(url, connections, requests, read_ratio, seed=1):
+    url = urlparse(url)
+    latencies = []
+    accepted_latencies = []
+    statuses = dict()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(url, requests // connections, read_ratio, seed + client, latencies, accepted_latencies, statuses)
+        for client in range(connections)
+    ])
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    accepted_latencies.sort()
+
+    return {
+        'url': url.geturl(),
+        'connections': connections,
+        'requests': len(latencies),
+        'seconds': seconds,
+        'requests_per_second': len(latencies) / seconds,
+        'latency_ms': _percentiles(latencies),
+        'accepted_latency_ms': _percentiles(accepted_latencies),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return None
+
+    return {
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000,
+        'max': latencies[-1] * 1000,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--read-ratio', type=float, default=0.2, help='share of requests that are GET /orderBook')
+    arguments = parser.parse_args()
+
+    result = asyncio.get_event_loop().run_until_complete(
+        run(arguments.url, arguments.connections, arguments.requests, arguments.read_ratio))
+    print(json.dumps(result, indent=4))
@@ -0,0 +1,45 @@
+"""
+Measure how many bytes the Exchange holds per order submitted, and how close Exchange.get_memory_usage estimates it
+
+Run with: python3 -m exchange.benchmarks.memory_benchmark [number_of_orders]
+"""
+import json
+import random
+import sys
+import tracemalloc
+
+from exchange.components.exchange import Exchange
+
+
+def run(number_of_orders, seed=1):
+    # Prices cluster around a mid of 150 so roughly half of the orders trade and half rest on the book
+    rng = random.Random(seed)
+    flow = [(rng.random() < 0.5, rng.randint(1, 100), rng.randint(145, 155)) for _ in range(number_of_orders)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    exchange = Exchange()
+
+    for is_buy, size, price in flow:
+        if is_buy:
+            exchange.submit_buy(size=size, price=price)
+        else:
+            exchange.submit_sell(size=size, price=price)
+
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    estimated_bytes = sum(structure['bytes'] for structure in exchange.get_memory_usage().values())
+
+    return {
+        'orders': number_of_orders,
+        'bytes': after - before,
+        'bytes_per_order': (after - before) / number_of_orders,
+        'peak_bytes': peak - before,
+        'estimated_bytes': estimated_bytes,
+    }
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000), indent=4))
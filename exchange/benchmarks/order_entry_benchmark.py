@@ -0,0 +1,160 @@
+"""
+Round trip latency of an order through the binary order entry gateway against POST /order of the REST API
+
+Each server runs in a process of its own on localhost. One client submits orders one at a time and waits for each
+answer, and the p50 and p99 of the round trip are reported for both. Then the client pipelines the same orders to the
+gateway in batches and the orders per second are reported. The order flow is the same for every run, see
+OrderFlowGenerator.
+
+Run with: python3 -m exchange.benchmarks.order_entry_benchmark [number_of_orders]
+"""
+import http.client
+import json
+import multiprocessing
+import socket
+import sys
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from exchange.benchmarks.order_flow import OrderFlowGenerator
+from exchange.components.exchange import Exchange
+from exchange.components.order import OrderType
+from exchange.order_entry_client import Fill, OrderEntryClient
+from exchange.order_entry_gateway import serve
+
+_HOST = '127.0.0.1'
+_PIPELINE_BATCH_SIZE = 1000
+
+
+class _KeepAliveRequestHandler(WSGIRequestHandler):
+    # Keep the connection open between requests, as the gateway does
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def run(number_of_orders, seed=1):
+    flow = list(OrderFlowGenerator(seed=seed).orders(number_of_orders))
+
+    return {
+        'orders': number_of_orders,
+        'rest_api_round_trip_us': _percentiles(_start(_serve_rest_api, _rest_api_round_trips, flow)),
+        'gateway_round_trip_us': _percentiles(_start(_serve_gateway, _gateway_round_trips, flow)),
+        'gateway_pipelined_orders_per_second': _start(_serve_gateway, _gateway_pipelined, flow),
+    }
+
+
+def _start(serve_function, client_function, flow):
+    """Run client_function(port, flow) against serve_function(port) in a new server process"""
+    with socket.create_server((_HOST, 0)) as free:
+        port = free.getsockname()[1]
+
+    server = multiprocessing.get_context('fork').Process(target=serve_function, args=(port,), daemon=True)
+    server.start()
+
+    try:
+        return client_function(port, flow)
+    finally:
+        server.terminate()
+        server.join()
+
+
+def _serve_rest_api(port):
+    from exchange.rest_api import app
+
+    make_server(_HOST, port, app, request_handler=_KeepAliveRequestHandler).serve_forever()
+
+
+def _serve_gateway(port):
+    serve(Exchange(), _HOST, port)
+
+
+def _rest_api_round_trips(port, flow):
+    connection = _retry(lambda: _connect_http(port))
+    latencies = []
+
+    for order_type, size, price in flow:
+        body = json.dumps({'order_type': order_type.name, 'size': size, 'price': price})
+
+        start = time.perf_counter()
+        connection.request('POST', '/order', body, {'Content-Type': 'application/json'})
+        connection.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+
+    connection.close()
+
+    return latencies
+
+
+def _gateway_round_trips(port, flow):
+    client = _retry(lambda: OrderEntryClient(_HOST, port))
+    latencies = []
+
+    for order_type, size, price in flow:
+        start = time.perf_counter()
+
+        if order_type == OrderType.BUY:
+            client.submit_buy(size, price)
+        else:
+            client.submit_sell(size, price)
+
+        latencies.append(time.perf_counter() - start)
+
+    client.close()
+
+    return latencies
+
+
+def _gateway_pipelined(port, flow):
+    client = _retry(lambda: OrderEntryClient(_HOST, port))
+    start = time.perf_counter()
+
+    for batch_start in range(0, len(flow), _PIPELINE_BATCH_SIZE):
+        client_order_ids = client.send_new_orders(flow[batch_start:batch_start + _PIPELINE_BATCH_SIZE])
+        last_client_order_id = client_order_ids[-1]
+
+        # Fills are read along the way, the batch is done once its last order is answered
+        while True:
+            message = client.read_message()
+
+            if message.client_order_id == last_client_order_id and not isinstance(message, Fill):
+                break
+
+    seconds = time.perf_counter() - start
+    client.close()
+
+    return len(flow) / seconds
+
+
+def _connect_http(port):
+    connection = http.client.HTTPConnection(_HOST, port)
+    connection.connect()
+    connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    return connection
+
+
+def _retry(connect):
+    """Connect once the server process is listening"""
+    for _ in range(100):
+        try:
+            return connect()
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+
+    return connect()
+
+
+def _percentiles(latencies):
+    ordered = sorted(latencies)
+
+    return {
+        'p50': ordered[len(ordered) // 2] * 1e6,
+        'p99': ordered[int(len(ordered) * 0.99)] * 1e6,
+    }
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000), indent=4))
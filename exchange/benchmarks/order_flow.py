@@ -0,0 +1,67 @@
+"""
+Seeded synthetic order flow for the benchmarks
+
+Prices cluster around a mid price like test_realistic_buy_sell. Passive orders rest up to book_depth ticks away from the
+mid on their own side of the book, aggressive orders cross the mid by up to book_depth ticks and trade against the book.
+The mid takes a small random walk so that the book keeps moving.
+"""
+import math
+import random
+
+from exchange.components.order import OrderType
+
+
+class OrderFlowGenerator:
+    def __init__(self, seed=1, mid_price=10000, book_depth=20, aggressiveness=0.3, size_distribution='lognormal',
+                 mean_size=50, mid_drift_ticks=1):
+        """
+        :param seed: int, the same seed always generates the same flow
+        :param mid_price: int price in pence the flow starts around
+        :param book_depth: int number of price levels either side of the mid that orders are placed at
+        :param aggressiveness: float share of orders that cross the mid
+        :param size_distribution: 'lognormal' (many small and a few large orders), 'uniform' or 'fixed'
+        :param mean_size: int average order size
+        :param mid_drift_ticks: int max ticks the mid moves after each order
+        """
+        if size_distribution not in ('lognormal', 'uniform', 'fixed'):
+            raise ValueError('Unknown size distribution {0}'.format(size_distribution))
+
+        self._rng = random.Random(seed)
+        self._mid_price = mid_price
+        self._book_depth = book_depth
+        self._aggressiveness = aggressiveness
+        self._size_distribution = size_distribution
+        self._mean_size = mean_size
+        self._mid_drift_ticks = mid_drift_ticks
+
+    def orders(self, number_of_orders):
+        """
+        :return: generator of (OrderType, size, price)
+        """
+        for _ in range(number_of_orders):
+            yield self.next_order()
+
+    def next_order(self):
+        order_type = OrderType.BUY if self._rng.random() < 0.5 else OrderType.SELL
+        distance = self._rng.randint(1, self._book_depth)
+
+        # Aggressive buys are priced above the mid and aggressive sells below it, passive orders the other way round
+        if self._rng.random() < self._aggressiveness:
+            distance = -distance
+
+        price = self._mid_price - distance if order_type == OrderType.BUY else self._mid_price + distance
+
+        self._mid_price = max(self._mid_price + self._rng.randint(-self._mid_drift_ticks, self._mid_drift_ticks),
+                              self._book_depth + 1)
+
+        return order_type, self.__next_size(), max(price, 1)
+
+    def __next_size(self):
+        if self._size_distribution == 'fixed':
+            return self._mean_size
+
+        if self._size_distribution == 'uniform':
+            return self._rng.randint(1, 2 * self._mean_size - 1)
+
+        # A lognormal with a sigma of 1 has a mean of exp(mu + 0.5)
+        return max(int(self._rng.lognormvariate(math.log(self._mean_size) - 0.5, 1.0)), 1)
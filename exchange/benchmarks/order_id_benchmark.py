@@ -0,0 +1,97 @@
+"""
+Compare order ids: a uuid4 hex string per order, as orders used to be identified, against the order numbers the
+Exchange gives out now and their keyed external encoding (see order_id)
+
+Reports the cost of creating an id, the bytes a dict of orders keyed by each kind of id holds per order, the cost of
+looking an order up by its id, and the submit throughput of the Exchange.
+
+Run with: python3 -m exchange.benchmarks.order_id_benchmark [number_of_orders]
+"""
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from itertools import count
+
+from exchange.benchmarks.order_flow import OrderFlowGenerator
+from exchange.components.exchange import Exchange
+from exchange.components.order import OrderType
+from exchange.components.order_id import decode_order_id, encode_order_id
+
+
+def run(number_of_orders, seed=1):
+    numbers = count(1)
+    results = {
+        'orders': number_of_orders,
+        'create_id_us': {
+            'uuid4_hex': _time_per_call(lambda: uuid.uuid4().hex, number_of_orders),
+            'order_number': _time_per_call(lambda: next(numbers), number_of_orders),
+            'encode_external_id': _time_per_call(lambda: encode_order_id(next(numbers)), number_of_orders),
+        },
+        'dict_bytes_per_order': {},
+        'lookup_us': {},
+    }
+
+    results['dict_bytes_per_order']['uuid4_hex'] = \
+        _dict_bytes(lambda: (uuid.uuid4().hex for _ in range(number_of_orders))) / number_of_orders
+    results['dict_bytes_per_order']['order_number'] = \
+        _dict_bytes(lambda: range(1, number_of_orders + 1)) / number_of_orders
+
+    uuid_ids = [uuid.uuid4().hex for _ in range(number_of_orders)]
+    order_numbers = list(range(1, number_of_orders + 1))
+
+    for name, ids in (('uuid4_hex', uuid_ids), ('order_number', order_numbers)):
+        orders = dict.fromkeys(ids)
+        start = time.perf_counter()
+        for order_id in ids:
+            orders.get(order_id)
+        results['lookup_us'][name] = (time.perf_counter() - start) / number_of_orders * 1e6
+
+    # Looking an order up from the REST API decodes the external id first
+    external_ids = [encode_order_id(number) for number in order_numbers]
+    orders = dict.fromkeys(order_numbers)
+    start = time.perf_counter()
+    for order_id in external_ids:
+        orders.get(decode_order_id(order_id))
+    results['lookup_us']['decode_external_id'] = (time.perf_counter() - start) / number_of_orders * 1e6
+
+    exchange = Exchange()
+    flow = list(OrderFlowGenerator(seed=seed).orders(number_of_orders))
+    start = time.perf_counter()
+    for order_type, size, price in flow:
+        if order_type == OrderType.BUY:
+            exchange.submit_buy(size=size, price=price)
+        else:
+            exchange.submit_sell(size=size, price=price)
+    results['submit_orders_per_second'] = number_of_orders / (time.perf_counter() - start)
+
+    return results
+
+
+def _time_per_call(function, number_of_calls):
+    start = time.perf_counter()
+    for _ in range(number_of_calls):
+        function()
+    return (time.perf_counter() - start) / number_of_calls * 1e6
+
+
+def _dict_bytes(create_ids):
+    """
+    :param create_ids: function returning an iterable that creates a new id for every order
+    :return: int bytes held by a dict keyed by the ids, including the ids themselves
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    orders = dict.fromkeys(create_ids())
+
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    del orders
+    return held
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000), indent=4))
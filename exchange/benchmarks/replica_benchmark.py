@@ -0,0 +1,136 @@
+"""
+Cost and throughput of the shared memory read replicas, see order_book_replica
+
+Reports the submit throughput of the Exchange without a replica, publishing after every order (as rest_api.py does per
+request) and publishing after every batch of orders (as the MatchingEngine does), then the reads per second of the order
+book and of orders made by reader processes while a writer process keeps submitting and publishing orders.
+
+Run with: python3 -m exchange.benchmarks.replica_benchmark [number_of_orders] [readers]
+"""
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from exchange.benchmarks.order_flow import OrderFlowGenerator
+from exchange.components.exchange import Exchange
+from exchange.components.order import OrderType
+from exchange.components.order_book_replica import OrderBookReplica, OrderBookReplicaPublisher
+
+_BATCH_SIZE = 256
+_READ_SECONDS = 2
+_DEPTH = 10
+
+
+def run(number_of_orders, readers, seed=1):
+    flow = list(OrderFlowGenerator(seed=seed).orders(number_of_orders))
+    name = 'exchange-replica-benchmark-{0}'.format(os.getpid())
+
+    results = {
+        'orders': number_of_orders,
+        'submit_orders_per_second': {
+            'without_replica': _submit(flow, None, name),
+            'publish_every_order': _submit(flow, 1, name),
+            'publish_every_{0}_orders'.format(_BATCH_SIZE): _submit(flow, _BATCH_SIZE, name),
+        },
+        'readers': readers,
+    }
+
+    results.update(_read_while_writing(flow, readers, name))
+
+    return results
+
+
+def _submit(flow, publish_every, name):
+    exchange = Exchange()
+    publisher = OrderBookReplicaPublisher(exchange, name) if publish_every else None
+
+    start = time.perf_counter()
+    for position, (order_type, size, price) in enumerate(flow):
+        _submit_order(exchange, order_type, size, price)
+
+        if publisher is not None and position % publish_every == 0:
+            publisher.publish()
+    seconds = time.perf_counter() - start
+
+    if publisher is not None:
+        publisher.close()
+
+    return len(flow) / seconds
+
+
+def _read_while_writing(flow, readers, name):
+    exchange = Exchange()
+    order_numbers = []
+
+    # Half of the flow is on the book before the readers start, the writer keeps submitting the other half
+    for order_type, size, price in flow[:len(flow) // 2]:
+        _submit_order(exchange, order_type, size, price)
+
+    publisher = OrderBookReplicaPublisher(exchange, name)
+    order_numbers.extend(range(max(exchange._next_order_number - 1000, 1), exchange._next_order_number))
+
+    context = multiprocessing.get_context('fork')
+    stop = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=_read, args=(name, order_numbers, stop, results)) for _ in range(readers)]
+
+    for process in processes:
+        process.start()
+
+    start = time.perf_counter()
+    published = 0
+    position = len(flow) // 2
+
+    while time.perf_counter() - start < _READ_SECONDS:
+        order_type, size, price = flow[position % len(flow)]
+        _submit_order(exchange, order_type, size, price)
+        published += publisher.publish()
+        position += 1
+
+    stop.set()
+    reads = [results.get() for _ in processes]
+
+    for process in processes:
+        process.join()
+
+    publisher.close()
+    seconds = time.perf_counter() - start
+
+    return {
+        'publishes_per_second': published / seconds,
+        'order_book_reads_per_second': sum(read[0] for read in reads) / seconds,
+        'order_reads_per_second': sum(read[1] for read in reads) / seconds,
+        'failed_reads': sum(read[2] for read in reads),
+    }
+
+
+def _read(name, order_numbers, stop, results):
+    replica = OrderBookReplica(name)
+    order_book_reads = order_reads = failed_reads = 0
+
+    while not stop.is_set():
+        for _ in range(100):
+            if replica.read_order_book(_DEPTH) is None:
+                failed_reads += 1
+
+            replica.read_order_page(order_numbers[order_reads % len(order_numbers)], 0, 100)
+
+            order_book_reads += 1
+            order_reads += 1
+
+    replica.close()
+    results.put((order_book_reads, order_reads, failed_reads))
+
+
+def _submit_order(exchange, order_type, size, price):
+    if order_type == OrderType.BUY:
+        exchange.submit_buy(size=size, price=price)
+    else:
+        exchange.submit_sell(size=size, price=price)
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+                         int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()), indent=4))
@@ -0,0 +1,55 @@
+"""
+Measure how long it takes to write a snapshot and to restore an exchange from it, against the size of the order book
+
+Run with: python3 -m exchange.benchmarks.snapshot_benchmark [number_of_resting_orders ...]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from exchange.components.exchange import Exchange
+
+
+def run(number_of_orders, seed=1):
+    # Buy below and sell above a mid of 10000 so that every order rests on the book
+    rng = random.Random(seed)
+    exchange = Exchange()
+
+    for _ in range(number_of_orders):
+        if rng.random() < 0.5:
+            exchange.submit_buy(size=rng.randint(1, 100), price=rng.randint(9000, 9999))
+        else:
+            exchange.submit_sell(size=rng.randint(1, 100), price=rng.randint(10001, 11000))
+
+    snapshot_path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+
+    start = time.perf_counter()
+    exchange.write_snapshot(snapshot_path)
+    write_seconds = time.perf_counter() - start
+
+    # Ready to serve means the order book can be summarised and the best orders can be matched against
+    start = time.perf_counter()
+    restored_exchange = Exchange.from_snapshot(snapshot_path)
+    restored_exchange.get_exchange_summary()
+    restored_exchange.submit_buy(size=1, price=10001)
+    restored_exchange.submit_sell(size=1, price=9999)
+    restore_seconds = time.perf_counter() - start
+
+    result = {
+        'resting_orders': number_of_orders,
+        'snapshot_bytes': os.path.getsize(snapshot_path),
+        'write_seconds': write_seconds,
+        'restore_seconds': restore_seconds,
+    }
+
+    os.remove(snapshot_path)
+
+    return result
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(json.dumps([run(size) for size in sizes], indent=4))
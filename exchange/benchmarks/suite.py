@@ -0,0 +1,257 @@
+"""
+Matching engine benchmark suite
+
+Drives the Exchange, the UnmatchedOrderBook, get_summary and the Flask endpoints with seeded synthetic order flow (see
+OrderFlowGenerator) and reports throughput, latency percentiles and peak memory of each as JSON. Compare against the
+JSON of a previous release to catch regressions:
+
+    python3 -m exchange.benchmarks.suite --orders 100000 > baseline.json
+    python3 -m exchange.benchmarks.suite --orders 100000 --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from exchange.benchmarks.order_flow import OrderFlowGenerator
+from exchange.components.exchange import Exchange
+from exchange.components.order import Order, OrderType
+from exchange.components.unmatched_order_book import UnmatchedOrderBook
+from exchange.serialization import OrderBookJsonCache
+
+
+def bench_exchange_submit(flow):
+    """Submit every order of the flow to an Exchange"""
+    exchange = Exchange()
+    latencies = []
+
+    for order_type, size, price in flow:
+        start = time.perf_counter()
+
+        if order_type == OrderType.BUY:
+            exchange.submit_buy(size=size, price=price)
+        else:
+            exchange.submit_sell(size=size, price=price)
+
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def bench_order_book(flow):
+    """Add every order of the flow to an UnmatchedOrderBook, with no matching, then peek and pop every order"""
+    order_book = UnmatchedOrderBook()
+    orders = [Order(price=price, size=size, order_type=order_type) for order_type, size, price in flow]
+    latencies = []
+
+    for order in orders:
+        start = time.perf_counter()
+
+        if order.order_type == OrderType.BUY:
+            order_book.add_buy_order(order)
+        else:
+            order_book.add_sell_order(order)
+
+        latencies.append(time.perf_counter() - start)
+
+    for order in orders:
+        start = time.perf_counter()
+
+        if order.order_type == OrderType.BUY:
+            order_book.peek_best_buy_order()
+            order_book.pop_best_buy_order()
+        else:
+            order_book.peek_best_sell_order()
+            order_book.pop_best_sell_order()
+
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def bench_get_summary(flow, repeats=1000):
+    """Summarise the book left by the flow"""
+    exchange = Exchange()
+    exchange.submit_batch(flow)
+
+    latencies = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        exchange.get_exchange_summary()
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def bench_rest_api(flow, order_book_every=10):
+    """POST every order of the flow to /order through the Flask test client, with a GET /orderBook every so often"""
+    from exchange import rest_api
+
+    client = _create_rest_api_client(Exchange())
+    latencies = []
+
+    for position, (order_type, size, price) in enumerate(flow):
+        start = time.perf_counter()
+        client.post('/order', json={'price': price, 'size': size, 'order_type': order_type.value})
+
+        if position % order_book_every == 0:
+            client.get('/orderBook')
+
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def bench_rest_api_order_book_polling(flow, change_every=100):
+    """
+    GET /orderBook through the Flask test client once per order of the flow, sending back the last ETag like a poller,
+    with the order book changing every so many polls. The flow is first submitted to build the book.
+    """
+    exchange = Exchange()
+    exchange.submit_batch(flow)
+
+    client = _create_rest_api_client(exchange)
+    etag = None
+    latencies = []
+
+    for position, (order_type, size, price) in enumerate(flow):
+        if position % change_every == 0:
+            exchange.submit_batch([(order_type, size, price)])
+
+        start = time.perf_counter()
+        response = client.get('/orderBook', headers={'If-None-Match': etag} if etag else {})
+        latencies.append(time.perf_counter() - start)
+
+        etag = response.headers['ETag']
+
+    return latencies
+
+
+def _create_rest_api_client(exchange):
+    from exchange import rest_api
+
+    rest_api.exchange = exchange
+    rest_api.order_book_cache = OrderBookJsonCache(rest_api.encode_json)
+
+    return rest_api.app.test_client()
+
+
+BENCHMARKS = {
+    'exchange_submit': bench_exchange_submit,
+    'order_book': bench_order_book,
+    'get_summary': bench_get_summary,
+    'rest_api': bench_rest_api,
+    'rest_api_order_book_polling': bench_rest_api_order_book_polling,
+}
+
+
+def run(names, number_of_orders, seed, aggressiveness, size_distribution, book_depth):
+    results = dict()
+
+    for name in names:
+        flow = list(OrderFlowGenerator(seed=seed, aggressiveness=aggressiveness, size_distribution=size_distribution,
+                                       book_depth=book_depth).orders(number_of_orders))
+
+        # Latency is measured without tracemalloc, which slows everything down, then the benchmark is run again for
+        # the peak memory
+        latencies = BENCHMARKS[name](flow)
+
+        tracemalloc.start()
+        BENCHMARKS[name](flow)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[name] = summarise_latencies(latencies)
+        results[name]['peak_memory_bytes'] = peak_bytes
+
+    return {
+        'python': platform.python_version(),
+        'settings': {
+            'orders': number_of_orders,
+            'seed': seed,
+            'aggressiveness': aggressiveness,
+            'size_distribution': size_distribution,
+            'book_depth': book_depth,
+        },
+        'benchmarks': results,
+    }
+
+
+def summarise_latencies(latencies):
+    total_seconds = sum(latencies)
+    latencies = sorted(latencies)
+
+    return {
+        'operations': len(latencies),
+        'operations_per_second': len(latencies) / total_seconds if total_seconds else None,
+        'latency_us': {
+            'p50': _percentile(latencies, 0.5) * 1e6,
+            'p90': _percentile(latencies, 0.9) * 1e6,
+            'p99': _percentile(latencies, 0.99) * 1e6,
+            'p999': _percentile(latencies, 0.999) * 1e6,
+            'max': latencies[-1] * 1e6,
+        },
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: list of str describing every benchmark that is slower than the baseline by more than the tolerance
+    """
+    regressions = []
+
+    for name, result in results['benchmarks'].items():
+        baseline_result = baseline['benchmarks'].get(name)
+        if baseline_result is None:
+            continue
+
+        if result['operations_per_second'] < baseline_result['operations_per_second'] * (1 - tolerance):
+            regressions.append('{0}: {1:.0f} operations/s, baseline {2:.0f}'.format(
+                name, result['operations_per_second'], baseline_result['operations_per_second']))
+
+        if result['latency_us']['p99'] > baseline_result['latency_us']['p99'] * (1 + tolerance):
+            regressions.append('{0}: p99 {1:.1f}us, baseline {2:.1f}us'.format(
+                name, result['latency_us']['p99'], baseline_result['latency_us']['p99']))
+
+    return regressions
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--aggressiveness', type=float, default=0.3, help='share of orders that cross the mid')
+    parser.add_argument('--size-distribution', default='lognormal', choices=['lognormal', 'uniform', 'fixed'])
+    parser.add_argument('--book-depth', type=int, default=20, help='price levels either side of the mid')
+    parser.add_argument('--benchmark', action='append', choices=sorted(BENCHMARKS),
+                        help='benchmark to run, can be repeated (default: all)')
+    parser.add_argument('--compare', help='JSON output of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slow down before failing --compare')
+    arguments = parser.parse_args(arguments)
+
+    results = run(arguments.benchmark or sorted(BENCHMARKS), arguments.orders, arguments.seed,
+                  arguments.aggressiveness, arguments.size_distribution, arguments.book_depth)
+    print(json.dumps(results, indent=4))
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), arguments.tolerance)
+
+        for regression in regressions:
+            print('REGRESSION {0}'.format(regression), file=sys.stderr)
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
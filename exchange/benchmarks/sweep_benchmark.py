@@ -0,0 +1,54 @@
+"""
+Cost of a large aggressive order sweeping price levels
+
+For every number of levels K and orders per level M, a book with K sell levels of M resting orders each is built, and
+one buy order crossing all of them is timed. Reports the time of the whole sweep and per resting order filled.
+
+Run with: python3 -m exchange.benchmarks.sweep_benchmark [repeats]
+"""
+import json
+import sys
+import time
+
+from exchange.components.exchange import Exchange
+
+LEVELS = (1, 10, 100)
+ORDERS_PER_LEVEL = (1, 10, 100, 1000)
+
+_SIZE = 10
+_FIRST_PRICE = 10000
+
+
+def run(repeats, levels=LEVELS, orders_per_level=ORDERS_PER_LEVEL):
+    results = {'repeats': repeats, 'sweeps': []}
+
+    for number_of_levels in levels:
+        for number_of_orders in orders_per_level:
+            seconds = min(_time_sweep(number_of_levels, number_of_orders) for _ in range(repeats))
+            results['sweeps'].append({
+                'levels': number_of_levels,
+                'orders_per_level': number_of_orders,
+                'sweep_us': seconds * 1e6,
+                'us_per_fill': seconds * 1e6 / (number_of_levels * number_of_orders),
+            })
+
+    return results
+
+
+def _time_sweep(number_of_levels, number_of_orders):
+    exchange = Exchange()
+
+    for level in range(number_of_levels):
+        for _ in range(number_of_orders):
+            exchange.submit_sell(size=_SIZE, price=_FIRST_PRICE + level)
+
+    # Takes every level and rests the last unit, so the sweep never stops inside a level
+    size = number_of_levels * number_of_orders * _SIZE + 1
+
+    start = time.perf_counter()
+    exchange.submit_buy(size=size, price=_FIRST_PRICE + number_of_levels)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(int(sys.argv[1]) if len(sys.argv) > 1 else 5), indent=4))
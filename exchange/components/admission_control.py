@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+
+from exchange.components.metrics import Counter
+
+# Header the APIs take the client id of a request from, e.g. set by a proxy in front of them. Requests without it are
+# limited by their remote address.
+CLIENT_ID_HEADER = 'X-Client-Id'
+
+# Client buckets kept at once. The least recently seen client is forgotten first and starts again with a full bucket.
+MAX_CLIENTS = 100000
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'refilled_at')
+
+    def __init__(self, tokens, refilled_at):
+        self.tokens = tokens
+        self.refilled_at = refilled_at
+
+
+class AdmissionController:
+    """
+    Decides whether a request that changes the exchange is let through to the matcher, before anything is built for it.
+
+    Every client has a token bucket that is refilled at rate tokens per second up to burst tokens. A request is admitted
+    while the bucket of its client has a whole token and takes one token per order, so a batch of orders can take the
+    bucket below 0 and the client then waits until it has paid the debt off. On top of that at most max_in_flight
+    admitted requests can be waiting for or in the matcher at once, across every client.
+
+    Not thread safe, only use from the thread that serves the requests.
+    """
+    def __init__(self, rate=None, burst=None, max_in_flight=None, metrics=None, max_clients=MAX_CLIENTS,
+                 clock=time.monotonic):
+        """
+        :param rate: float tokens per second given to each client, None for no rate limit
+        :param burst: float most tokens a client can save up, defaults to rate
+        :param max_in_flight: int most requests admitted and not yet released, None for no limit
+        :param metrics: Metrics to count admitted and rejected requests in
+        :param clock: function returning seconds
+        """
+        burst = burst if burst is not None else rate
+
+        if rate is not None and (rate <= 0 or burst < 1):
+            raise ValueError('rate must be greater than 0 and burst at least 1')
+
+        self._rate = rate
+        self._burst = burst
+        self._max_in_flight = max_in_flight
+        self._max_clients = max_clients
+        self._clock = clock
+
+        # client to _Bucket, least recently seen first
+        self._buckets = OrderedDict()
+        self._in_flight = 0
+
+        counter = metrics.counter if metrics is not None else Counter
+        self._admitted = counter('exchange_admitted_requests_total', 'Requests let through to the matcher')
+        self._rate_limited = counter('exchange_rate_limited_requests_total',
+                                     'Requests rejected because their client was over its rate limit')
+        self._overloaded = counter('exchange_overloaded_requests_total',
+                                   'Requests rejected because too many requests were in flight')
+
+        if metrics is not None:
+            metrics.gauge('exchange_in_flight_requests', 'Admitted requests not yet answered', self.get_in_flight)
+
+    def admit(self, client, cost=1):
+        """
+        Admit a request of client, call release once it has been answered
+        :param client: hashable id of the client, e.g. its address
+        :param cost: int orders in the request
+        :return: float 0 if the request is admitted, otherwise the seconds to wait before trying again
+        """
+        if self._max_in_flight is not None and self._in_flight >= self._max_in_flight:
+            self._overloaded.increment()
+            return 1.0
+
+        if self._rate is not None:
+            now = self._clock()
+            bucket = self._buckets.get(client)
+
+            if bucket is None:
+                bucket = self._buckets[client] = _Bucket(self._burst, now)
+
+                if len(self._buckets) > self._max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(bucket.tokens + (now - bucket.refilled_at) * self._rate, self._burst)
+                bucket.refilled_at = now
+
+            if bucket.tokens < 1:
+                self._rate_limited.increment()
+                return (1 - bucket.tokens) / self._rate
+
+            bucket.tokens -= cost
+
+        self._in_flight += 1
+        self._admitted.increment()
+
+        return 0
+
+    def charge(self, client, cost):
+        """
+        Take more tokens from the bucket of an admitted client, e.g. for the rest of a batch once its body has been read,
+        so that the body of a request over the limit is never read
+        :param client: hashable id of the client, as given to admit
+        :param cost: int orders to take
+        """
+        bucket = self._buckets.get(client) if self._rate is not None else None
+
+        if bucket is not None:
+            bucket.tokens -= cost
+
+    def release(self):
+        """The answer of an admitted request has been sent"""
+        self._in_flight -= 1
+
+    def get_in_flight(self):
+        return self._in_flight
+
+    def get_counts(self):
+        """:return: (int admitted, int rate limited, int overloaded) requests so far"""
+        return self._admitted.value, self._rate_limited.value, self._overloaded.value
@@ -5,146 +5,539 @@ Orders are matched at the price on the exchange.
    - If we have a sell order at 200 and a buy order comes in at 1000 we will sell at 200
    - If we have a buy order at 200 and a sell order comes in at 50 we will sell at 200
 """
+from itertools import islice
+
+from sortedcontainers import SortedDict
+
 from exchange.components.match import Match
+from exchange.components.memory_report import SAMPLE_SIZE
 from exchange.components.order import Order, OrderType
+from exchange.components.order_id import MAX_ORDER_NUMBER, decode_order_id
+from exchange.components.order_store import OrderStore
+from exchange.components.snapshot import Snapshot
+from exchange.components.trade_tape import TradeTape
 from exchange.components.unmatched_order_book import UnmatchedOrderBook
 
 
 class Exchange:
-    def __init__(self):
-        self._unmatched_order_book = UnmatchedOrderBook()
+    def __init__(self, order_store=None, journal=None, snapshot_path=None, snapshot_every_orders=None,
+                 trade_tape=None, metrics=None, price_levels_factory=SortedDict):
+        """
+        :param order_store: OrderStore deciding how long executed orders are kept in memory, keeps everything by default
+        :param journal: Journal that every accepted order is recorded in before it is executed, optional
+        :param snapshot_path: where to write a Snapshot every snapshot_every_orders accepted orders, optional
+        :param snapshot_every_orders: int. The snapshot is written by the order that reaches the count, before it
+                                      returns, so matching stops while it is written, several seconds for a million
+                                      orders. Leave it unset and call write_snapshot at a quiet time to avoid that.
+        :param trade_tape: TradeTape that every match is appended to, keeps the last 100000 matches by default
+        :param metrics: Metrics to record the latency of each stage of an order and counts of orders and matches in,
+                        optional. Without it nothing is measured and nothing is slowed down.
+        :param price_levels_factory: backend for the price levels of each side of the order book, a SortedDict by
+                                     default, see UnmatchedOrderBook and ArrayPriceLadder
+        """
+        self._unmatched_order_book = UnmatchedOrderBook(price_levels_factory)
 
         # Need to store pointers to all orders, including those in the order book and those that have been executed
-        self._all_orders = dict()
+        self._all_orders = order_store if order_store is not None else OrderStore()
+
+        self._journal = journal
+
+        self._snapshot_path = snapshot_path
+        self._snapshot_every_orders = snapshot_every_orders
+
+        # Orders are numbered internally, the ids given out are the keyed encoding of the numbers, see order_id
+        self._next_order_number = 1
+
+        # Number of orders and cancels accepted, which is also the number of journal records that are part of this state
+        self._accepted_orders = 0
+
+        # Offset of the end of the journal records that are part of this state when restored from a snapshot, see
+        # Journal.get_offset, None to count them from the start of the journal instead
+        self._journal_offset = None
+
+        self._trade_tape = trade_tape if trade_tape is not None else TradeTape()
+
+        # Validates and creates every new Order, replaced with a timed version when there are metrics
+        self._create_order = Order
+
+        # Told about every order that is accepted, matched or cancelled, see set_order_listener
+        self._order_listener = None
+
+        self._metrics = metrics
+
+        if metrics is not None:
+            self.__instrument()
+
+    @classmethod
+    def from_snapshot(cls, path, order_store=None, journal=None, snapshot_path=None, snapshot_every_orders=None,
+                      trade_tape=None, metrics=None, price_levels_factory=SortedDict):
+        """
+        Restore an exchange from a Snapshot. The snapshot is memory mapped and read lazily, so this only has to read the
+        price levels. Call recover_from_journal afterwards to replay the orders accepted since the snapshot was written.
+        :param path: snapshot to restore from
+        :return: Exchange
+        """
+        exchange = cls(order_store, journal, snapshot_path, snapshot_every_orders, trade_tape, metrics,
+                       price_levels_factory)
+        snapshot = Snapshot(path)
 
-    def submit_buy(self, size, price):
-        buy_order = Order(
+        exchange._all_orders.set_snapshot(snapshot)
+        exchange._unmatched_order_book = snapshot.load_order_book(exchange._all_orders.find, price_levels_factory)
+
+        if metrics is not None:
+            exchange.__instrument_order_book()
+
+        exchange._accepted_orders = snapshot.accepted_orders
+        exchange._journal_offset = snapshot.journal_offset or None
+        exchange._next_order_number = snapshot.next_order_number
+        exchange._trade_tape.set_next_sequence(snapshot.next_trade_sequence)
+
+        return exchange
+
+    def submit_buy(self, size, price, order_number=None):
+        """
+        :param order_number: int number to give the order instead of the next one, e.g. when replaying captured orders
+        :return: str order id
+        """
+        buy_order = self._create_order(
             price=price,
             size=size,
-            order_type=OrderType.BUY
+            order_type=OrderType.BUY,
+            order_id=self.__number_order(order_number)
         )
 
-        # Store the buy order forever in the data store
-        self._all_orders[buy_order.id] = buy_order
+        self._accept_orders([buy_order])
 
-        self._execute_and_or_store_buy_order(buy_order)
+        return buy_order.get_external_id()
 
-        return buy_order.id
-
-    def submit_sell(self, size, price):
-        sell_order = Order(
+    def submit_sell(self, size, price, order_number=None):
+        """
+        :param order_number: int number to give the order instead of the next one, e.g. when replaying captured orders
+        :return: str order id
+        """
+        sell_order = self._create_order(
             price=price,
             size=size,
-            order_type=OrderType.SELL
+            order_type=OrderType.SELL,
+            order_id=self.__number_order(order_number)
         )
 
-        self._all_orders[sell_order.id] = sell_order
+        self._accept_orders([sell_order])
+
+        return sell_order.get_external_id()
+
+    def submit_batch(self, orders):
+        """
+        Submit many orders at once. The orders are matched in the order they are given, exactly as if they had been
+        submitted one at a time, but they are journaled with a single write.
+        :param orders: iterable of (OrderType, size, price)
+        :return: list with a dict for each order, either {'order_id': id} or {'rejected': reason}
+        """
+        results = []
+        accepted_orders = []
+
+        for order_type, size, price in orders:
+            try:
+                order = self._create_order(
+                    price=price,
+                    size=size,
+                    order_type=order_type,
+                    order_id=self.__number_order()
+                )
+            except ValueError as error:
+                results.append({'rejected': str(error)})
+                continue
+
+            accepted_orders.append(order)
+            results.append({'order_id': order.get_external_id()})
+
+        self._accept_orders(accepted_orders)
+
+        return results
+
+    def cancel(self, order_id):
+        """
+        Cancel the unmatched size of an order and take it off the order book. This is O(1), the order is not searched
+        for in its price level, see PriceLevel.cancel
+        :param order_id: str
+        :return: the cancelled Order, or None if it has already been fully matched or cancelled
+        :raises KeyError: if there is no such order
+        """
+        order = self.get_order(order_id)
+
+        if not order.is_open():
+            return None
+
+        # Record the cancel before it is made so that it survives a restart
+        if self._journal is not None:
+            self._journal.append_cancel(order.id)
+
+        self._cancel_order(order)
+        self.__count_accepted(1)
+
+        return order
+
+    def write_snapshot(self, path=None):
+        """
+        Write a Snapshot of the order book and every order that is not in the OrderStore archive. It is written on the
+        calling thread and nothing can be matched until it has been written.
+        :param path: defaults to the snapshot_path the exchange was created with
+        """
+        path = path if path is not None else self._snapshot_path
+
+        # Orders waiting to be archived are not in the snapshot, make sure they are in the archive
+        self._all_orders.flush()
+
+        Snapshot.write(path, self._unmatched_order_book, self._all_orders.iter_orders(), self._accepted_orders,
+                       self._trade_tape.get_last_sequence() + 1, self._next_order_number,
+                       self._journal.get_offset() if self._journal is not None else 0)
+
+    def recover_from_journal(self):
+        """
+        Replay every order recorded in the journal into this exchange, skipping any orders that are already part of the
+        snapshot the exchange was restored from. The journal is read from where it ended when the snapshot was written,
+        so only the orders after it are read. Matching is deterministic so this rebuilds the order book and orders as
+        they were when the journal was written.
+        :return: int number of orders replayed
+        """
+        replayed = 0
+
+        if self._journal_offset is not None:
+            entries = self._journal.entries(self._journal_offset)
+        else:
+            # A snapshot written without a journal offset, skip the orders that are part of it
+            entries = islice(self._journal.entries(), self._accepted_orders, None)
+
+        for entry in entries:
+            if entry.cancel:
+                self._cancel_order(self._all_orders.find(entry.order_id))
+                self._accepted_orders += 1
+                replayed += 1
+                continue
+
+            order = Order(
+                price=entry.price,
+                size=entry.size,
+                order_type=entry.order_type,
+                order_id=self.__number_order(entry.order_id)
+            )
+
+            # The order is already in the journal
+            self._execute_order(order)
+            self._accepted_orders += 1
+            replayed += 1
+
+        return replayed
+
+    def _accept_orders(self, orders):
+        # Record the orders before they are executed or acknowledged so that they survive a restart
+        if self._journal is not None:
+            self._journal.append_batch(orders)
+
+        for order in orders:
+            self._execute_order(order)
+
+        self.__count_accepted(len(orders))
+
+    def __number_order(self, order_number=None):
+        """:return: int the next order number, or order_number after making sure it is never given out again"""
+        if order_number is None:
+            order_number = self._next_order_number
+        elif not isinstance(order_number, int) or not 0 < order_number <= MAX_ORDER_NUMBER:
+            raise ValueError('Order number {0} must be an int from 1 to {1}'.format(order_number, MAX_ORDER_NUMBER))
+
+        self._next_order_number = max(self._next_order_number, order_number + 1)
+
+        return order_number
+
+    def __count_accepted(self, accepted):
+        previously_accepted_orders = self._accepted_orders
+        self._accepted_orders += accepted
+
+        if self._snapshot_path and self._snapshot_every_orders and \
+                previously_accepted_orders // self._snapshot_every_orders != \
+                self._accepted_orders // self._snapshot_every_orders:
+            self.write_snapshot()
+
+    def _execute_order(self, order):
+        # Store the order forever in the data store
+        self._all_orders.add(order)
+
+        if order.order_type == OrderType.BUY:
+            self._execute_and_or_store_buy_order(order)
+        else:
+            self._execute_and_or_store_sell_order(order)
 
-        self._execute_and_or_store_sell_order(sell_order)
+        if order.get_unmatched_size() <= 0:
+            self._all_orders.mark_filled(order)
 
-        return sell_order.id
+        if self._order_listener is not None:
+            self._order_listener(order)
+
+    def _cancel_order(self, order):
+        order.cancel()
+        self._unmatched_order_book.cancel_order(order)
+        self._all_orders.mark_filled(order)
+
+        if self._order_listener is not None:
+            self._order_listener(order)
 
     def find_order(self, order_id):
         """find will return the object or None"""
-        if order_id not in self._all_orders:
+        order_number = decode_order_id(order_id)
+
+        if order_number is None:
             return None
 
-        return self.get_order(order_id)
+        return self._all_orders.find(order_number)
 
     def get_order(self, order_id):
         """get will return the object or error (Don't worry about None in downstream code)"""
-        return self._all_orders[order_id]
+        order = self.find_order(order_id)
+
+        if order is None:
+            raise KeyError(order_id)
+
+        return order
+
+    def get_order_store_metrics(self):
+        return self._all_orders.get_metrics()
+
+    def get_memory_usage(self, sample_size=SAMPLE_SIZE):
+        """
+        Approximate memory of each structure of the exchange, see create_memory_report for the whole process. Costs
+        O(sample_size) per structure however many orders there are.
+        :return: dict of structure name to dict with its count and bytes
+        """
+        usage = self._all_orders.get_memory_usage(sample_size)
+        usage.update(self._unmatched_order_book.get_memory_usage(sample_size))
+        usage['trade_tape'] = self._trade_tape.get_memory_usage()
+
+        return usage
+
+    def get_metrics(self):
+        """:return: Metrics the exchange records in, or None if it was created without"""
+        return self._metrics
+
+    def set_level_listener(self, level_listener):
+        """
+        :param level_listener: function(OrderType, price, total size) called whenever the total size of a price level
+                               of the unmatched order book changes, see UnmatchedOrderBook.set_level_listener
+        """
+        self._unmatched_order_book.set_level_listener(level_listener)
+
+    def set_order_listener(self, order_listener):
+        """
+        :param order_listener: function(Order) called whenever an order is accepted, matched or cancelled, after the
+                               change. It can be called more than once for the same change of an order. It is called on
+                               the matching path so it must be cheap.
+        """
+        self._order_listener = order_listener
+
+    def get_trades(self, since, limit):
+        """
+        Tail the matches made by the exchange, see TradeTape.get_trades
+        :return: list of Match
+        :raises TradesUnavailableError: if matches after since are no longer kept
+        """
+        return self._trade_tape.get_trades(since, limit)
+
+    def get_last_trade_sequence(self):
+        return self._trade_tape.get_last_sequence()
 
     def get_exchange_summary(self):
         return self._unmatched_order_book.get_summary()
 
+    def get_accepted_orders(self):
+        """:return: int orders and cancels accepted so far, the same as the number of records in the journal"""
+        return self._accepted_orders
+
+    def get_order_book_version(self):
+        """:return: int version of the unmatched order book, see UnmatchedOrderBook.get_version"""
+        return self._unmatched_order_book.get_version()
+
+    def get_exchange_depth(self, n):
+        """
+        Summary of the best n price levels on each side of the unmatched order book
+        :param n: int number of price levels per side
+        :return: UnmatchedOrderBookSummary
+        """
+        return self._unmatched_order_book.get_depth(n)
+
+    def get_exchange_range(self, min_price=None, max_price=None, bucket=None):
+        """
+        Summary of the price levels from min_price to max_price on each side of the unmatched order book, in buckets of
+        bucket ticks when it is set, see UnmatchedOrderBook.get_range
+        :return: UnmatchedOrderBookSummary
+        """
+        return self._unmatched_order_book.get_range(min_price, max_price, bucket)
+
+    def get_best_levels(self, n):
+        """
+        The best n price levels on each side of the unmatched order book, see UnmatchedOrderBook.get_best_levels
+        :return: (buy prices, buy sizes, sell prices, sell sizes)
+        """
+        return self._unmatched_order_book.get_best_levels(n)
+
     def _execute_and_or_store_buy_order(self, buy_order):
         """
         Execute and or store a buy order in the unmatched_order_book
 
         This is not atomic. If it fails then stop everything because the order book and map of orders will be in an
-        inconsistent state.
-
-        In the real world I would use the persistent data store (database) to ensure atomicity, either transactions if
-        using SQL or eventually consistent systems if using MongoDB.
+        inconsistent state. The order is in the journal (if there is one) before this is called, so restarting and
+        replaying the journal recovers a consistent state.
 
         :param size: int number of units
         :param price: int in pence
         """
-        best_sell = self._unmatched_order_book.peek_best_sell_order()
+        order_book = self._unmatched_order_book
 
         # If buy_order has unmatched size of 0 then it was fully executed and never has to go onto the order book.
         while buy_order.get_unmatched_size() > 0:
-            # Can't match because no sell orders
-            if best_sell is None:
-                self._unmatched_order_book.add_buy_order(buy_order)
-                return
+            best_sell_level = order_book.peek_best_sell_level()
 
-            # Can't match because sell price greater than buy price
-            if best_sell.price > buy_order.price:
-                self._unmatched_order_book.add_buy_order(buy_order)
+            # Can't match because no sell orders, or because sell price greater than buy price
+            if best_sell_level is None or best_sell_level.price > buy_order.price:
+                order_book.add_buy_order(buy_order)
                 return
 
-            # We can start executing the order immediately
-            if best_sell.price <= buy_order.price:
-                match = Match(
-                    buy_order=buy_order,
-                    sell_order=best_sell,
-                    price=best_sell.price,
-                    size=min([buy_order.get_unmatched_size(), best_sell.get_unmatched_size()])
-                )
-                buy_order.add_match(match)
-                best_sell.add_match(match)
+            # The buy order is at least as big as the whole level, so every order in it is fully executed.
+            # Take the level off the order book in one step instead of filling and popping its orders one at a time.
+            if buy_order.get_unmatched_size() >= best_sell_level.total_size:
+                order_book.pop_best_sell_level()
+
+                for sell_order in best_sell_level:
+                    self.__match(buy_order, sell_order, best_sell_level.price, sell_order.get_unmatched_size())
+                    self._all_orders.mark_filled(sell_order)
 
-                # If the sell order was fully executed then pop it off the order book and get the new best
-                # unmatched sell order
+                continue
+
+            # Otherwise the buy order is fully executed inside this level, starting with the oldest order
+            while buy_order.get_unmatched_size() > 0:
+                best_sell = best_sell_level.peek()
+                size = min(buy_order.get_unmatched_size(), best_sell.get_unmatched_size())
+
+                self.__match(buy_order, best_sell, best_sell.price, size)
+                order_book.fill_best_sell_order(size)
+
+                # If the sell order was fully executed then pop it off the order book. The level is never emptied.
                 if best_sell.get_unmatched_size() <= 0:
-                    self._unmatched_order_book.pop_best_sell_order()
-                    best_sell = self._unmatched_order_book.peek_best_sell_order()
+                    order_book.pop_best_sell_order()
+                    self._all_orders.mark_filled(best_sell)
 
     def _execute_and_or_store_sell_order(self, sell_order):
         """
         Execute and or store a sell order in the unmatched_order_book
 
         This is not atomic. If it fails then stop everything because the order book and map of orders will be in an
-        inconsistent state.
-
-        In the real world I would use the persistent data store (database) to ensure atomicity, either transactions if
-        using SQL or eventually consistent systems if using MongoDB.
+        inconsistent state. The order is in the journal (if there is one) before this is called, so restarting and
+        replaying the journal recovers a consistent state.
 
         :param size: int number of units
         :param price: int in pence
         """
-        best_buy = self._unmatched_order_book.peek_best_buy_order()
+        order_book = self._unmatched_order_book
 
-        # If buy_order has unmatched size of 0 then it was fully executed and never has to go onto the order book.
+        # If sell_order has unmatched size of 0 then it was fully executed and never has to go onto the order book.
         while sell_order.get_unmatched_size() > 0:
-            # Can't match because no sell orders
-            if best_buy is None:
-                self._unmatched_order_book.add_sell_order(sell_order)
-                return
+            best_buy_level = order_book.peek_best_buy_level()
 
-            # Can't match because sell price greater than buy price
-            if best_buy.price < sell_order.price:
-                self._unmatched_order_book.add_sell_order(sell_order)
+            # Can't match because no buy orders, or because buy price less than sell price
+            if best_buy_level is None or best_buy_level.price < sell_order.price:
+                order_book.add_sell_order(sell_order)
                 return
 
-            # We can start executing the order immediately
-            if best_buy.price >= sell_order.price:
-                match = Match(
-                    buy_order=best_buy,
-                    sell_order=sell_order,
-                    price=best_buy.price,
-                    size=min([best_buy.get_unmatched_size(), sell_order.get_unmatched_size()])
-                )
-                best_buy.add_match(match)
-                sell_order.add_match(match)
+            # The sell order is at least as big as the whole level, so every order in it is fully executed.
+            # Take the level off the order book in one step instead of filling and popping its orders one at a time.
+            if sell_order.get_unmatched_size() >= best_buy_level.total_size:
+                order_book.pop_best_buy_level()
+
+                for buy_order in best_buy_level:
+                    self.__match(buy_order, sell_order, best_buy_level.price, buy_order.get_unmatched_size())
+                    self._all_orders.mark_filled(buy_order)
 
-                # If the buy order was fully executed then pop it off the order book and get the new best
-                # unmatched buy order
+                continue
+
+            # Otherwise the sell order is fully executed inside this level, starting with the oldest order
+            while sell_order.get_unmatched_size() > 0:
+                best_buy = best_buy_level.peek()
+                size = min(sell_order.get_unmatched_size(), best_buy.get_unmatched_size())
+
+                self.__match(best_buy, sell_order, best_buy.price, size)
+                order_book.fill_best_buy_order(size)
+
+                # If the buy order was fully executed then pop it off the order book. The level is never emptied.
                 if best_buy.get_unmatched_size() <= 0:
-                    self._unmatched_order_book.pop_best_buy_order()
-                    best_buy = self._unmatched_order_book.peek_best_buy_order()
+                    order_book.pop_best_buy_order()
+                    self._all_orders.mark_filled(best_buy)
+
+    def __match(self, buy_order, sell_order, price, size):
+        match = Match(
+            buy_order=buy_order,
+            sell_order=sell_order,
+            price=price,
+            size=size
+        )
+        self._trade_tape.append(match)
+        buy_order.add_match(match)
+        sell_order.add_match(match)
+
+        if self._order_listener is not None:
+            self._order_listener(buy_order)
+            self._order_listener(sell_order)
+
+    def __instrument(self):
+        """
+        Replace the stages of an order with versions that record into the metrics. Only called when there are metrics,
+        so the uninstrumented exchange runs exactly the same code as it would without any metrics support.
+        """
+        metrics = self._metrics
+
+        self._create_order = metrics.timed(
+            'exchange_order_validation_seconds', 'Time to validate and create an order', Order)
+
+        # The matching loops include storing what is left of the order in the order book
+        matching = 'exchange_matching_seconds', 'Time to match an order against the order book'
+        self._execute_and_or_store_buy_order = metrics.timed(*matching, function=self._execute_and_or_store_buy_order)
+        self._execute_and_or_store_sell_order = metrics.timed(*matching, function=self._execute_and_or_store_sell_order)
+
+        orders = metrics.counter('exchange_orders_total', 'Orders accepted')
+        matches = metrics.counter('exchange_matches_total', 'Matches made')
+        levels_touched = metrics.histogram('exchange_levels_touched_per_order', 'Price levels an order matched against')
+        execute_order = self._execute_order
+
+        def execute_and_count_order(order):
+            execute_order(order)
+
+            # The order is new, so all of its matches were made just now
+            order_matches = order.get_matches()
+
+            orders.increment()
+            matches.increment(len(order_matches))
+            levels_touched.record(len(set(match.price for match in order_matches)))
+
+        self._execute_order = execute_and_count_order
+
+        metrics.gauge('exchange_buy_price_levels', 'Price levels on the buy side of the order book',
+                      lambda: self._unmatched_order_book.get_buy_level_count())
+        metrics.gauge('exchange_sell_price_levels', 'Price levels on the sell side of the order book',
+                      lambda: self._unmatched_order_book.get_sell_level_count())
+
+        self.__instrument_order_book()
+
+    def __instrument_order_book(self):
+        metrics = self._metrics
+        order_book = self._unmatched_order_book
 
+        insert = 'exchange_order_book_insert_seconds', 'Time to add an order to the order book'
+        order_book.add_buy_order = metrics.timed(*insert, function=order_book.add_buy_order)
+        order_book.add_sell_order = metrics.timed(*insert, function=order_book.add_sell_order)
 
+        pop = 'exchange_order_book_pop_seconds', 'Time to remove a filled order from the order book'
+        order_book.pop_best_buy_order = metrics.timed(*pop, function=order_book.pop_best_buy_order)
+        order_book.pop_best_sell_order = metrics.timed(*pop, function=order_book.pop_best_sell_order)
 
+        sweep = 'exchange_order_book_level_sweep_seconds', \
+            'Time to remove a fully matched price level from the order book'
+        order_book.pop_best_buy_level = metrics.timed(*sweep, function=order_book.pop_best_buy_level)
+        order_book.pop_best_sell_level = metrics.timed(*sweep, function=order_book.pop_best_sell_level)
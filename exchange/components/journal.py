@@ -0,0 +1,329 @@
+import os
+import threading
+
+from exchange.components.order import OrderType
+
+# Every journal file starts with this header so that we never replay a file that is not a journal
+JOURNAL_HEADER = b'EXJOURNAL2\n'
+
+# Each record starts with a single byte saying what happened
+_RECORD_TYPES = {
+    OrderType.BUY: 1,
+    OrderType.SELL: 2,
+}
+_ORDER_TYPES = {record_type: order_type for order_type, record_type in _RECORD_TYPES.items()}
+
+# A cancel record is followed by the number of the cancelled order
+_CANCEL_RECORD_TYPE = 3
+
+_READ_CHUNK_SIZE = 1 << 20
+
+
+class JournalEntry:
+    """
+    An order that was accepted by the Exchange, or the cancel of an order, in the order they were accepted.
+    The order id is the int order number, see order_id. A cancel only has the number of the cancelled order.
+    """
+    __slots__ = ('order_type', 'order_id', 'size', 'price', 'cancel')
+
+    def __init__(self, order_type, order_id, size, price, cancel=False):
+        self.order_type = order_type
+        self.order_id = order_id
+        self.size = size
+        self.price = price
+        self.cancel = cancel
+
+
+class Journal:
+    """
+    Append only write ahead journal of every order accepted by the Exchange and every cancel.
+
+    Replaying the journal into an empty Exchange rebuilds the same order book and orders because matching is
+    deterministic. Each record is a type byte followed by the order number, size and price, or just the order number
+    when an order is cancelled. They are unbounded ints so they are written as unsigned LEB128 varints, which keeps the
+    common small values to a few bytes.
+
+    Every record is written to the operating system before the order is acknowledged, so a crash of the process never
+    loses an acknowledged order. Calling fsync on every record caps throughput at the speed of the disk, so fsync is
+    grouped: the file is synced after fsync_every_events records, and when fsync_interval_us is given a background
+    thread also syncs every fsync_interval_us microseconds while there are unsynced records, so records are synced
+    even when orders stop arriving.
+
+    Orders are acknowledged without waiting for the fsync that covers them. With the default of fsync_every_events=1
+    every record is on the disk before it is acknowledged. Otherwise a crash of the machine, rather than the process,
+    can lose up to fsync_every_events - 1 acknowledged records, or the records of the last fsync_interval_us when that
+    is shorter. Without fsync_interval_us the last records are not synced until enough others arrive or the journal is
+    closed.
+
+    A Snapshot records the offset of the end of the journal when it is written, see get_offset. Opening the journal
+    with scan_from set to that offset only reads the records after it to find a partial record, and entries(offset)
+    only reads the records after it, so a restart does not read the whole history of the journal.
+    """
+    def __init__(self, path, fsync_every_events=1, fsync_interval_us=None, scan_from=None):
+        if fsync_every_events < 1:
+            raise ValueError('fsync_every_events {0} must be at least 1'.format(fsync_every_events))
+
+        self.path = path
+        self._fsync_every_events = fsync_every_events
+        self._fsync_interval = fsync_interval_us / 1000000.0 if fsync_interval_us is not None else None
+
+        # A crash part way through writing a record leaves a partial record at the end of the file. Cut it off so that
+        # new records are not appended after it.
+        valid_length = self.__scan(scan_from)
+
+        self._file = open(path, 'r+b' if valid_length else 'w+b', buffering=0)
+
+        if not valid_length:
+            self._file.write(JOURNAL_HEADER)
+            valid_length = len(JOURNAL_HEADER)
+        else:
+            self._file.truncate(valid_length)
+            self._file.seek(valid_length)
+
+        # Offset of the end of the last record, records are only written by the matching thread
+        self._offset = valid_length
+
+        # Records are written by the matching thread and synced by it or by the background thread
+        self._lock = threading.Lock()
+        self._unsynced_events = 0
+        self._closed = threading.Event()
+        self._sync_thread = None
+
+        if self._fsync_interval is not None:
+            self._sync_thread = threading.Thread(target=self.__sync_periodically, name='exchange-journal-sync',
+                                                 daemon=True)
+            self._sync_thread.start()
+
+    def append(self, order):
+        """
+        Record an accepted order. The record has been handed to the operating system when this returns.
+        :param order: Order
+        """
+        self.append_batch([order])
+
+    def append_batch(self, orders):
+        """
+        Record several accepted orders with a single write
+        :param orders: list of Order in the order they were accepted
+        """
+        if not orders:
+            return
+
+        self.append_records(encode_orders(orders), len(orders))
+
+    def append_cancel(self, order_id):
+        """
+        Record the cancel of an order. The record has been handed to the operating system when this returns.
+        :param order_id: int order number
+        """
+        self.append_records(encode_cancel(order_id), 1)
+
+    def append_records(self, records, events):
+        """
+        Record orders and cancels that have already been encoded, e.g. to also send them somewhere else
+        :param records: bytes of events records, see encode_orders and encode_cancel
+        """
+        self.__write(records, events)
+
+    def sync(self):
+        """Force every record appended so far onto the disk"""
+        with self._lock:
+            unsynced_events = self._unsynced_events
+            self._unsynced_events = 0
+
+        # Records written while this runs are still counted as unsynced, so they are synced again later
+        if unsynced_events:
+            os.fsync(self._file.fileno())
+
+    def get_unsynced_events(self):
+        """:return: int number of records written but not yet synced to the disk"""
+        return self._unsynced_events
+
+    def close(self):
+        if self._file is not None:
+            self._closed.set()
+
+            if self._sync_thread is not None:
+                self._sync_thread.join()
+                self._sync_thread = None
+
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def get_offset(self):
+        """:return: int offset of the end of the last record written, where the next record starts"""
+        return self._offset
+
+    def entries(self, offset=None):
+        """
+        Read every complete record from the start of the journal, or only the records after offset
+        :param offset: int offset of the end of a record, see get_offset
+        :return: generator of JournalEntry
+        """
+        return read_journal(self.path, offset)
+
+    def __write(self, record, events):
+        self._file.write(record)
+        self._offset += len(record)
+
+        with self._lock:
+            self._unsynced_events += events
+            unsynced_events = self._unsynced_events
+
+        if unsynced_events >= self._fsync_every_events:
+            self.sync()
+
+    def __sync_periodically(self):
+        """Sync the records left by orders that stopped arriving, until the journal is closed"""
+        while not self._closed.wait(self._fsync_interval):
+            self.sync()
+
+    def __scan(self, scan_from):
+        """
+        :param scan_from: int offset of the end of a record known to be complete, None to read the whole journal
+        :return: int length of the journal up to the end of the last complete record, 0 if there is no journal
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return 0
+
+        # The journal is not the one the offset was taken from, e.g. it was replaced by an empty one
+        if scan_from is not None and scan_from > os.path.getsize(self.path):
+            scan_from = None
+
+        valid_length = scan_from or len(JOURNAL_HEADER)
+
+        for entry, end in _read_entries(self.path, scan_from):
+            valid_length = end
+
+        return valid_length
+
+
+def read_journal(path, offset=None):
+    """
+    Read every complete record of a journal file without opening it for appending, e.g. to replay it elsewhere.
+    The file is read in chunks so memory use does not grow with the size of the journal.
+    :param offset: int offset of the end of a record to read the records after, see Journal.get_offset
+    :return: generator of JournalEntry
+    """
+    for entry, end in _read_entries(path, offset):
+        yield entry
+
+
+def _read_entries(path, offset=None):
+    """
+    :param offset: int offset of the end of a record to start reading at, None for the first record
+    :return: generator of (JournalEntry, int offset of the end of the record)
+    """
+    with open(path, 'rb') as journal_file:
+        if journal_file.read(len(JOURNAL_HEADER)) != JOURNAL_HEADER:
+            raise ValueError('{0} is not an exchange journal'.format(path))
+
+        if offset is None:
+            offset = len(JOURNAL_HEADER)
+        else:
+            journal_file.seek(offset)
+
+        buffer = b''
+
+        while True:
+            chunk = journal_file.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                # Anything left over is a partially written record
+                return
+
+            buffer = buffer + chunk
+            position = 0
+
+            while True:
+                entry, record_end = decode_record(buffer, position)
+                if entry is None:
+                    break
+
+                yield entry, offset + record_end
+                position = record_end
+
+            offset += position
+            buffer = buffer[position:]
+
+
+def encode_orders(orders):
+    """
+    :param orders: list of Order
+    :return: bytearray with a record of each order, in the format they are journaled in
+    """
+    records = bytearray()
+
+    for order in orders:
+        records.append(_RECORD_TYPES[order.order_type])
+        encode_varint(order.id, records)
+        encode_varint(order.get_size(), records)
+        encode_varint(order.price, records)
+
+    return records
+
+
+def encode_cancel(order_id):
+    """
+    :param order_id: int order number
+    :return: bytearray with the record of the cancel of the order
+    """
+    record = bytearray()
+    record.append(_CANCEL_RECORD_TYPE)
+    encode_varint(order_id, record)
+
+    return record
+
+
+def decode_record(buffer, position):
+    """:return: (JournalEntry, int end of the record) or (None, position) if the buffer holds a partial record"""
+    if position >= len(buffer):
+        return None, position
+
+    record_type = buffer[position]
+    order_type = _ORDER_TYPES.get(record_type)
+    if order_type is None and record_type != _CANCEL_RECORD_TYPE:
+        raise ValueError('Unknown journal record type {0}'.format(record_type))
+
+    order_id, cursor = decode_varint(buffer, position + 1)
+    if order_id is None:
+        return None, position
+
+    if record_type == _CANCEL_RECORD_TYPE:
+        return JournalEntry(None, order_id, None, None, cancel=True), cursor
+
+    size, cursor = decode_varint(buffer, cursor)
+    if size is None:
+        return None, position
+
+    price, cursor = decode_varint(buffer, cursor)
+    if price is None:
+        return None, position
+
+    return JournalEntry(order_type, order_id, size, price), cursor
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+
+    out.append(value)
+
+
+def decode_varint(buffer, position):
+    """:return: (int value, int position after the varint) or (None, position) if the varint is incomplete"""
+    value = 0
+    shift = 0
+
+    while position < len(buffer):
+        byte = buffer[position]
+        position += 1
+
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, position
+
+        shift += 7
+
+    return None, position
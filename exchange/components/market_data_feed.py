@@ -0,0 +1,127 @@
+import threading
+from collections import deque
+
+from sortedcontainers import SortedDict
+
+from exchange.components.order import OrderType
+from exchange.components.unmatched_order_book import UnmatchedOrderBookSummary
+
+
+class MarketDataUpdate:
+    """
+    Changes to the price levels of the order book between two sequence numbers of the MarketDataFeed.
+    changes maps (OrderType, price) to the new total size of the level, 0 when the level has been removed.
+    """
+    __slots__ = ('sequence', 'changes')
+
+    def __init__(self, sequence, changes):
+        self.sequence = sequence
+        self.changes = changes
+
+
+class MarketDataFeed:
+    """
+    Incremental level 2 market data: the total size at each price level of the order book, pushed as it changes.
+
+    The matching thread reports every change to a price level with on_level_change, which only records the newest size
+    of the level, and calls publish after each batch of orders. Each publish gets the next sequence number and is kept
+    in a bounded window of recent publishes.
+
+    Subscribers start from get_snapshot and then ask for the changes since the last sequence number they have seen.
+    They read at their own pace without ever blocking the matching thread. A subscriber that has fallen behind gets all
+    the changes it missed conflated into one update holding only the newest size of each level, and a subscriber that
+    has fallen out of the window has to start again from a new snapshot.
+    """
+    def __init__(self, summary=None, max_updates=1000):
+        """
+        :param summary: UnmatchedOrderBookSummary of the order book when the feed starts, empty by default
+        :param max_updates: int number of publishes kept for subscribers that have fallen behind
+        """
+        self._levels = {OrderType.BUY: SortedDict(), OrderType.SELL: SortedDict()}
+
+        if summary is not None:
+            self._levels[OrderType.BUY].update(summary.buy_dict)
+            self._levels[OrderType.SELL].update(summary.sell_dict)
+
+        # Only used by the matching thread
+        self._pending_changes = dict()
+
+        self._sequence = 0
+        self._updates = deque(maxlen=max_updates)
+        self._publish_listeners = []
+        self._lock = threading.Lock()
+
+    def on_level_change(self, order_type, price, size):
+        """Called by the matching thread, see UnmatchedOrderBook.set_level_listener"""
+        self._pending_changes[(order_type, price)] = size
+
+    def publish(self):
+        """
+        Called by the matching thread after each batch of orders to make the changes since the last publish available
+        """
+        if not self._pending_changes:
+            return
+
+        changes = self._pending_changes
+        self._pending_changes = dict()
+
+        with self._lock:
+            for (order_type, price), size in changes.items():
+                if size:
+                    self._levels[order_type][price] = size
+                else:
+                    self._levels[order_type].pop(price, None)
+
+            self._sequence += 1
+            self._updates.append(MarketDataUpdate(self._sequence, changes))
+
+        for publish_listener in self._publish_listeners:
+            publish_listener()
+
+    def add_publish_listener(self, publish_listener):
+        """
+        :param publish_listener: function called on the matching thread after every publish. It must be cheap,
+                                 e.g. waking up the subscribers.
+        """
+        self._publish_listeners.append(publish_listener)
+
+    def get_sequence(self):
+        return self._sequence
+
+    def get_snapshot(self):
+        """
+        :return: (int sequence, UnmatchedOrderBookSummary) every price level as of the sequence number
+        """
+        summary = UnmatchedOrderBookSummary()
+
+        with self._lock:
+            summary.buy_dict = SortedDict(self._levels[OrderType.BUY])
+            summary.sell_dict = SortedDict(self._levels[OrderType.SELL])
+
+            return self._sequence, summary
+
+    def get_update(self, since):
+        """
+        Every change published after the since sequence number, conflated into one update
+        :param since: int last sequence number the subscriber has seen
+        :return: MarketDataUpdate, None if there is nothing new, or raise LookupError if the changes since that sequence
+                 number are no longer kept and the subscriber has to start again from a snapshot
+        """
+        with self._lock:
+            if since >= self._sequence:
+                return None
+
+            if not self._updates or self._updates[0].sequence > since + 1:
+                raise LookupError('Updates since {0} are no longer available'.format(since))
+
+            changes = dict()
+
+            # The window is in sequence order, only the updates after since are needed
+            for update in reversed(self._updates):
+                if update.sequence <= since:
+                    break
+
+                for level, size in update.changes.items():
+                    changes.setdefault(level, size)
+
+            return MarketDataUpdate(self._sequence, changes)
@@ -1,22 +1,60 @@
-import json
+from exchange.components.order_id import decode_order_id, encode_order_id
 
 
 class Match:
     """
     One Order can be matched against many smaller Orders at differing prices.
     Match keeps track of a single Match between two orders at a single price.
+
+    The same Match is shared by both orders. Only the ids of the orders are kept so that a Match does not keep
+    both orders alive. The ids are the internal order numbers, the summary has the external ids.
+
+    The sequence number is given to the match by the TradeTape of the exchange, it is None until then.
     """
+    __slots__ = ('buy_order_id', 'sell_order_id', 'size', 'price', 'sequence')
+
     def __init__(self, buy_order, sell_order, size, price):
-        self.buy_order = buy_order
-        self.sell_order = sell_order
+        self.buy_order_id = buy_order.id
+        self.sell_order_id = sell_order.id
         self.size = size
         self.price = price
+        self.sequence = None
+
+    @classmethod
+    def restore(cls, buy_order_id, sell_order_id, size, price, sequence=None):
+        """
+        Rebuild a match from the ids of its orders, e.g. when it is loaded from an archive or snapshot
+        :return: Match
+        """
+        match = cls.__new__(cls)
+
+        match.buy_order_id = buy_order_id
+        match.sell_order_id = sell_order_id
+        match.size = size
+        match.price = price
+        match.sequence = sequence
+
+        return match
+
+    @classmethod
+    def from_summary(cls, summary):
+        """
+        Rebuild a match from the output of get_summary
+        :param summary: dict returned by get_summary
+        :return: Match
+        """
+        return cls.restore(
+            buy_order_id=decode_order_id(summary['buy_order_id']),
+            sell_order_id=decode_order_id(summary['sell_order_id']),
+            size=summary['size'],
+            price=summary['price']
+        )
 
     def get_summary(self):
         summary = dict()
 
-        summary['buy_order_id'] = self.buy_order.id
-        summary['sell_order_id'] = self.sell_order.id
+        summary['buy_order_id'] = encode_order_id(self.buy_order_id)
+        summary['sell_order_id'] = encode_order_id(self.sell_order_id)
         summary['size'] = self.size
         summary['price'] = self.price
 
@@ -0,0 +1,176 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class QueueFullError(Exception):
+    """
+    The matching engine already has as many requests waiting as it is allowed to queue. Try again later.
+    """
+
+
+class MatchingEngine:
+    """
+    Runs an Exchange on a single dedicated thread so that it can be used by many concurrent connections.
+
+    The Exchange is not thread safe. Every request that reads or changes it is put on a bounded queue and run by the
+    matching thread, the caller gets a concurrent.futures.Future for the result. When the queue is full requests are
+    rejected with QueueFullError instead of waiting, so a burst of orders can never build an unbounded backlog.
+
+    After every batch of changes the matching thread publishes a new summary of the order book with its version, the
+    changes to the MarketDataFeed if there is one and the state of the exchange to the read replicas if there are any.
+    The published summary is never changed after it is published, so it can be read from any thread without waiting
+    for the matching thread. It is only summarised again when the version of the order book has changed.
+    """
+    _STOP = object()
+
+    def __init__(self, exchange, max_queue_size=10000, max_batch_size=256, market_data_feed=None,
+                 replica_publisher=None):
+        """
+        :param exchange: Exchange owned by the matching thread from now on
+        :param max_queue_size: int number of requests that can wait for the matching thread
+        :param max_batch_size: int max number of requests run between publishing order book summaries
+        :param market_data_feed: MarketDataFeed started from the current state of the exchange, optional
+        :param replica_publisher: OrderBookReplicaPublisher of the exchange, published to after every batch of changes,
+                                  optional
+        """
+        self._exchange = exchange
+        self._market_data_feed = market_data_feed
+        self._replica_publisher = replica_publisher
+
+        if market_data_feed is not None:
+            exchange.set_level_listener(market_data_feed.on_level_change)
+
+        self._max_batch_size = max_batch_size
+        self._requests = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+
+        # Called on the matching thread after every batch of changes, see add_batch_listener
+        self._batch_listeners = []
+
+        # (order book version, summary) published together so a reader never sees the version of another summary
+        self._published_order_book = exchange.get_order_book_version(), exchange.get_exchange_summary()
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self.__run, name='matching-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Finish every request that has been queued and stop the matching thread"""
+        if self._thread is None:
+            return
+
+        self._requests.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def execute(self, function, *args):
+        """
+        Queue function(exchange, *args) to run on the matching thread, e.g. execute(Exchange.submit_buy, 10, 100)
+        :return: Future for the result of the function
+        :raises QueueFullError: if the queue is full
+        """
+        return self.__queue(function, args, True)
+
+    def read(self, function, *args):
+        """
+        Like execute, for a function that does not change the exchange
+        :return: Future for the result of the function
+        :raises QueueFullError: if the queue is full
+        """
+        return self.__queue(function, args, False)
+
+    def get_published_summary(self):
+        """
+        The latest summary of the order book published by the matching thread. Do not change it.
+        :return: UnmatchedOrderBookSummary
+        """
+        return self._published_order_book[1]
+
+    def get_published_order_book(self):
+        """
+        The latest summary of the order book published by the matching thread and the version of the order book it
+        summarises, see Exchange.get_order_book_version. Do not change the summary.
+        :return: (int version, UnmatchedOrderBookSummary)
+        """
+        return self._published_order_book
+
+    def add_batch_listener(self, batch_listener):
+        """
+        :param batch_listener: function(exchange) called on the matching thread after every batch of requests that
+                               changed the exchange, before their results are returned. Add it before starting.
+        """
+        self._batch_listeners.append(batch_listener)
+
+    def get_queue_size(self):
+        return self._requests.qsize()
+
+    def __queue(self, function, args, changes_exchange):
+        future = Future()
+
+        try:
+            self._requests.put_nowait((function, args, changes_exchange, future))
+        except queue.Full:
+            raise QueueFullError()
+
+        return future
+
+    def __run(self):
+        while True:
+            batch = [self._requests.get()]
+
+            # Run everything that is already waiting before publishing the order book, up to the batch size
+            while len(batch) < self._max_batch_size:
+                try:
+                    batch.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            exchange_changed = False
+            stopping = False
+            outcomes = []
+
+            for request in batch:
+                if request is self._STOP:
+                    stopping = True
+                    continue
+
+                function, args, changes_exchange, future = request
+
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    outcomes.append((future, function(self._exchange, *args), None))
+                except Exception as error:
+                    outcomes.append((future, None, error))
+
+                exchange_changed = exchange_changed or changes_exchange
+
+            # Publish before answering so that a client always sees its own orders in the order book
+            if exchange_changed:
+                version = self._exchange.get_order_book_version()
+
+                if version != self._published_order_book[0]:
+                    self._published_order_book = version, self._exchange.get_exchange_summary()
+
+                if self._market_data_feed is not None:
+                    self._market_data_feed.publish()
+
+                if self._replica_publisher is not None:
+                    self._replica_publisher.publish()
+
+                for batch_listener in self._batch_listeners:
+                    batch_listener(self._exchange)
+
+            for future, result, error in outcomes:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+            if stopping:
+                return
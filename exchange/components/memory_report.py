@@ -0,0 +1,215 @@
+"""
+How much memory the exchange holds, see Exchange.get_memory_usage and create_memory_report, and MemoryMonitor to warn
+about and stop taking new orders before the process runs out of memory
+"""
+import itertools
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+# Objects measured one by one in each structure, the rest are assumed to be the same size on average. Counting bytes
+# exactly would walk every order on the thread that owns the exchange.
+SAMPLE_SIZE = 1000
+
+# Allocators listed in a report when tracemalloc is tracing
+TOP_ALLOCATORS = 10
+
+# Bytes of each slot of a list, tuple or hash table of objects
+POINTER_SIZE = 8
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+logger = logging.getLogger(__name__)
+
+
+def sample(values, count, sample_size=SAMPLE_SIZE):
+    """
+    :param values: iterable of count values, e.g. the values of a dict
+    :return: list of at most sample_size values spread evenly over values
+    """
+    if count <= sample_size:
+        return list(values)
+
+    return list(itertools.islice(values, 0, None, -(-count // sample_size)))
+
+
+def estimate_bytes(sampled, count, size_of):
+    """
+    :param sampled: list of values sampled from count values, see sample
+    :param size_of: function returning the bytes of a value
+    :return: int estimated bytes of all count values
+    """
+    if not sampled:
+        return 0
+
+    return int(sum(size_of(value) for value in sampled) * count / len(sampled))
+
+
+def read_resident_bytes():
+    """:return: int bytes of the process in physical memory now, the peak where that cannot be read"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return read_peak_resident_bytes()
+
+
+def read_peak_resident_bytes():
+    """:return: int most bytes the process has had in physical memory"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes everywhere but macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def create_memory_report(exchange, memory_monitor=None, sample_size=SAMPLE_SIZE):
+    """
+    Call on the thread that owns the exchange, see Exchange.get_memory_usage
+    :param exchange: Exchange
+    :param memory_monitor: MemoryMonitor whose thresholds are reported, optional
+    :return: dict that can be encoded as JSON. Add the top allocators with add_top_allocators.
+    """
+    structures = exchange.get_memory_usage(sample_size)
+
+    report = {
+        'process': {
+            'resident_bytes': read_resident_bytes(),
+            'peak_resident_bytes': read_peak_resident_bytes(),
+        },
+        'structures': structures,
+        'structures_bytes': sum(structure['bytes'] for structure in structures.values()),
+        'tracemalloc': None,
+    }
+
+    if tracemalloc.is_tracing():
+        traced_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        report['tracemalloc'] = {'traced_bytes': traced_bytes, 'peak_traced_bytes': peak_bytes}
+
+    if memory_monitor is not None:
+        report['thresholds'] = memory_monitor.get_thresholds()
+
+    return report
+
+
+def take_allocation_snapshot():
+    """
+    Call on the thread that owns the exchange, so the snapshot is of a consistent state
+    :return: tracemalloc.Snapshot, None when tracemalloc is not tracing
+    """
+    return tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+
+def add_top_allocators(report, snapshot, top_allocators=TOP_ALLOCATORS):
+    """
+    Add the source lines that allocated the most memory in snapshot to a report of create_memory_report. Grouping every
+    allocation by line takes seconds when there are millions, so do it on any thread but the one that owns the exchange
+    when there is one.
+    :param snapshot: tracemalloc.Snapshot or None, see take_allocation_snapshot
+    """
+    if snapshot is None or report['tracemalloc'] is None:
+        return
+
+    report['tracemalloc']['top_allocators'] = [
+        {
+            'location': '{0}:{1}'.format(statistic.traceback[0].filename, statistic.traceback[0].lineno),
+            'bytes': statistic.size,
+            'allocations': statistic.count,
+        }
+        for statistic in snapshot.statistics('lineno')[:top_allocators]
+    ]
+
+
+class MemoryMonitor:
+    """
+    Watches the resident memory of the process against two thresholds: over warning_bytes a warning is logged, over
+    reject_bytes new orders should be rejected (see is_rejecting) until memory drops below resume_bytes, e.g. once
+    orders have been archived or cancelled. Resuming under a lower threshold stops the exchange flipping between taking
+    and rejecting orders around reject_bytes.
+
+    CPython keeps most of the memory it frees for its own reuse rather than giving it back to the operating system, so
+    resident memory may never fall back under resume_bytes after a spike even though the exchange holds far less. The
+    memory it keeps is reused before more is taken, so the exchange still has that much room. Keep resume_bytes close
+    to reject_bytes unless the exchange can be restarted once it starts rejecting.
+
+    check is cheap enough to call after every request, the memory is only read once every check_interval seconds.
+    """
+    def __init__(self, warning_bytes=None, reject_bytes=None, resume_bytes=None, check_interval=1.0, metrics=None,
+                 read_memory=read_resident_bytes, clock=time.monotonic):
+        """
+        :param warning_bytes: int, None to never warn
+        :param reject_bytes: int, None to never reject
+        :param resume_bytes: int under which orders are taken again once rejecting, 90% of reject_bytes by default
+        :param check_interval: float seconds between reads of the memory
+        :param metrics: Metrics to export the memory read last in
+        :param read_memory: function returning the bytes in use
+        :param clock: function returning seconds
+        """
+        self._warning_bytes = warning_bytes
+        self._reject_bytes = reject_bytes
+        self._resume_bytes = resume_bytes
+
+        if resume_bytes is None and reject_bytes is not None:
+            self._resume_bytes = reject_bytes * 9 // 10
+        self._check_interval = check_interval
+        self._read_memory = read_memory
+        self._clock = clock
+
+        self._checked_at = None
+        self._used_bytes = 0
+        self._warning = False
+        self._rejecting = False
+
+        if metrics is not None:
+            metrics.gauge('exchange_resident_memory_bytes', 'Bytes of the process in physical memory at the last check',
+                          self.get_used_bytes)
+
+    def check(self):
+        """Read the memory if it has not been read for check_interval seconds, and log when a threshold is crossed"""
+        now = self._clock()
+
+        if self._checked_at is not None and now - self._checked_at < self._check_interval:
+            return
+
+        self._checked_at = now
+        self._used_bytes = self._read_memory()
+
+        warning = self._warning_bytes is not None and self._used_bytes >= self._warning_bytes
+        if self._rejecting:
+            rejecting = self._used_bytes >= self._resume_bytes
+        else:
+            rejecting = self._reject_bytes is not None and self._used_bytes >= self._reject_bytes
+
+        if warning and not self._warning:
+            logger.warning('Memory in use {0} bytes is over the warning threshold of {1} bytes'.format(
+                self._used_bytes, self._warning_bytes))
+
+        if rejecting != self._rejecting:
+            if rejecting:
+                logger.warning('Memory in use {0} bytes is over the reject threshold of {1} bytes, rejecting new '
+                               'orders'.format(self._used_bytes, self._reject_bytes))
+            else:
+                logger.warning('Memory in use {0} bytes is back under the resume threshold of {1} bytes, taking new '
+                               'orders again'.format(self._used_bytes, self._resume_bytes))
+
+        self._warning = warning
+        self._rejecting = rejecting
+
+    def is_rejecting(self):
+        """:return: bool True if new orders should be rejected. Safe to call from any thread."""
+        return self._rejecting
+
+    def get_used_bytes(self):
+        """:return: int bytes in use at the last check"""
+        return self._used_bytes
+
+    def get_thresholds(self):
+        return {
+            'used_bytes': self._used_bytes,
+            'warning_bytes': self._warning_bytes,
+            'reject_bytes': self._reject_bytes,
+            'resume_bytes': self._resume_bytes,
+            'rejecting': self._rejecting,
+        }
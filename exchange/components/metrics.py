@@ -0,0 +1,199 @@
+import time
+from collections import OrderedDict
+
+# Histogram values are ints, e.g. nanoseconds. Each power of 2 is split into 2 ** _SUB_BUCKET_BITS linear buckets so
+# every recorded value is kept to within about 3% while the whole histogram is a short list of counts.
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+
+# Values are clamped to 2 ** 40 - 1, about 18 minutes in nanoseconds
+_MAX_VALUE_BITS = 40
+
+_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+_NANOSECONDS = 1e-9
+
+
+class Histogram:
+    """
+    HDR style histogram of int values: the bucket of a value is found with a couple of bit operations and the relative
+    error of every bucket is the same, so latencies from nanoseconds to seconds are recorded in constant time and
+    memory without knowing their range up front.
+    """
+    def __init__(self, name, description, unit=1):
+        """
+        :param name: str Prometheus metric name
+        :param description: str Prometheus help text
+        :param unit: float multiplied by every value when it is exported, e.g. 1e-9 to export nanoseconds as seconds
+        """
+        self.name = name
+        self.description = description
+        self._unit = unit
+        self._counts = [0] * ((_MAX_VALUE_BITS - _SUB_BUCKET_BITS + 1) * _SUB_BUCKETS)
+        self._count = 0
+        self._sum = 0
+
+    def record(self, value):
+        """:param value: int, at least 0"""
+        self._counts[_bucket_index(value)] += 1
+        self._count += 1
+        self._sum += value
+
+    def get_count(self):
+        return self._count
+
+    def get_sum(self):
+        return self._sum
+
+    def get_quantile(self, quantile):
+        """
+        :param quantile: float between 0 and 1
+        :return: int highest value in the bucket holding the quantile, 0 if nothing has been recorded
+        """
+        if not self._count:
+            return 0
+
+        rank = max(int(quantile * self._count + 0.5), 1)
+        seen = 0
+
+        for index, count in enumerate(self._counts):
+            seen += count
+
+            if seen >= rank:
+                return _bucket_highest_value(index)
+
+        return _bucket_highest_value(len(self._counts) - 1)
+
+    def to_prometheus(self):
+        """:return: list of str lines exporting the histogram as a Prometheus summary"""
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.description),
+            '# TYPE {0} summary'.format(self.name),
+        ]
+
+        for quantile in _QUANTILES:
+            lines.append('{0}{{quantile="{1}"}} {2}'.format(self.name, quantile,
+                                                            _format_value(self.get_quantile(quantile) * self._unit)))
+
+        lines.append('{0}_sum {1}'.format(self.name, _format_value(self._sum * self._unit)))
+        lines.append('{0}_count {1}'.format(self.name, self._count))
+
+        return lines
+
+
+class Counter:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def increment(self, amount=1):
+        self.value += amount
+
+    def to_prometheus(self):
+        return [
+            '# HELP {0} {1}'.format(self.name, self.description),
+            '# TYPE {0} counter'.format(self.name),
+            '{0} {1}'.format(self.name, self.value),
+        ]
+
+
+class Gauge:
+    def __init__(self, name, description, read_value):
+        """:param read_value: function returning the current value, called when the metrics are exported"""
+        self.name = name
+        self.description = description
+        self._read_value = read_value
+
+    def to_prometheus(self):
+        return [
+            '# HELP {0} {1}'.format(self.name, self.description),
+            '# TYPE {0} gauge'.format(self.name),
+            '{0} {1}'.format(self.name, _format_value(self._read_value())),
+        ]
+
+
+class Metrics:
+    """
+    Histograms, counters and gauges of the hot path of the exchange, exported in the Prometheus text format.
+
+    Instrumented code is wrapped with timed when it is set up, rather than checking whether metrics are enabled on
+    every call, so an Exchange created without Metrics runs exactly the same code as before and pays nothing.
+
+    Not thread safe, only record from the thread that owns the Exchange.
+    """
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def histogram(self, name, description, unit=1):
+        """:return: Histogram, created the first time the name is used"""
+        return self.__get_or_add(name, lambda: Histogram(name, description, unit))
+
+    def counter(self, name, description):
+        """:return: Counter, created the first time the name is used"""
+        return self.__get_or_add(name, lambda: Counter(name, description))
+
+    def gauge(self, name, description, read_value):
+        """:return: Gauge, created the first time the name is used"""
+        return self.__get_or_add(name, lambda: Gauge(name, description, read_value))
+
+    def timed(self, name, description, function):
+        """
+        :param function: function to time
+        :return: function calling function and recording how long it took in the histogram name, in seconds
+        """
+        histogram = self.histogram(name, description, unit=_NANOSECONDS)
+        perf_counter = time.perf_counter
+
+        def timed_function(*args, **kwargs):
+            start = perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.record(int((perf_counter() - start) * 1e9))
+
+        return timed_function
+
+    def to_prometheus(self):
+        """:return: str every metric in the Prometheus text format"""
+        lines = []
+
+        for metric in self._metrics.values():
+            lines.extend(metric.to_prometheus())
+
+        return '\n'.join(lines) + '\n'
+
+    def __get_or_add(self, name, create):
+        if name not in self._metrics:
+            self._metrics[name] = create()
+
+        return self._metrics[name]
+
+
+def _bucket_index(value):
+    # Values below 2 * _SUB_BUCKETS get a bucket each. Above that the top _SUB_BUCKET_BITS + 1 bits of the value pick
+    # the bucket, and every power of 2 gets the next _SUB_BUCKETS buckets.
+    exponent = value.bit_length() - _SUB_BUCKET_BITS - 1
+
+    if exponent <= 0:
+        return value
+
+    if exponent > _MAX_VALUE_BITS - _SUB_BUCKET_BITS - 1:
+        return (_MAX_VALUE_BITS - _SUB_BUCKET_BITS + 1) * _SUB_BUCKETS - 1
+
+    return exponent * _SUB_BUCKETS + (value >> exponent)
+
+
+def _bucket_highest_value(index):
+    if index < 2 * _SUB_BUCKETS:
+        return index
+
+    exponent = index // _SUB_BUCKETS - 1
+    lowest_value = (index - exponent * _SUB_BUCKETS) << exponent
+
+    return lowest_value + (1 << exponent) - 1
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -1,12 +1,23 @@
-import uuid
+import sys
 from enum import Enum
+from itertools import count
+
+from exchange.components.match import Match
+from exchange.components.order_id import encode_order_id
+
+# Numbers for orders created without one, the Exchange numbers its own orders
+_order_numbers = count(1)
 
 
 class Order:
     """
     Class to keep track of each order
+
+    Every order is kept for the lifetime of the Exchange so the instance is kept small with __slots__
     """
-    def __init__(self, price, size, order_type):
+    __slots__ = ('id', 'order_type', 'price', '_size', '_unmatched_size', '_matches', 'cancelled', '_header')
+
+    def __init__(self, price, size, order_type, order_id=None):
         if not isinstance(price, int):
             raise ValueError('Price must be an int in pence')
 
@@ -19,18 +30,79 @@ class Order:
         if size <= 0:
             raise ValueError('Size {0} must be greater than 0'.format(size))
 
+        if not isinstance(order_type, OrderType):
+            raise ValueError('Order type must be BUY or SELL')
+
         self.order_type = order_type
         self.price = price
         self._size = size
 
+        # Cache the unmatched size so that the matching loop does not re-sum the matches every time it is checked
+        self._unmatched_size = size
+
         # One large Order can be matched against several smaller orders at different prices.
-        self._matches = []
+        # Most orders are never matched, so only create the list on the first match.
+        self._matches = None
+
+        # A cancelled order is never matched again. Its unmatched size is what was left when it was cancelled.
+        self.cancelled = False
+
+        # The summary without the matches, only made once the order is first summarised a page at a time and then kept
+        # up to date as the order changes, see get_summary_page
+        self._header = None
+
+        # Identify the order with a number, which is cheap to create, hash and keep as a dict key.
+        # The number is never shown outside the exchange: end users get the keyed encoding of it from order_id, so that
+        # they cannot guess the ID of other objects in the REST API. See get_external_id.
+        # An order_id is passed in by the Exchange, which numbers its orders, and when an order that was accepted before
+        # is being rebuilt
+        self.id = order_id if order_id is not None else next(_order_numbers)
+
+    @classmethod
+    def restore(cls, order_id, order_type, price, size, unmatched_size, matches, cancelled=False):
+        """
+        Rebuild an order that was accepted before, e.g. when it is loaded from an archive or snapshot
+        :param matches: list of Match
+        :param cancelled: bool
+        :return: Order
+        """
+        order = cls.__new__(cls)
+
+        order.id = order_id
+        order.order_type = order_type
+        order.price = price
+        order._size = size
+        order._unmatched_size = unmatched_size
+        order._matches = matches or None
+        order.cancelled = cancelled
+        order._header = None
+
+        return order
 
-        # Uniquely identify the order with a long random uuid.
-        # The probability of collision is 10^-37
-        # Generating true random numbers is hard and collisions can be observed in sets of 1 million uuids
-        # uuids prevent end users guessing the ID of other objects in the REST API
-        self.id = uuid.uuid4().hex
+    @classmethod
+    def from_summary(cls, order_id, summary):
+        """
+        Rebuild an order from the output of get_summary
+        :param order_id: int number of the summarised order
+        :param summary: dict returned by get_summary
+        :return: Order
+        """
+        return cls.restore(
+            order_id=order_id,
+            order_type=OrderType(summary['order_type']),
+            price=summary['price'],
+            size=summary['size'],
+            unmatched_size=summary['unmatched_size'],
+            matches=[Match.from_summary(match) for match in summary['matches']],
+            cancelled=summary.get('cancelled', False)
+        )
+
+    def get_external_id(self):
+        """:return: str id of the order outside the exchange"""
+        return encode_order_id(self.id)
+
+    def get_size(self):
+        return self._size
 
     def get_unmatched_size(self):
         """
@@ -38,18 +110,43 @@ class Order:
         The Order is responsible for keeping track of it's own matches
         :return: int
         """
-        if not self._matches:
-            return self._size
+        return self._unmatched_size
+
+    def is_open(self):
+        """:return: bool True while the order has unmatched size that can still be matched"""
+        return self._unmatched_size > 0 and not self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
+
+        if self._header is not None:
+            self._header['cancelled'] = True
+
+    def get_memory_size(self):
+        """:return: int bytes of the order and the containers it owns, not counting the Matches they share"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.id)
+
+        if self._matches is not None:
+            size += sys.getsizeof(self._matches)
 
-        unmatched_size = self._size
+        if self._header is not None:
+            size += sys.getsizeof(self._header)
 
-        for match in self._matches:
-            unmatched_size = unmatched_size - match.size
+        return size
 
-        return unmatched_size
+    def get_matches(self):
+        """:return: list of Match in the order they were made"""
+        return self._matches or []
 
     def add_match(self, match):
+        if self._matches is None:
+            self._matches = []
+
         self._matches.append(match)
+        self._unmatched_size -= match.size
+
+        if self._header is not None:
+            self._header['unmatched_size'] = self._unmatched_size
 
     def get_summary(self):
         summary = dict()
@@ -58,16 +155,45 @@ class Order:
         summary['price'] = self.price
         summary['order_type'] = self.order_type.value
         summary['unmatched_size'] = self.get_unmatched_size()
+        summary['cancelled'] = self.cancelled
 
         matches = list()
 
-        for match in self._matches:
+        for match in self._matches or ():
             matches.append(match.get_summary())
 
         summary['matches'] = matches
 
         return summary
 
+    def get_summary_page(self, after=0, limit=None):
+        """
+        Summarise the order with only some of its matches, so that the cost does not grow with the number of matches.
+        Matches are never removed or reordered, so their position is a stable cursor.
+        :param after: int number of matches to skip, i.e. the next_after of the previous page
+        :param limit: int max number of matches, every match after the cursor by default
+        :return: dict of get_summary with the matches of the page, the match_count of the order and the next_after
+                 cursor of the next page, None if there are no more matches yet
+        """
+        if self._header is None:
+            self._header = {
+                'size': self._size,
+                'price': self.price,
+                'order_type': self.order_type.value,
+                'unmatched_size': self._unmatched_size,
+                'cancelled': self.cancelled,
+            }
+
+        all_matches = self._matches or ()
+        end = len(all_matches) if limit is None else min(after + limit, len(all_matches))
+
+        summary = dict(self._header)
+        summary['matches'] = [all_matches[position].get_summary() for position in range(after, end)]
+        summary['match_count'] = len(all_matches)
+        summary['next_after'] = end if end < len(all_matches) else None
+
+        return summary
+
 
 class OrderType(Enum):
     BUY = 'BUY'
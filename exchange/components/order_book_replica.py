@@ -0,0 +1,454 @@
+"""
+Read replicas of an Exchange in shared memory
+
+The process that owns the Exchange publishes a compact binary image of it into a multiprocessing.shared_memory segment
+with an OrderBookReplicaPublisher. Any number of reader processes attach to the segment by name with an
+OrderBookReplica and answer GET /orderBook and GET /order/<order_id> from it, in parallel and without ever waiting for
+the process that matches orders.
+
+The image holds the best price levels of each side of the order book and a ring of order slots with the state and first
+matches of recently changed orders. Every publish is written under a sequence lock: the sequence is odd while the image
+is being written and is bumped to the next even number once it is complete. A reader copies what it needs and only
+uses the copy if the sequence was even and did not change while it was copying, otherwise it copies again. The writer
+never waits for readers. This relies on the stores of the writer becoming visible to the readers in program order, as
+they do on x86-64.
+
+Anything that is not in the image, e.g. more price levels than are published or an order whose slot has been taken by a
+newer order, is None and has to be read from the Exchange itself.
+"""
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from sortedcontainers import SortedDict
+
+from exchange.components.order import OrderType
+from exchange.components.order_id import KEY_BYTES, encode_order_id, get_key
+from exchange.components.unmatched_order_book import UnmatchedOrderBookSummary
+
+REPLICA_MAGIC = b'EXREPL1\n'
+
+# Best price levels published per side of the order book
+MAX_LEVELS = 1000
+
+# Order slots in the ring, an order number always uses slot number % ORDER_SLOTS
+ORDER_SLOTS = 65536
+
+# Matches kept in the slot of an order, a page of matches after these is read from the Exchange
+MATCHES_PER_ORDER = 4
+
+# A reader gives up after this many copies that were changed while they were being copied. After the first few it sleeps
+# between copies, so that a writer that was descheduled in the middle of a publish can finish it.
+MAX_READ_ATTEMPTS = 1000
+_SPINS_BEFORE_SLEEPING = 10
+_RETRY_SLEEP_SECONDS = 0.00005
+
+# Written once when the segment is created:
+# magic, closed flag, token, order id key, max levels, order slots, matches per order
+_LAYOUT = struct.Struct('<8sB8s{0}sQQQ'.format(KEY_BYTES))
+_CLOSED_OFFSET = 8
+
+# Written by every publish: the sequence, then order book version, buy levels, sell levels, flags
+_SEQUENCE = struct.Struct('<Q')
+_SEQUENCE_OFFSET = _LAYOUT.size
+_STATE = struct.Struct('<QQQB')
+_STATE_OFFSET = _SEQUENCE_OFFSET + _SEQUENCE.size
+
+# price, total size as 64 bit words, from the lowest to the highest price on each side. Levels are written with one
+# call for each side, a side with a price or size too big for 64 bits is not replicated at all.
+_LEVEL_WORDS = 2
+# Prices and sizes of orders and matches are unbounded ints in Python, they are kept as two 64 bit words, low word
+# first.
+# order number (0 for an empty slot), type and cancelled flag, price, size, unmatched size, number of matches
+_ORDER = struct.Struct('<QBQQQQQQQ')
+_ORDER_NUMBER = struct.Struct('<Q')
+# buy order number, sell order number, size, price
+_MATCH = struct.Struct('<QQQQQQ')
+
+_ORDER_TYPES = {
+    OrderType.BUY: 0,
+    OrderType.SELL: 1,
+}
+_ORDER_TYPES_BY_CODE = {code: order_type for order_type, code in _ORDER_TYPES.items()}
+
+# Set in the type of an order slot when the order has been cancelled
+_CANCELLED_FLAG = 0x80
+
+# Set in the flags when a side has more price levels than are published, or when it can not be published at all
+_BUY_TRUNCATED = 0x1
+_SELL_TRUNCATED = 0x2
+_BUY_NOT_REPLICATED = 0x4
+_SELL_NOT_REPLICATED = 0x8
+
+_WORD_MASK = (1 << 64) - 1
+
+
+def _get_size(max_levels, order_slots, matches_per_order):
+    """:return: int bytes of a segment with the given layout"""
+    return _STATE_OFFSET + _STATE.size + 2 * max_levels * _LEVEL_WORDS * 8 + \
+        order_slots * (_ORDER.size + matches_per_order * _MATCH.size)
+
+
+class OrderBookReplicaPublisher:
+    """
+    Publishes an Exchange into shared memory for OrderBookReplica readers. Owned by the thread that owns the Exchange.
+
+    The publisher is told about every changed order by the Exchange, see Exchange.set_order_listener, and publish writes
+    the order book, if its version has changed, and the slots of the orders changed since the last publish. Call it
+    after every change that readers should see, e.g. after every request or batch of requests.
+    """
+    def __init__(self, exchange, name, max_levels=MAX_LEVELS, order_slots=ORDER_SLOTS,
+                 matches_per_order=MATCHES_PER_ORDER):
+        """
+        :param exchange: Exchange to publish
+        :param name: str name of the shared memory segment. A segment left with the same name, e.g. by a previous run,
+                     is closed and replaced, readers attached to it move to the new one.
+        :param max_levels: int number of the best price levels published per side
+        :param order_slots: int number of orders kept
+        :param matches_per_order: int number of the first matches of each order kept
+        """
+        self._exchange = exchange
+        self._max_levels = max_levels
+        self._order_slots = order_slots
+        self._matches_per_order = matches_per_order
+        self._slot_size = _ORDER.size + matches_per_order * _MATCH.size
+
+        self._levels_offset = _STATE_OFFSET + _STATE.size
+        self._orders_offset = self._levels_offset + 2 * max_levels * _LEVEL_WORDS * 8
+
+        size = _get_size(max_levels, order_slots, matches_per_order)
+
+        try:
+            self._memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            _close_segment(name)
+            self._memory = shared_memory.SharedMemory(name, create=True, size=size)
+
+        _LAYOUT.pack_into(self._memory.buf, 0, REPLICA_MAGIC, 0, os.urandom(4).hex().encode('ascii'), get_key(),
+                          max_levels, order_slots, matches_per_order)
+
+        self._sequence = 0
+        self._published_version = None
+
+        # Only the newest state of an order is published, however many times it changed since the last publish
+        self._pending_orders = dict()
+        exchange.set_order_listener(self.on_order_change)
+
+        self.publish()
+
+    def get_name(self):
+        return self._memory.name
+
+    def on_order_change(self, order):
+        """Called by the Exchange, see Exchange.set_order_listener"""
+        self._pending_orders[order.id] = order
+
+    def publish(self):
+        """
+        Make the current state of the order book and the orders changed since the last publish visible to readers
+        :return: bool False if nothing had changed
+        """
+        version = self._exchange.get_order_book_version()
+
+        if version == self._published_version and not self._pending_orders:
+            return False
+
+        buffer = self._memory.buf
+
+        # Readers retry until the sequence is even again
+        self._sequence += 1
+        _SEQUENCE.pack_into(buffer, _SEQUENCE_OFFSET, self._sequence)
+
+        if version != self._published_version:
+            self.__write_order_book(buffer, version)
+
+        for order in self._pending_orders.values():
+            self.__write_order(buffer, order)
+
+        self._pending_orders.clear()
+
+        _STATE.pack_into(buffer, _STATE_OFFSET, self._published_version, self._buy_level_count, self._sell_level_count,
+                         self._flags)
+
+        # The even sequence is written last, once everything it covers is in place
+        self._sequence += 1
+        _SEQUENCE.pack_into(buffer, _SEQUENCE_OFFSET, self._sequence)
+
+        return True
+
+    def close(self):
+        """Stop publishing and remove the segment, attached readers move to a new segment with the same name"""
+        self._exchange.set_order_listener(None)
+        self._memory.buf[_CLOSED_OFFSET] = 1
+        self._memory.close()
+        self._memory.unlink()
+
+    def __write_order_book(self, buffer, version):
+        # One more level than is published tells whether a side has been truncated
+        buy_prices, buy_sizes, sell_prices, sell_sizes = self._exchange.get_best_levels(self._max_levels + 1)
+        self._flags = 0
+
+        if len(buy_prices) > self._max_levels:
+            # The best buy levels are the highest prices, drop the lowest
+            del buy_prices[0], buy_sizes[0]
+            self._flags |= _BUY_TRUNCATED
+
+        if len(sell_prices) > self._max_levels:
+            del sell_prices[-1], sell_sizes[-1]
+            self._flags |= _SELL_TRUNCATED
+
+        self._buy_level_count = self.__write_levels(buffer, self._levels_offset, buy_prices, buy_sizes,
+                                                    _BUY_NOT_REPLICATED)
+        self._sell_level_count = self.__write_levels(buffer, self._levels_offset + self._max_levels * _LEVEL_WORDS * 8,
+                                                     sell_prices, sell_sizes, _SELL_NOT_REPLICATED)
+        self._published_version = version
+
+    def __write_levels(self, buffer, offset, prices, sizes, not_replicated_flag):
+        """:return: int number of levels written"""
+        words = [0] * (2 * len(prices))
+        words[0::2] = prices
+        words[1::2] = sizes
+
+        try:
+            struct.pack_into('<{0}Q'.format(len(words)), buffer, offset, *words)
+        except struct.error:
+            self._flags |= not_replicated_flag
+            return 0
+
+        return len(prices)
+
+    def __write_order(self, buffer, order):
+        offset = self._orders_offset + (order.id % self._order_slots) * self._slot_size
+        matches = order.get_matches()
+        size = order.get_size()
+        unmatched_size = order.get_unmatched_size()
+        order_type = _ORDER_TYPES[order.order_type] | (_CANCELLED_FLAG if order.cancelled else 0)
+
+        try:
+            _ORDER.pack_into(buffer, offset, order.id, order_type, order.price & _WORD_MASK, order.price >> 64,
+                             size & _WORD_MASK, size >> 64, unmatched_size & _WORD_MASK, unmatched_size >> 64,
+                             len(matches))
+
+            # Only the first matches of the order are kept
+            match_offset = offset + _ORDER.size
+
+            for match in matches[:self._matches_per_order]:
+                _MATCH.pack_into(buffer, match_offset, match.buy_order_id, match.sell_order_id,
+                                 match.size & _WORD_MASK, match.size >> 64, match.price & _WORD_MASK, match.price >> 64)
+                match_offset += _MATCH.size
+        except struct.error:
+            # Too big for 128 bits, leave the slot empty so that the order is read from the exchange
+            _ORDER_NUMBER.pack_into(buffer, offset, 0)
+
+
+class OrderBookReplica:
+    """
+    Reads the image of an Exchange published by an OrderBookReplicaPublisher, usually in another process.
+
+    Every read is a consistent copy of one publish. Reads return None when the answer is not in the image, then ask the
+    Exchange instead. The replica follows the publisher to a new segment when the publisher is restarted.
+    """
+    def __init__(self, name):
+        """
+        :param name: str name of the shared memory segment, see OrderBookReplicaPublisher
+        :raises FileNotFoundError: if nothing has been published with that name
+        """
+        self._name = name
+        self._memory = None
+        self.__attach()
+
+    def get_token(self):
+        """:return: str random per publisher, so that anything derived from a version is never mistaken for another"""
+        return self._token
+
+    def get_key(self):
+        """:return: bytes key the order ids of the published exchange are encoded with, see order_id.set_key"""
+        return self._key
+
+    def read_version(self):
+        """:return: int version of the published order book, see Exchange.get_order_book_version, or None"""
+        state = self.__read(self.__copy_state)
+        return state[0] if state is not None else None
+
+    def read_order_book(self, depth=None):
+        """
+        :param depth: int number of price levels per side, or None for every level
+        :return: (int version, UnmatchedOrderBookSummary), or None if the image does not have every level asked for
+        """
+        copy = self.__read(self.__copy_order_book, depth)
+
+        if not copy:
+            return None
+
+        version, buy_words, sell_words = copy
+
+        summary = UnmatchedOrderBookSummary()
+        summary.buy_dict = SortedDict(_read_levels(buy_words))
+        summary.sell_dict = SortedDict(_read_levels(sell_words))
+
+        return version, summary
+
+    def read_order_page(self, order_number, after=0, limit=None):
+        """
+        :param order_number: int number of the order, see order_id.decode_order_id
+        :param after: int number of matches to skip
+        :param limit: int max number of matches, every match by default
+        :return: dict in the format of Order.get_summary_page, or None if the order or the page is not in the image
+        """
+        slot = self.__read(self.__copy_order_slot, order_number)
+
+        if not slot:
+            return None
+
+        number, order_type, price_low, price_high, size_low, size_high, unmatched_low, unmatched_high, match_count = \
+            _ORDER.unpack_from(slot, 0)
+
+        if number != order_number:
+            return None
+
+        # The same cursor arithmetic as Order.get_summary_page
+        end = match_count if limit is None else min(after + limit, match_count)
+
+        if after < end and end > self._matches_per_order:
+            return None
+
+        matches = []
+
+        for position in range(after, end):
+            buy_number, sell_number, match_size_low, match_size_high, match_price_low, match_price_high = \
+                _MATCH.unpack_from(slot, _ORDER.size + position * _MATCH.size)
+
+            matches.append({
+                'buy_order_id': encode_order_id(buy_number),
+                'sell_order_id': encode_order_id(sell_number),
+                'size': match_size_low | (match_size_high << 64),
+                'price': match_price_low | (match_price_high << 64),
+            })
+
+        return {
+            'size': size_low | (size_high << 64),
+            'price': price_low | (price_high << 64),
+            'order_type': _ORDER_TYPES_BY_CODE[order_type & ~_CANCELLED_FLAG].value,
+            'unmatched_size': unmatched_low | (unmatched_high << 64),
+            'cancelled': bool(order_type & _CANCELLED_FLAG),
+            'matches': matches,
+            'match_count': match_count,
+            'next_after': end if end < match_count else None,
+        }
+
+    def close(self):
+        self._memory.close()
+
+    def __attach(self):
+        # Only the publisher removes the segment, it must not be removed when this process exits
+        try:
+            memory = shared_memory.SharedMemory(self._name, track=False)
+        except TypeError:
+            # Before Python 3.13 every attached segment is tracked
+            memory = shared_memory.SharedMemory(self._name)
+            resource_tracker.unregister(memory._name, 'shared_memory')
+
+        magic, _, token, self._key, self._max_levels, self._order_slots, self._matches_per_order = \
+            _LAYOUT.unpack_from(memory.buf, 0)
+
+        if magic != REPLICA_MAGIC:
+            memory.close()
+            raise ValueError('{0} is not an order book replica'.format(self._name))
+
+        if self._memory is not None:
+            self._memory.close()
+
+        self._memory = memory
+        self._token = token.decode('ascii')
+        self._slot_size = _ORDER.size + self._matches_per_order * _MATCH.size
+        self._levels_offset = _STATE_OFFSET + _STATE.size
+        self._orders_offset = self._levels_offset + 2 * self._max_levels * _LEVEL_WORDS * 8
+
+    def __read(self, copy, *args):
+        """
+        :param copy: function(buffer, *args) copying what it needs out of the buffer. It must not interpret the copy,
+                     which is thrown away if anything was published while it was being made.
+        :return: the result of copy made while nothing was published, or None if none could be made
+        """
+        if self._memory.buf[_CLOSED_OFFSET]:
+            try:
+                self.__attach()
+            except (FileNotFoundError, ValueError):
+                return None
+
+        buffer = self._memory.buf
+
+        for attempt in range(MAX_READ_ATTEMPTS):
+            if attempt >= _SPINS_BEFORE_SLEEPING:
+                time.sleep(_RETRY_SLEEP_SECONDS)
+
+            sequence = _SEQUENCE.unpack_from(buffer, _SEQUENCE_OFFSET)[0]
+
+            if sequence & 1:
+                continue
+
+            result = copy(buffer, *args)
+
+            if _SEQUENCE.unpack_from(buffer, _SEQUENCE_OFFSET)[0] == sequence:
+                return result
+
+        return None
+
+    @staticmethod
+    def __copy_state(buffer):
+        return _STATE.unpack_from(buffer, _STATE_OFFSET)
+
+    def __copy_order_book(self, buffer, depth):
+        """:return: (version, words of the buy levels, words of the sell levels), or False if they are not all there"""
+        version, buy_level_count, sell_level_count, flags = _STATE.unpack_from(buffer, _STATE_OFFSET)
+
+        if flags & (_BUY_NOT_REPLICATED | _SELL_NOT_REPLICATED):
+            return False
+
+        # Counts in a copy that is about to be thrown away can be anything, never read past the levels
+        buy_level_count = min(buy_level_count, self._max_levels)
+        sell_level_count = min(sell_level_count, self._max_levels)
+
+        if depth is None and flags & (_BUY_TRUNCATED | _SELL_TRUNCATED):
+            return False
+
+        if depth is not None and ((depth > buy_level_count and flags & _BUY_TRUNCATED) or
+                                  (depth > sell_level_count and flags & _SELL_TRUNCATED)):
+            return False
+
+        buy_offset = self._levels_offset
+        sell_offset = self._levels_offset + self._max_levels * _LEVEL_WORDS * 8
+
+        # Only copy the levels asked for. The best buy levels are the highest prices, at the end.
+        if depth is not None:
+            buy_offset += max(buy_level_count - depth, 0) * _LEVEL_WORDS * 8
+            buy_level_count = min(buy_level_count, depth)
+            sell_level_count = min(sell_level_count, depth)
+
+        return version, _copy_words(buffer, buy_offset, buy_level_count * _LEVEL_WORDS), \
+            _copy_words(buffer, sell_offset, sell_level_count * _LEVEL_WORDS)
+
+    def __copy_order_slot(self, buffer, order_number):
+        offset = self._orders_offset + (order_number % self._order_slots) * self._slot_size
+        return bytes(buffer[offset:offset + self._slot_size])
+
+
+def _copy_words(buffer, offset, count):
+    return struct.unpack_from('<{0}Q'.format(count), buffer, offset)
+
+
+def _read_levels(words):
+    """:return: iterable of (price, size) from the words of the levels"""
+    return zip(words[0::2], words[1::2])
+
+
+def _close_segment(name):
+    """Tell the readers of the segment left with name to move to a new one and remove it"""
+    memory = shared_memory.SharedMemory(name)
+
+    if memory.size > _CLOSED_OFFSET:
+        memory.buf[_CLOSED_OFFSET] = 1
+
+    memory.close()
+    memory.unlink()
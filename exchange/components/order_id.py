@@ -0,0 +1,146 @@
+"""
+Order ids
+
+Inside the exchange every order is identified by a number from a counter. Small ints are cheap to create, hash and keep
+as dict keys, where a uuid costs a read of the system random source and a 32 character string per order.
+
+Consecutive numbers would let end users guess the ids of other orders in the REST API, so the number is never shown
+outside the exchange. The external id is the number run through a keyed permutation of 64 bit values and written as 16
+hex characters, which can be turned back into the number with the same key.
+"""
+import os
+import struct
+
+KEY_BYTES = 16
+
+# Order numbers are permuted as 64 bit values
+MAX_ORDER_NUMBER = (1 << 64) - 1
+
+_MASK = 0xffffffff
+_ROUND_KEYS = struct.Struct('<4I')
+
+
+class OrderIdCodec:
+    """
+    Keyed, reversible mapping between order numbers and external order ids.
+
+    The permutation is a 4 round Feistel network over the two 32 bit halves of the number, with a multiply and xor-shift
+    round function keyed by a 32 bit word of the key in each round. Without the key the ids of neighbouring orders look
+    unrelated, so they cannot be guessed by counting. It is an obfuscation to stop enumeration, not a cipher: use a
+    random key and keep it secret, and do not rely on it where ids must resist cryptanalysis.
+    """
+    __slots__ = ('_round_keys',)
+
+    def __init__(self, key):
+        """:param key: bytes of length KEY_BYTES"""
+        if len(key) != KEY_BYTES:
+            raise ValueError('The order id key must be {0} bytes, not {1}'.format(KEY_BYTES, len(key)))
+
+        self._round_keys = _ROUND_KEYS.unpack(key)
+
+    def encode(self, number):
+        """
+        :param number: int order number
+        :return: str external order id, 16 hex characters
+        """
+        if not isinstance(number, int) or not 0 <= number <= MAX_ORDER_NUMBER:
+            raise ValueError('{0} is not an order number'.format(number))
+
+        k0, k1, k2, k3 = self._round_keys
+        left = number >> 32
+        right = number & _MASK
+
+        # The rounds are unrolled and the halves updated in place, which is the same as swapping them every round
+        mixed = ((right ^ k0) * 0x9e3779b1) & _MASK
+        left ^= ((mixed ^ (mixed >> 15)) * 0x85ebca6b) & _MASK
+        mixed = ((left ^ k1) * 0x9e3779b1) & _MASK
+        right ^= ((mixed ^ (mixed >> 15)) * 0x85ebca6b) & _MASK
+        mixed = ((right ^ k2) * 0x9e3779b1) & _MASK
+        left ^= ((mixed ^ (mixed >> 15)) * 0x85ebca6b) & _MASK
+        mixed = ((left ^ k3) * 0x9e3779b1) & _MASK
+        right ^= ((mixed ^ (mixed >> 15)) * 0x85ebca6b) & _MASK
+
+        return format((left << 32) | right, '016x')
+
+    def decode(self, order_id):
+        """
+        :param order_id: str external order id returned by encode
+        :return: int order number, or None if order_id is not an order id
+        """
+        if not isinstance(order_id, str) or len(order_id) != 16:
+            return None
+
+        try:
+            value = int(order_id, 16)
+        except ValueError:
+            return None
+
+        # int accepts signs, underscores and upper case, an id is only ever lower case hex digits
+        if format(value, '016x') != order_id:
+            return None
+
+        k0, k1, k2, k3 = self._round_keys
+        left = value >> 32
+        right = value & _MASK
+
+        # The rounds of encode in reverse
+        mixed = ((left ^ k3) * 0x9e3779b1) & _MASK
+        right ^= ((mixed ^ (mixed >> 15)) * 0x85ebca6b) & _MASK
+        mixed = ((right ^ k2) * 0x9e3779b1) & _MASK
+        left ^= ((mixed ^ (mixed >> 15)) * 0x85ebca6b) & _MASK
+        mixed = ((left ^ k1) * 0x9e3779b1) & _MASK
+        right ^= ((mixed ^ (mixed >> 15)) * 0x85ebca6b) & _MASK
+        mixed = ((right ^ k0) * 0x9e3779b1) & _MASK
+        left ^= ((mixed ^ (mixed >> 15)) * 0x85ebca6b) & _MASK
+
+        return (left << 32) | right
+
+
+# Ids are encoded the same way throughout the process. The key is random unless set, so ids only stay the same across
+# restarts when the key is kept, see set_key and load_or_create_key.
+_codec = OrderIdCodec(os.urandom(KEY_BYTES))
+
+
+def set_key(key):
+    """:param key: bytes of length KEY_BYTES that every order id is encoded with from now on"""
+    global _codec
+    _codec = OrderIdCodec(key)
+
+
+def get_key():
+    """:return: bytes key every order id is encoded with, e.g. to hand to another process serving the same orders"""
+    return _ROUND_KEYS.pack(*_codec._round_keys)
+
+
+def encode_order_id(number):
+    """:return: str external order id of the order number"""
+    return _codec.encode(number)
+
+
+def decode_order_id(order_id):
+    """:return: int order number of the external order id, or None if it is not an order id"""
+    return _codec.decode(order_id)
+
+
+def load_or_create_key(path):
+    """
+    Read the key from path, or create a new random key there if there is none yet. The key has to survive restarts
+    whenever the orders do (journal, snapshot or archive), otherwise the ids already given out stop working.
+    :return: bytes
+    """
+    if os.path.exists(path):
+        with open(path, 'rb') as key_file:
+            return key_file.read()
+
+    key = os.urandom(KEY_BYTES)
+    temporary_path = path + '.tmp'
+
+    # Only the owner can read the key
+    with open(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as key_file:
+        key_file.write(key)
+        key_file.flush()
+        os.fsync(key_file.fileno())
+
+    os.replace(temporary_path, path)
+
+    return key
@@ -0,0 +1,216 @@
+import json
+import sqlite3
+import sys
+from collections import OrderedDict
+
+from exchange.components.memory_report import SAMPLE_SIZE, estimate_bytes, sample
+from exchange.components.order import Order
+
+
+class OrderStore:
+    """
+    Stores every order the exchange has seen in one of three tiers
+
+    - live: orders with unmatched size. These can still change so they are always kept in memory
+    - cache: fully matched orders, kept in memory in a bounded least recently used cache
+    - archive: fully matched orders evicted from the cache, kept on disk in SQLite
+    - snapshot: orders that have not been read out of the Snapshot the exchange was restored from yet. Once an order
+      is read it moves into the live orders or the cache
+
+    Orders are keyed by their int order number, see order_id.
+
+    Fully matched orders never change again, so once an order has been archived it can be reloaded from its summary.
+    Without a max_cached_orders limit nothing is ever evicted. Without an archive_path evicted orders are discarded,
+    which is only useful when the history is not needed (e.g. replaying order flow).
+    """
+    def __init__(self, max_cached_orders=None, archive_path=None, archive_batch_size=1000):
+        if max_cached_orders is not None and max_cached_orders < 0:
+            raise ValueError('max_cached_orders {0} must not be negative'.format(max_cached_orders))
+
+        self._max_cached_orders = max_cached_orders
+        self._archive_batch_size = archive_batch_size
+
+        self._live_orders = dict()
+        self._cached_orders = OrderedDict()
+
+        # Evicted orders are written to the archive in batches, they can still be found while they wait to be written
+        self._pending_archive = dict()
+
+        self._snapshot = None
+
+        self._archive = None
+        if archive_path is not None:
+            # The store is only used by the single thread that owns the Exchange, but that need not be the thread that
+            # created it
+            self._archive = sqlite3.connect(archive_path, check_same_thread=False)
+            self._archive.execute('CREATE TABLE IF NOT EXISTS orders (id INTEGER PRIMARY KEY, summary TEXT NOT NULL)')
+
+        self._cache_hits = 0
+        self._archive_hits = 0
+        self._snapshot_hits = 0
+        self._evictions = 0
+        self._archived = 0
+        self._discarded = 0
+
+    def add(self, order):
+        """Store a new live order"""
+        self._live_orders[order.id] = order
+
+    def set_snapshot(self, snapshot):
+        """
+        Look up any order that is not in memory or in the archive in the Snapshot the exchange was restored from
+        :param snapshot: Snapshot
+        """
+        self._snapshot = snapshot
+
+    def mark_filled(self, order):
+        """
+        The order has been fully matched or cancelled, move it from the live orders into the cache
+        :param order: Order that is no longer in the order book
+        """
+        del self._live_orders[order.id]
+
+        self.__cache(order)
+
+    def iter_orders(self):
+        """
+        Every order that is not in the archive
+        :return: generator of Order
+        """
+        for order in self._live_orders.values():
+            yield order
+
+        for order in self._cached_orders.values():
+            yield order
+
+        if self._snapshot is not None:
+            for order in self._snapshot.iter_unloaded_orders():
+                yield order
+
+    def find(self, order_id):
+        """find will return the object or None"""
+        order = self._live_orders.get(order_id)
+        if order is not None:
+            return order
+
+        order = self._cached_orders.get(order_id)
+        if order is not None:
+            self._cache_hits += 1
+            self._cached_orders.move_to_end(order_id)
+            return order
+
+        summary = self._pending_archive.get(order_id)
+        if summary is None and self._archive is not None:
+            row = self._archive.execute('SELECT summary FROM orders WHERE id = ?', (order_id,)).fetchone()
+            if row is not None:
+                summary = row[0]
+
+        if summary is not None:
+            self._archive_hits += 1
+            return Order.from_summary(order_id, json.loads(summary))
+
+        if self._snapshot is not None:
+            order = self._snapshot.find_order(order_id)
+
+            if order is not None:
+                self._snapshot_hits += 1
+
+                if order.is_open():
+                    self.add(order)
+                else:
+                    self.__cache(order)
+
+                return order
+
+        return None
+
+    def get_metrics(self):
+        metrics = dict()
+
+        metrics['live_orders'] = len(self._live_orders)
+        metrics['cached_orders'] = len(self._cached_orders)
+        metrics['cache_hits'] = self._cache_hits
+        metrics['archive_hits'] = self._archive_hits
+        metrics['snapshot_hits'] = self._snapshot_hits
+        metrics['evictions'] = self._evictions
+        metrics['archived_orders'] = self._archived
+        metrics['discarded_orders'] = self._discarded
+
+        return metrics
+
+    def get_memory_usage(self, sample_size=SAMPLE_SIZE):
+        """
+        Approximate memory of the orders in memory, estimated from sample_size orders of each tier
+        :return: dict of structure name to dict of its count and bytes. The Matches are counted once, as if both of
+                 their orders were in memory.
+        """
+        usage = dict()
+
+        # Estimated entries in the match lists of every order in memory
+        match_references = 0
+        match_size = 0
+
+        for name, orders in (('live_orders', self._live_orders), ('cached_orders', self._cached_orders)):
+            sampled = sample(orders.values(), len(orders), sample_size)
+
+            usage[name] = {
+                'count': len(orders),
+                'bytes': sys.getsizeof(orders) + estimate_bytes(sampled, len(orders), Order.get_memory_size),
+            }
+
+            for order in sampled:
+                matches = order.get_matches()
+                match_references += len(matches) * len(orders) / len(sampled)
+
+                if matches:
+                    match_size = sys.getsizeof(matches[0])
+
+        # Every match is shared by its buy and sell order
+        match_count = int(match_references / 2)
+        usage['matches'] = {'count': match_count, 'bytes': match_count * match_size}
+
+        pending = self._pending_archive
+        usage['pending_archive'] = {
+            'count': len(pending),
+            'bytes': sys.getsizeof(pending) + estimate_bytes(sample(pending.values(), len(pending), sample_size),
+                                                             len(pending), sys.getsizeof),
+        }
+
+        return usage
+
+    def flush(self):
+        """Write any evicted orders that are waiting to be archived"""
+        if not self._pending_archive:
+            return
+
+        self._archive.executemany('INSERT OR REPLACE INTO orders (id, summary) VALUES (?, ?)',
+                                  self._pending_archive.items())
+        self._archive.commit()
+        self._pending_archive.clear()
+
+    def close(self):
+        if self._archive is not None:
+            self.flush()
+            self._archive.close()
+            self._archive = None
+
+    def __cache(self, order):
+        self._cached_orders[order.id] = order
+
+        if self._max_cached_orders is not None:
+            while len(self._cached_orders) > self._max_cached_orders:
+                self.__evict()
+
+    def __evict(self):
+        order_id, order = self._cached_orders.popitem(last=False)
+        self._evictions += 1
+
+        if self._archive is None:
+            self._discarded += 1
+            return
+
+        self._pending_archive[order_id] = json.dumps(order.get_summary())
+        self._archived += 1
+
+        if len(self._pending_archive) >= self._archive_batch_size:
+            self.flush()
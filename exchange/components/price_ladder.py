@@ -0,0 +1,197 @@
+from itertools import islice
+
+from sortedcontainers import SortedList
+
+
+class ArrayPriceLadder(dict):
+    """
+    Price levels of one side of the order book, for instruments that trade in a narrow band of prices.
+
+    Every price in the band [min_price, max_price] has a preallocated slot in a bytearray marking whether there is a
+    level at that price. The lowest and highest occupied slots are kept as cursors so the best price is always known
+    without a sorted index of the prices: adding a level at a new price is O(1) instead of an insertion into a sorted
+    list, and when the best level is removed the cursor moves to the next occupied slot with bytearray.find, which
+    scans in C and is normally only a tick or two away.
+
+    The levels themselves are held in the dict this class extends, so looking up the level at a price costs the same
+    as in a SortedDict. Prices outside the band are still accepted, they are kept in a SortedList so a stray price costs
+    what it would cost in the default order book and never fails.
+
+    Implements the price levels interface the UnmatchedOrderBook needs, the same subset of the SortedDict API:
+    get, in, [], del, len, update, peekitem(0) / peekitem(-1), keys, values, islice and irange. Other dict methods that
+    add or remove prices, e.g. pop or setdefault, do not keep the ladder up to date and must not be used.
+    """
+    def __init__(self, min_price, max_price):
+        """
+        :param min_price: int lowest price of the band
+        :param max_price: int highest price of the band, every price in between gets a slot
+        """
+        if max_price < min_price:
+            raise ValueError('max_price {0} must not be less than min_price {1}'.format(max_price, min_price))
+
+        super().__init__()
+
+        self._min_price = min_price
+        self._max_price = max_price
+        self._occupied = bytearray(max_price - min_price + 1)
+
+        # Number of occupied slots and the indexes of the lowest and highest of them when there are any
+        self._band_count = 0
+        self._lowest = 0
+        self._highest = 0
+
+        # Prices of the levels outside the band
+        self._outside = SortedList()
+
+    def __setitem__(self, price, level):
+        if price not in self:
+            index = price - self._min_price
+
+            if 0 <= index < len(self._occupied):
+                self._occupied[index] = 1
+
+                if not self._band_count:
+                    self._lowest = self._highest = index
+                elif index < self._lowest:
+                    self._lowest = index
+                elif index > self._highest:
+                    self._highest = index
+
+                self._band_count += 1
+            else:
+                self._outside.add(price)
+
+        dict.__setitem__(self, price, level)
+
+    def __delitem__(self, price):
+        dict.__delitem__(self, price)
+
+        index = price - self._min_price
+
+        if not 0 <= index < len(self._occupied):
+            self._outside.remove(price)
+            return
+
+        self._occupied[index] = 0
+        self._band_count -= 1
+
+        # Move the cursors to the next occupied slot, there is at least one between them
+        if self._band_count:
+            if index == self._lowest:
+                self._lowest = self._occupied.find(1, index + 1)
+            elif index == self._highest:
+                self._highest = self._occupied.rfind(1, 0, index)
+
+    def update(self, items):
+        """:param items: iterable of (price, level)"""
+        for price, level in items:
+            self[price] = level
+
+    def peekitem(self, index=-1):
+        """
+        :param index: 0 for the lowest price level or -1 for the highest
+        :return: (price, level)
+        :raises IndexError: if there are no price levels
+        """
+        band_count = self._band_count
+
+        # Every level is in the band, the usual case. The dict length is much cheaper to check than the SortedList.
+        if band_count == len(self):
+            if not band_count:
+                raise IndexError('peekitem from an empty price ladder')
+
+            if index == -1:
+                price = self._min_price + self._highest
+            elif index == 0:
+                price = self._min_price + self._lowest
+            else:
+                raise ValueError('Only the lowest (0) or highest (-1) price level can be peeked, not {0}'.format(index))
+
+            return price, self[price]
+
+        if index == 0:
+            if not band_count or self._outside[0] < self._min_price:
+                price = self._outside[0]
+            else:
+                price = self._min_price + self._lowest
+        elif index == -1:
+            if not band_count or self._outside[-1] > self._max_price:
+                price = self._outside[-1]
+            else:
+                price = self._min_price + self._highest
+        else:
+            raise ValueError('Only the lowest (0) or highest (-1) price level can be peeked, not {0}'.format(index))
+
+        return price, self[price]
+
+    def keys(self):
+        """:return: generator of every price from the lowest to the highest"""
+        for price in self._outside.irange(maximum=self._min_price, inclusive=(True, False)):
+            yield price
+
+        if self._band_count:
+            index = self._lowest
+
+            while index != -1:
+                yield self._min_price + index
+                index = self._occupied.find(1, index + 1, self._highest + 1)
+
+        for price in self._outside.irange(minimum=self._max_price, inclusive=(False, True)):
+            yield price
+
+    __iter__ = keys
+
+    def values(self):
+        """:return: generator of every price level from the lowest to the highest price"""
+        for price in self.keys():
+            yield self[price]
+
+    def islice(self, start=None, stop=None):
+        """
+        :return: iterator of the prices from position start to stop, like SortedDict.islice. The highest prices are
+                 found by walking down from the highest price, so the best n buy prices never visit the rest.
+        """
+        if start is not None and stop is None:
+            return reversed(list(islice(self.__descending_keys(), max(len(self) - start, 0))))
+
+        return islice(self.keys(), start, stop)
+
+    def irange(self, minimum=None, maximum=None):
+        """
+        :param minimum: int lowest price, inclusive, None for no lower bound
+        :param maximum: int highest price, inclusive, None for no upper bound
+        :return: generator of the prices from minimum to maximum, like SortedDict.irange. Only the slots of the band
+                 between them are scanned.
+        """
+        below_band = self._min_price - 1 if maximum is None else min(maximum, self._min_price - 1)
+
+        for price in self._outside.irange(minimum, below_band):
+            yield price
+
+        if self._band_count:
+            lowest = self._lowest if minimum is None else max(minimum - self._min_price, self._lowest)
+            highest = self._highest if maximum is None else min(maximum - self._min_price, self._highest)
+            index = self._occupied.find(1, lowest, highest + 1) if lowest <= highest else -1
+
+            while index != -1:
+                yield self._min_price + index
+                index = self._occupied.find(1, index + 1, highest + 1)
+
+        above_band = self._max_price + 1 if minimum is None else max(minimum, self._max_price + 1)
+
+        for price in self._outside.irange(above_band, maximum):
+            yield price
+
+    def __descending_keys(self):
+        for price in self._outside.irange(minimum=self._max_price, inclusive=(False, True), reverse=True):
+            yield price
+
+        if self._band_count:
+            index = self._highest
+
+            while index != -1:
+                yield self._min_price + index
+                index = self._occupied.rfind(1, self._lowest, index)
+
+        for price in self._outside.irange(maximum=self._min_price, inclusive=(True, False), reverse=True):
+            yield price
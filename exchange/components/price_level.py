@@ -0,0 +1,73 @@
+import sys
+from collections import deque
+
+# A queue is compacted once at least this many of its orders are cancelled and they are more than half of the queue
+_COMPACT_MIN_CANCELLED_ORDERS = 64
+
+
+class PriceLevel:
+    """
+    A FIFO queue of the unmatched orders at a single price.
+
+    The level keeps a running total of the unmatched size of every order it holds so that summarising the order book
+    never has to walk the queue. The total must be kept up to date when the order at the front of the queue is
+    partially matched, see reduce_total_size.
+
+    Cancelling an order does not search the queue for it. The order is marked as cancelled and left in the queue as a
+    tombstone that is skipped when it reaches the front, so a cancel is O(1) however long the queue is. Once tombstones
+    make up most of a long queue the queue is rebuilt without them, which keeps the cost O(1) amortised per cancel.
+    """
+    def __init__(self, price):
+        self.price = price
+        self.total_size = 0
+        self._orders = deque()
+        self._cancelled_orders = 0
+
+    def append(self, order):
+        self._orders.append(order)
+        self.total_size += order.get_unmatched_size()
+
+    def peek(self):
+        self.__skip_cancelled_orders()
+        return self._orders[0]
+
+    def popleft(self):
+        self.__skip_cancelled_orders()
+        order = self._orders.popleft()
+        self.total_size -= order.get_unmatched_size()
+        return order
+
+    def reduce_total_size(self, size):
+        """
+        An order in this level has been matched against an incoming order
+        :param size: int number of units matched
+        """
+        self.total_size -= size
+
+    def cancel(self, order):
+        """
+        Remove an order from the level in O(1)
+        :param order: Order in this level that has just been cancelled
+        """
+        self.total_size -= order.get_unmatched_size()
+        self._cancelled_orders += 1
+
+        if self._cancelled_orders >= _COMPACT_MIN_CANCELLED_ORDERS and self._cancelled_orders * 2 > len(self._orders):
+            self._orders = deque(order for order in self._orders if not order.cancelled)
+            self._cancelled_orders = 0
+
+    def get_memory_size(self):
+        """:return: int bytes of the level and its queue, not counting the orders in it"""
+        return sys.getsizeof(self) + sys.getsizeof(self.__dict__) + sys.getsizeof(self._orders)
+
+    def __len__(self):
+        """:return: int number of orders that have not been cancelled"""
+        return len(self._orders) - self._cancelled_orders
+
+    def __iter__(self):
+        return (order for order in self._orders if not order.cancelled)
+
+    def __skip_cancelled_orders(self):
+        while self._cancelled_orders and self._orders[0].cancelled:
+            self._orders.popleft()
+            self._cancelled_orders -= 1
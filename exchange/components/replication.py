@@ -0,0 +1,646 @@
+"""
+Hot standby replication of an Exchange over a local socket
+
+The primary streams every order and cancel it accepts to any number of standby processes with a ReplicationPublisher:
+the size and price given to submit_buy or submit_sell and the order number it gave the order, in the order they were
+accepted. Each standby applies them to an Exchange of its own with a ReplicationStandby. Matching is deterministic, so a
+standby holds the same order book, orders and trades as the primary, a few records behind it. It can serve reads and be
+promoted to take orders once the primary is gone.
+
+The stream is made of journal records, see journal. The standby opens the connection with STREAM_HEADER and the number
+of records it has applied already, e.g. replayed from a journal of its own. The primary answers with STREAM_HEADER and
+the order id key, sends every record the standby is missing and from then on the records as they are accepted. Records
+are sent in frames: the number of records up to the end of the frame, the number of records the primary had accepted
+when it sent the frame, the time in microseconds the first record of the frame was accepted, the length of the records
+and the records. A frame without records is a heartbeat, sent when nothing has been accepted for a while, so that a
+standby always knows how far behind it is.
+
+Replication is asynchronous: the primary never waits for a standby, and the orders it has acknowledged but not yet sent
+are lost when a standby is promoted. The lag of a standby says how many that would be, see ReplicationStandby.get_lag.
+"""
+import logging
+import os
+import socket
+import stat
+import threading
+import time
+
+from exchange.components.journal import JOURNAL_HEADER, decode_record, decode_varint, encode_cancel, encode_orders, \
+    encode_varint
+from exchange.components.order import OrderType
+from exchange.components.order_id import KEY_BYTES, encode_order_id, get_key, set_key
+
+STREAM_HEADER = b'EXREPLICATION1\n'
+
+# Seconds without anything to send after which the primary sends a heartbeat
+HEARTBEAT_INTERVAL = 0.1
+
+# Seconds a standby waits between attempts to connect to the primary
+RECONNECT_INTERVAL = 0.1
+
+# Bytes of records queued for a standby that does not keep up. Past this it is disconnected, and catches up again from
+# the journal when it reconnects, rather than growing the memory of the primary without bound.
+MAX_PENDING_BYTES = 64 * 1024 * 1024
+
+# Bytes of the journal, or of the records kept in memory, read at once to catch a standby up
+_CATCH_UP_CHUNK_SIZE = 1 << 20
+
+_RECEIVE_SIZE = 1 << 16
+_HANDSHAKE_TIMEOUT = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicationError(Exception):
+    """The primary and a standby do not agree on the records of the stream"""
+
+
+def parse_address(address):
+    """
+    :param address: str 'host:port' of a TCP socket, anything else is the path of a Unix socket
+    :return: (socket family, address to bind or connect to)
+    """
+    host, separator, port = address.rpartition(':')
+
+    if separator and port.isdigit():
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+    return socket.AF_UNIX, address
+
+
+def encode_frame(sequence, primary_sequence, accepted_at, records):
+    """
+    :param sequence: int records sent up to the end of this frame
+    :param primary_sequence: int records the primary had accepted when the frame was sent
+    :param accepted_at: float time the first record of the frame was accepted, see time.time
+    :param records: bytes of journal records, empty for a heartbeat
+    :return: bytearray
+    """
+    frame = bytearray()
+    encode_varint(sequence, frame)
+    encode_varint(primary_sequence, frame)
+    encode_varint(int(accepted_at * 1000000), frame)
+    encode_varint(len(records), frame)
+    frame += records
+
+    return frame
+
+
+def decode_frame(buffer, position):
+    """
+    :return: ((int sequence, int primary sequence, float accepted at, bytes records), int end of the frame), or
+             (None, position) if the buffer holds a partial frame
+    """
+    fields = []
+    cursor = position
+
+    for _ in range(4):
+        value, cursor = decode_varint(buffer, cursor)
+
+        if value is None:
+            return None, position
+
+        fields.append(value)
+
+    sequence, primary_sequence, accepted_at_us, length = fields
+
+    if cursor + length > len(buffer):
+        return None, position
+
+    return (sequence, primary_sequence, accepted_at_us / 1000000.0, bytes(buffer[cursor:cursor + length])), \
+        cursor + length
+
+
+class _Standby:
+    """A standby connected to the primary, with the records queued for it"""
+    def __init__(self, connection, address, sequence):
+        self.connection = connection
+        self.address = address
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.pending = bytearray()
+        self.pending_since = None
+        # Records sent, or queued to be sent, to the standby
+        self.sequence = sequence
+
+    def queue(self, records, events):
+        with self.condition:
+            if not self.pending:
+                self.pending_since = time.time()
+
+            self.pending += records
+            self.sequence += events
+
+            if len(self.pending) > MAX_PENDING_BYTES:
+                logger.warning('Standby {0} is more than {1} bytes behind, disconnecting it'.format(
+                    self.address, MAX_PENDING_BYTES))
+                self.close()
+
+            self.condition.notify()
+
+    def take(self, timeout):
+        """
+        Wait up to timeout seconds for records
+        :return: (bytes records, int sequence, float accepted at of the first record), the records are empty if there
+                 were none
+        """
+        with self.condition:
+            if not self.pending and not self.closed:
+                self.condition.wait(timeout)
+
+            records, accepted_at = bytes(self.pending), self.pending_since or time.time()
+            self.pending = bytearray()
+            self.pending_since = None
+
+            return records, self.sequence, accepted_at
+
+    def close(self):
+        self.closed = True
+
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class ReplicationPublisher:
+    """
+    Streams every order and cancel accepted by the primary Exchange to the standbys that connect to address.
+
+    Pass it to the Exchange as its journal, it looks like a Journal to it. Every record is written to the journal first
+    when there is one, then queued for each standby and sent on a thread of the standby, so a slow or stuck standby
+    never slows down the primary. A standby that connects late catches up from the journal, or from every record kept
+    in memory when there is no journal.
+    """
+    def __init__(self, address, journal=None, heartbeat_interval=HEARTBEAT_INTERVAL, metrics=None):
+        """
+        :param address: str to listen on, see parse_address
+        :param journal: Journal to write the records to before they are sent, optional
+        :param heartbeat_interval: float seconds
+        :param metrics: Metrics to export the number of standbys in
+        """
+        self._journal = journal
+        self._heartbeat_interval = heartbeat_interval
+
+        # Without a journal to catch standbys up from, every record is kept
+        self._history = bytearray() if journal is None else None
+        self._sequence = sum(1 for _ in journal.entries()) if journal is not None else 0
+
+        # Held while records are queued and while a standby is added, so that it gets every record exactly once
+        self._lock = threading.Lock()
+        self._standbys = []
+
+        family, self._address = parse_address(address)
+        self._listener = _listen(family, self._address)
+
+        if metrics is not None:
+            metrics.gauge('exchange_replication_standbys', 'Standbys the records are streamed to',
+                          lambda: len(self._standbys))
+
+        threading.Thread(target=self.__accept, name='exchange-replication', daemon=True).start()
+
+    def append(self, order):
+        self.append_batch([order])
+
+    def append_batch(self, orders):
+        if orders:
+            self.append_records(encode_orders(orders), len(orders))
+
+    def append_cancel(self, order_id):
+        self.append_records(encode_cancel(order_id), 1)
+
+    def append_records(self, records, events):
+        """
+        Journal records and queue them for every standby
+        :param records: bytes of events records, see journal.encode_orders
+        """
+        with self._lock:
+            # Journalled with the lock held, so that a standby catching up from the journal never reads a record that
+            # is not counted in the sequence yet and then gets it again from its queue
+            if self._journal is not None:
+                self._journal.append_records(records, events)
+
+            self._sequence += events
+
+            if self._history is not None:
+                self._history += records
+
+            for standby in self._standbys:
+                standby.queue(records, events)
+
+    def get_offset(self):
+        """:return: int offset of the end of the last record, in the journal or in the records kept without one"""
+        if self._journal is not None:
+            return self._journal.get_offset()
+
+        return len(self._history)
+
+    def entries(self, offset=None):
+        """
+        :param offset: int offset of the end of a record to only read the records after, see get_offset
+        :return: iterable of JournalEntry of every record so far
+        """
+        if self._journal is not None:
+            return self._journal.entries(offset)
+
+        return _decode_records(bytes(self._history[offset or 0:]))
+
+    def sync(self):
+        if self._journal is not None:
+            self._journal.sync()
+
+    def get_sequence(self):
+        """:return: int records accepted so far"""
+        return self._sequence
+
+    def get_status(self):
+        """:return: dict with the records accepted so far and the records queued for each standby"""
+        with self._lock:
+            standbys = [{'address': str(standby.address), 'pending_bytes': len(standby.pending)}
+                        for standby in self._standbys]
+
+        return {'sequence': self._sequence, 'standbys': standbys}
+
+    def close(self):
+        """Stop listening, disconnect every standby and close the journal"""
+        self._listener.close()
+
+        with self._lock:
+            for standby in self._standbys:
+                standby.close()
+
+        if isinstance(self._address, str) and os.path.exists(self._address):
+            os.unlink(self._address)
+
+        if self._journal is not None:
+            self._journal.close()
+
+    def __accept(self):
+        while True:
+            try:
+                connection, address = self._listener.accept()
+            except OSError:
+                # Closed
+                return
+
+            threading.Thread(target=self.__serve, args=(connection, address or self._address),
+                             name='exchange-replication-standby', daemon=True).start()
+
+    def __serve(self, connection, address):
+        standby = None
+
+        try:
+            _set_no_delay(connection)
+            connection.settimeout(_HANDSHAKE_TIMEOUT)
+            applied = _read_hello(connection)
+            connection.settimeout(None)
+
+            with self._lock:
+                if applied > self._sequence:
+                    raise ReplicationError('Standby {0} has applied {1} records, the primary has only accepted {2}'
+                                           .format(address, applied, self._sequence))
+
+                chunks = self.__read_chunks()
+                standby = _Standby(connection, address, self._sequence)
+                self._standbys.append(standby)
+
+            logger.info('Standby {0} connected, catching up from record {1}'.format(address, applied))
+            connection.sendall(STREAM_HEADER + get_key())
+
+            for records, sequence in _split_records(chunks, applied):
+                connection.sendall(encode_frame(sequence, self._sequence, time.time(), records))
+
+            while not standby.closed:
+                records, sequence, accepted_at = standby.take(self._heartbeat_interval)
+                connection.sendall(encode_frame(sequence, self._sequence, accepted_at, records))
+        except (OSError, ReplicationError) as error:
+            logger.warning('Standby {0} disconnected: {1}'.format(address, error))
+        finally:
+            if standby is not None:
+                with self._lock:
+                    self._standbys.remove(standby)
+
+            connection.close()
+
+    def __read_chunks(self):
+        """Call with the lock held. :return: iterable of bytes of every record accepted so far."""
+        if self._history is not None:
+            history = bytes(self._history)
+            return (history[start:start + _CATCH_UP_CHUNK_SIZE]
+                    for start in range(0, len(history), _CATCH_UP_CHUNK_SIZE))
+
+        return _read_journal_chunks(self._journal.path, os.path.getsize(self._journal.path))
+
+
+class ReplicationStandby:
+    """
+    Applies the records streamed by the ReplicationPublisher of the primary at address to exchange, on a thread of its
+    own, until it is promoted. The connection is opened again whenever it is lost and the standby picks up where it
+    left off.
+
+    The exchange is changed with lock held, hold it to read the exchange from any other thread.
+    """
+    def __init__(self, exchange, address, lock=None, reconnect_interval=RECONNECT_INTERVAL, metrics=None,
+                 clock=time.time):
+        """
+        :param exchange: Exchange holding every record applied so far, e.g. recovered from a journal
+        :param address: str of the primary, see parse_address
+        :param lock: threading.Lock, a new one by default
+        :param reconnect_interval: float seconds
+        :param metrics: Metrics to export the lag in
+        :param clock: function returning the seconds since the epoch, the same clock as the primary
+        """
+        self.lock = lock if lock is not None else threading.Lock()
+
+        self._exchange = exchange
+        self._family, self._address = parse_address(address)
+        self._reconnect_interval = reconnect_interval
+        self._clock = clock
+
+        self._applied_sequence = exchange.get_accepted_orders()
+        self._primary_sequence = self._applied_sequence
+        self._lag_seconds = 0.0
+        self._heard_from_primary_at = None
+
+        self._connection = None
+        self._failed = False
+        self._promoted = threading.Event()
+        self._thread = threading.Thread(target=self.__run, name='exchange-standby', daemon=True)
+
+        # Called with the lock held after every batch of records, see add_batch_listener
+        self._batch_listeners = []
+
+        if metrics is not None:
+            metrics.gauge('exchange_replication_lag_records', 'Records accepted by the primary not yet applied',
+                          lambda: self.get_lag()['lag_records'])
+            metrics.gauge('exchange_replication_lag_seconds', 'Seconds from the primary accepting a record to the '
+                          'standby applying it', lambda: self.get_lag()['lag_seconds'])
+
+    def start(self):
+        self._thread.start()
+
+    def promote(self, timeout=None):
+        """
+        Stop applying records. Once this returns the exchange is no longer changed by the standby and can take orders.
+        Do not hold the lock while calling this.
+        :param timeout: float seconds to wait for the batch being applied, if any
+        :return: int records applied
+        """
+        self._promoted.set()
+
+        # Wake the thread up from waiting for records
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+        logger.warning('Promoted after applying {0} records, the primary had accepted {1}'.format(
+            self._applied_sequence, self._primary_sequence))
+
+        return self._applied_sequence
+
+    def is_promoted(self):
+        return self._promoted.is_set()
+
+    def add_batch_listener(self, batch_listener):
+        """
+        :param batch_listener: function(exchange) called with the lock held after every batch of records is applied,
+                               e.g. to publish the exchange to read replicas
+        """
+        self._batch_listeners.append(batch_listener)
+
+    def get_lag(self):
+        """
+        :return: dict with the records applied, the records the primary had accepted when it last sent anything, how
+                 many those are ahead, the seconds from the primary accepting the last batch to the standby applying it,
+                 the seconds since the primary last sent anything, None if it never has, and whether the standby
+                 stopped following the primary because a record could not be applied
+        """
+        heard_from_primary_at = self._heard_from_primary_at
+
+        return {
+            'connected': self._connection is not None,
+            'promoted': self.is_promoted(),
+            'failed': self._failed,
+            'applied_sequence': self._applied_sequence,
+            'primary_sequence': self._primary_sequence,
+            'lag_records': max(self._primary_sequence - self._applied_sequence, 0),
+            'lag_seconds': self._lag_seconds,
+            'seconds_since_primary': self._clock() - heard_from_primary_at if heard_from_primary_at else None,
+        }
+
+    def __run(self):
+        while not self._promoted.is_set():
+            try:
+                connection = socket.socket(self._family, socket.SOCK_STREAM)
+                connection.connect(self._address)
+            except OSError:
+                connection.close()
+                self._promoted.wait(self._reconnect_interval)
+                continue
+
+            self._connection = connection
+
+            # promote may have looked for the connection before it was set
+            if self._promoted.is_set():
+                break
+
+            try:
+                self.__follow(connection)
+            except (OSError, ReplicationError) as error:
+                if not self._promoted.is_set():
+                    logger.warning('Lost the primary at {0}: {1}'.format(self._address, error))
+            except Exception:
+                # The exchange may be part way through a batch, it can not follow the primary any more
+                logger.exception('Stopped following the primary at {0} after applying {1} records'.format(
+                    self._address, self._applied_sequence))
+                self._failed = True
+                return
+            finally:
+                self._connection = None
+                connection.close()
+
+            self._promoted.wait(self._reconnect_interval)
+
+    def __follow(self, connection):
+        _set_no_delay(connection)
+
+        hello = bytearray(STREAM_HEADER)
+        encode_varint(self._applied_sequence, hello)
+        connection.sendall(hello)
+
+        reply = _receive_exactly(connection, len(STREAM_HEADER) + KEY_BYTES)
+        if reply[:len(STREAM_HEADER)] != STREAM_HEADER:
+            raise ReplicationError('{0} is not an exchange primary'.format(self._address))
+
+        # Order ids are encoded the same way as in the primary
+        set_key(reply[len(STREAM_HEADER):])
+
+        buffer = bytearray()
+
+        while True:
+            received = connection.recv(_RECEIVE_SIZE)
+            if not received:
+                raise ReplicationError('The primary closed the connection')
+
+            buffer += received
+            frames = []
+            position = 0
+
+            while True:
+                frame, position = decode_frame(buffer, position)
+                if frame is None:
+                    break
+
+                frames.append(frame)
+
+            del buffer[:position]
+
+            if frames:
+                with self.lock:
+                    # Nothing is applied once promoted, the exchange may already be taking orders
+                    if self._promoted.is_set():
+                        return
+
+                    self.__apply(frames)
+
+    def __apply(self, frames):
+        for sequence, primary_sequence, accepted_at, records in frames:
+            for entry in _decode_records(records):
+                if entry.cancel:
+                    self._exchange.cancel(encode_order_id(entry.order_id))
+                elif entry.order_type == OrderType.BUY:
+                    self._exchange.submit_buy(entry.size, entry.price, order_number=entry.order_id)
+                else:
+                    self._exchange.submit_sell(entry.size, entry.price, order_number=entry.order_id)
+
+                self._applied_sequence += 1
+
+            if self._applied_sequence != sequence:
+                raise ReplicationError('Applied {0} records, the primary sent {1}'.format(
+                    self._applied_sequence, sequence))
+
+            now = self._clock()
+            self._primary_sequence = primary_sequence
+            self._heard_from_primary_at = now
+
+            if records:
+                self._lag_seconds = max(now - accepted_at, 0.0)
+            elif sequence == primary_sequence:
+                self._lag_seconds = 0.0
+
+        for batch_listener in self._batch_listeners:
+            batch_listener(self._exchange)
+
+
+def _listen(family, address):
+    listener = socket.socket(family, socket.SOCK_STREAM)
+
+    if family == socket.AF_UNIX:
+        # Left behind by a primary that did not close it
+        if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+            os.unlink(address)
+    else:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    listener.bind(address)
+    listener.listen()
+
+    return listener
+
+
+def _set_no_delay(connection):
+    if connection.family != socket.AF_UNIX:
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def _read_hello(connection):
+    """:return: int records the standby has applied"""
+    buffer = bytearray(_receive_exactly(connection, len(STREAM_HEADER)))
+
+    if buffer != STREAM_HEADER:
+        raise ReplicationError('Not an exchange standby')
+
+    while True:
+        buffer += _receive_exactly(connection, 1)
+        applied, end = decode_varint(buffer, len(STREAM_HEADER))
+
+        if applied is not None:
+            return applied
+
+
+def _receive_exactly(connection, size):
+    data = bytearray()
+
+    while len(data) < size:
+        received = connection.recv(size - len(data))
+        if not received:
+            raise ReplicationError('Connection closed during the handshake')
+
+        data += received
+
+    return bytes(data)
+
+
+def _read_journal_chunks(path, end):
+    """:return: generator of bytes of the records of the journal at path, up to offset end"""
+    with open(path, 'rb') as journal_file:
+        journal_file.seek(len(JOURNAL_HEADER))
+        remaining = end - len(JOURNAL_HEADER)
+
+        while remaining > 0:
+            chunk = journal_file.read(min(_CATCH_UP_CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _split_records(chunks, skip):
+    """
+    :param chunks: iterable of bytes of records, split anywhere
+    :param skip: int records at the start to leave out
+    :return: generator of (bytes of whole records, int records up to the end of them)
+    """
+    buffer = b''
+    sequence = 0
+
+    for chunk in chunks:
+        buffer = buffer + chunk
+        start = position = 0
+
+        while True:
+            entry, end = decode_record(buffer, position)
+            if entry is None:
+                break
+
+            sequence += 1
+            position = end
+
+            if sequence <= skip:
+                start = position
+
+        if position > start:
+            yield buffer[start:position], sequence
+
+        buffer = buffer[position:]
+
+
+def _decode_records(records):
+    """:return: generator of JournalEntry of bytes of whole records"""
+    position = 0
+
+    while position < len(records):
+        entry, position = decode_record(records, position)
+
+        if entry is None:
+            raise ReplicationError('Partial record in a frame')
+
+        yield entry
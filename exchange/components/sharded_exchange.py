@@ -0,0 +1,270 @@
+import multiprocessing
+import re
+import threading
+import zlib
+
+from exchange.components.exchange import Exchange
+
+# Symbols are part of the order ids, keep them to characters that are safe in a URL
+_SYMBOL_PATTERN = re.compile(r'^[A-Za-z0-9_.]+$')
+
+
+class ShardedExchange:
+    """
+    Trades many symbols, each with its own Exchange, across several worker processes.
+
+    Every symbol is owned by exactly one worker process (shard), chosen by a stable hash of the symbol, so independent
+    symbols are matched in parallel on different cores. The order ids returned encode the shard and the symbol so that
+    any order can be routed back to the Exchange that holds it: <shard>-<symbol>-<order id in that exchange>.
+
+    The Exchange of a symbol is created by exchange_factory when the first order for the symbol is submitted to its
+    shard, e.g. recovering it from its journal after a restart. Reads and cancels never create one: the order book of
+    a symbol without an exchange is empty and its order ids are not found.
+
+    Requests to a shard are sent over a pipe and wait for the answer. Each shard handles one request at a time, callers
+    on different threads only wait for each other when they use the same shard.
+    """
+    def __init__(self, number_of_shards, exchange_factory=None):
+        """
+        :param number_of_shards: int number of worker processes
+        :param exchange_factory: picklable function taking a symbol and returning a new Exchange for it, defaults to an
+                                 empty in memory Exchange
+        """
+        if number_of_shards < 1:
+            raise ValueError('number_of_shards {0} must be at least 1'.format(number_of_shards))
+
+        self._connections = []
+        self._locks = []
+        self._processes = []
+
+        for shard in range(number_of_shards):
+            connection, worker_connection = multiprocessing.Pipe()
+
+            process = multiprocessing.Process(
+                target=_run_shard,
+                args=(shard, worker_connection, exchange_factory or _create_exchange),
+                name='exchange-shard-{0}'.format(shard),
+                daemon=True
+            )
+            process.start()
+
+            self._connections.append(connection)
+            self._locks.append(threading.Lock())
+            self._processes.append(process)
+
+    def get_shard(self, symbol):
+        """:return: int index of the shard that owns the symbol"""
+        _check_symbol(symbol)
+        return zlib.crc32(symbol.encode('ascii')) % len(self._connections)
+
+    def submit_buy(self, symbol, size, price):
+        """:return: str order id"""
+        return self.__request(self.get_shard(symbol), 'submit_buy', symbol, size, price)
+
+    def submit_sell(self, symbol, size, price):
+        """:return: str order id"""
+        return self.__request(self.get_shard(symbol), 'submit_sell', symbol, size, price)
+
+    def submit_batch(self, symbol, orders):
+        """
+        :param orders: iterable of (OrderType, size, price) for the symbol
+        :return: list with a dict for each order, either {'order_id': id} or {'rejected': reason}
+        """
+        return self.__request(self.get_shard(symbol), 'submit_batch', symbol, list(orders))
+
+    def find_order_summary(self, order_id, after=0, limit=None):
+        """
+        :param order_id: str order id returned by submit_buy, submit_sell or submit_batch
+        :param after: int number of matches to skip
+        :param limit: int max number of matches, every match by default
+        :return: dict summary of the order with a page of its matches (see Order.get_summary_page) or None
+        """
+        shard, symbol, exchange_order_id = _split_order_id(order_id)
+
+        if shard is None or shard >= len(self._connections) or not _SYMBOL_PATTERN.match(symbol):
+            return None
+
+        return self.__request(shard, 'find_order_summary', symbol, exchange_order_id, after, limit)
+
+    def cancel(self, order_id, limit=None):
+        """
+        :param order_id: str order id returned by submit_buy, submit_sell or submit_batch
+        :param limit: int max number of matches in the summary, every match by default
+        :return: dict summary of the cancelled order with its first matches, or None if it has already been fully
+                 matched or cancelled
+        :raises KeyError: if there is no such order
+        """
+        shard, symbol, exchange_order_id = _split_order_id(order_id)
+
+        if shard is None or shard >= len(self._connections) or not _SYMBOL_PATTERN.match(symbol):
+            raise KeyError(order_id)
+
+        return self.__request(shard, 'cancel', symbol, exchange_order_id, limit)
+
+    def get_exchange_summary(self, symbol):
+        """:return: UnmatchedOrderBookSummary"""
+        return self.__request(self.get_shard(symbol), 'get_exchange_summary', symbol)
+
+    def get_exchange_depth(self, symbol, n):
+        """:return: UnmatchedOrderBookSummary of the best n price levels on each side"""
+        return self.__request(self.get_shard(symbol), 'get_exchange_depth', symbol, n)
+
+    def get_exchange_range(self, symbol, min_price=None, max_price=None, bucket=None):
+        """:return: UnmatchedOrderBookSummary of the price levels from min_price to max_price, see Exchange"""
+        return self.__request(self.get_shard(symbol), 'get_exchange_range', symbol, min_price, max_price, bucket)
+
+    def get_symbol_order_book(self, symbol):
+        """
+        The order book of one symbol with the order book methods of an Exchange, e.g. for OrderBookQuery
+        :return: SymbolOrderBook
+        :raises ValueError: if the symbol is not valid
+        """
+        _check_symbol(symbol)
+        return SymbolOrderBook(self, symbol)
+
+    def close(self):
+        for connection, lock, process in zip(self._connections, self._locks, self._processes):
+            with lock:
+                connection.send(None)
+                connection.close()
+
+            process.join()
+
+    def __request(self, shard, method, *args):
+        with self._locks[shard]:
+            self._connections[shard].send((method, args))
+            succeeded, result = self._connections[shard].recv()
+
+        if not succeeded:
+            raise result
+
+        return result
+
+
+class SymbolOrderBook:
+    """
+    The order book of one symbol of a ShardedExchange, read like the order book of an Exchange
+    """
+    def __init__(self, sharded_exchange, symbol):
+        self._sharded_exchange = sharded_exchange
+        self._symbol = symbol
+
+    def get_exchange_summary(self):
+        return self._sharded_exchange.get_exchange_summary(self._symbol)
+
+    def get_exchange_depth(self, n):
+        return self._sharded_exchange.get_exchange_depth(self._symbol, n)
+
+    def get_exchange_range(self, min_price=None, max_price=None, bucket=None):
+        return self._sharded_exchange.get_exchange_range(self._symbol, min_price, max_price, bucket)
+
+
+class _Shard:
+    """
+    The exchanges owned by one worker process. Order ids leave the shard in the <shard>-<symbol>-<order id> format.
+    """
+    def __init__(self, shard, exchange_factory):
+        self._shard = shard
+        self._exchange_factory = exchange_factory
+        self._exchanges = dict()
+
+        # Read for the order book of a symbol without an exchange, only orders create one
+        self._no_orders = Exchange()
+
+    def submit_buy(self, symbol, size, price):
+        return self.__order_id(symbol, self.__get_exchange(symbol).submit_buy(size=size, price=price))
+
+    def submit_sell(self, symbol, size, price):
+        return self.__order_id(symbol, self.__get_exchange(symbol).submit_sell(size=size, price=price))
+
+    def submit_batch(self, symbol, orders):
+        results = self.__get_exchange(symbol).submit_batch(orders)
+
+        for result in results:
+            if 'order_id' in result:
+                result['order_id'] = self.__order_id(symbol, result['order_id'])
+
+        return results
+
+    def find_order_summary(self, symbol, order_id, after, limit):
+        if symbol not in self._exchanges:
+            return None
+
+        return self.__summarise(symbol, self._exchanges[symbol].find_order(order_id), after, limit)
+
+    def cancel(self, symbol, order_id, limit):
+        if symbol not in self._exchanges:
+            raise KeyError(order_id)
+
+        return self.__summarise(symbol, self._exchanges[symbol].cancel(order_id), 0, limit)
+
+    def get_exchange_summary(self, symbol):
+        return self.__find_exchange(symbol).get_exchange_summary()
+
+    def get_exchange_depth(self, symbol, n):
+        return self.__find_exchange(symbol).get_exchange_depth(n)
+
+    def get_exchange_range(self, symbol, min_price, max_price, bucket):
+        return self.__find_exchange(symbol).get_exchange_range(min_price, max_price, bucket)
+
+    def __summarise(self, symbol, order, after, limit):
+        if order is None:
+            return None
+
+        summary = order.get_summary_page(after, limit)
+
+        for match in summary['matches']:
+            match['buy_order_id'] = self.__order_id(symbol, match['buy_order_id'])
+            match['sell_order_id'] = self.__order_id(symbol, match['sell_order_id'])
+
+        return summary
+
+    def __find_exchange(self, symbol):
+        """:return: Exchange of the symbol, an empty one if no order has been submitted for it"""
+        return self._exchanges.get(symbol, self._no_orders)
+
+    def __get_exchange(self, symbol):
+        """:return: Exchange of the symbol, created the first time an order is submitted for it"""
+        if symbol not in self._exchanges:
+            self._exchanges[symbol] = self._exchange_factory(symbol)
+
+        return self._exchanges[symbol]
+
+    def __order_id(self, symbol, order_id):
+        return '{0}-{1}-{2}'.format(self._shard, symbol, order_id)
+
+
+def _run_shard(shard, connection, exchange_factory):
+    shard_exchanges = _Shard(shard, exchange_factory)
+
+    while True:
+        request = connection.recv()
+
+        if request is None:
+            return
+
+        method, args = request
+
+        try:
+            connection.send((True, getattr(shard_exchanges, method)(*args)))
+        except Exception as error:
+            connection.send((False, error))
+
+
+def _create_exchange(symbol):
+    return Exchange()
+
+
+def _check_symbol(symbol):
+    if not isinstance(symbol, str) or not _SYMBOL_PATTERN.match(symbol):
+        raise ValueError('Symbol {0} must only contain letters, digits, _ and .'.format(symbol))
+
+
+def _split_order_id(order_id):
+    """:return: (int shard, str symbol, str order id in the symbol's exchange), shard is None if the id is invalid"""
+    parts = order_id.split('-', 2)
+
+    if len(parts) != 3 or not parts[0].isdigit():
+        return None, None, None
+
+    return int(parts[0]), parts[1], parts[2]
@@ -0,0 +1,295 @@
+import mmap
+import os
+import struct
+
+from sortedcontainers import SortedDict
+
+from exchange.components.match import Match
+from exchange.components.order import Order, OrderType
+from exchange.components.price_level import PriceLevel
+from exchange.components.unmatched_order_book import UnmatchedOrderBook
+
+SNAPSHOT_MAGIC = b'EXSNAP5\n'
+
+# Every section is made of fixed width little endian records so that any record can be read straight out of the
+# memory mapped file without parsing the records before it.
+# Prices and sizes are unbounded ints in Python, they are stored as 128 bit unsigned ints. Order ids are the 64 bit
+# order numbers, see order_id.
+# magic, accepted orders, journal offset, next trade sequence, next order number, levels, queued orders, orders, matches
+_HEADER = struct.Struct('<8sQQQQQQQQ')
+_LEVEL = struct.Struct('<B16s16sQQ')  # side, price, total size, first queue entry, number of orders
+_QUEUE_ENTRY = struct.Struct('<Q')  # index of the order record, in FIFO order
+# id, type and cancelled flag, price, size, unmatched size, first match, number of matches
+_ORDER = struct.Struct('<QB16s16s16sQQ')
+_ORDER_ID = struct.Struct('<Q')  # the start of an order record
+_MATCH = struct.Struct('<QQ16s16sQ')  # buy order id, sell order id, size, price, sequence (0 if none)
+
+_ORDER_TYPES = {
+    OrderType.BUY: 0,
+    OrderType.SELL: 1,
+}
+_ORDER_TYPES_BY_CODE = {code: order_type for order_type, code in _ORDER_TYPES.items()}
+
+# Set in the type of an order record when the order has been cancelled
+_CANCELLED_FLAG = 0x80
+
+_INT_BYTES = 16
+
+
+class Snapshot:
+    """
+    A point in time binary image of an Exchange: the price levels, the FIFO queue of each level, the unmatched size of
+    every order and the index of every order held in memory with its matches.
+
+    Restoring memory maps the file and rebuilds lazily. Only the price levels and their total sizes are read up front,
+    so the order book can be summarised straight away. The orders in a level are only read when the level is first
+    matched against, and any other order is only read when it is looked up. Order records are sorted by id so a lookup
+    is a binary search of the mapped file.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.accepted_orders, self.journal_offset, self.next_trade_sequence, self.next_order_number, \
+            self._level_count, queue_count, self._order_count, match_count = _HEADER.unpack_from(self._mmap, 0)
+
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('{0} is not an exchange snapshot'.format(path))
+
+        self._levels_offset = _HEADER.size
+        self._queue_offset = self._levels_offset + self._level_count * _LEVEL.size
+        self._orders_offset = self._queue_offset + queue_count * _QUEUE_ENTRY.size
+        self._matches_offset = self._orders_offset + self._order_count * _ORDER.size
+
+        # An order is only ever read out of the snapshot once, after that it is owned by the OrderStore
+        self._loaded = bytearray(self._order_count)
+
+    @staticmethod
+    def read_journal_offset(path):
+        """:return: int offset of the end of the journal when the snapshot at path was written, 0 without a journal"""
+        with open(path, 'rb') as snapshot_file:
+            header = snapshot_file.read(_HEADER.size)
+
+        if len(header) != _HEADER.size or header[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError('{0} is not an exchange snapshot'.format(path))
+
+        return _HEADER.unpack(header)[2]
+
+    @staticmethod
+    def write(path, order_book, orders, accepted_orders, next_trade_sequence, next_order_number, journal_offset=0):
+        """
+        Write a snapshot. The snapshot is written to a temporary file and then moved into place, so a crash never leaves
+        a partially written snapshot at path.
+        :param path: str
+        :param order_book: UnmatchedOrderBook
+        :param orders: iterable of every Order to index, including every order in the order book
+        :param accepted_orders: int number of orders accepted by the exchange, i.e. the position in the journal
+        :param next_trade_sequence: int sequence number the TradeTape gives the next match
+        :param next_order_number: int number the exchange gives the next order
+        :param journal_offset: int offset of the end of the journal of the accepted orders, see Journal.get_offset, 0
+                               without a journal
+        """
+        orders = sorted(orders, key=lambda order: order.id)
+        order_indexes = {order.id: index for index, order in enumerate(orders)}
+
+        levels = []
+        queue = []
+
+        for side, price_levels in ((OrderType.BUY, order_book.get_buy_levels()),
+                                   (OrderType.SELL, order_book.get_sell_levels())):
+            for level in price_levels:
+                levels.append(_LEVEL.pack(_ORDER_TYPES[side], _pack_int(level.price), _pack_int(level.total_size),
+                                          len(queue), len(level)))
+                queue.extend(_QUEUE_ENTRY.pack(order_indexes[order.id]) for order in level)
+
+        order_records = []
+        match_records = []
+
+        for order in orders:
+            matches = order.get_matches()
+
+            order_type = _ORDER_TYPES[order.order_type] | (_CANCELLED_FLAG if order.cancelled else 0)
+
+            order_records.append(_ORDER.pack(order.id, order_type,
+                                             _pack_int(order.price), _pack_int(order.get_size()),
+                                             _pack_int(order.get_unmatched_size()), len(match_records), len(matches)))
+            match_records.extend(_MATCH.pack(match.buy_order_id, match.sell_order_id,
+                                             _pack_int(match.size), _pack_int(match.price), match.sequence or 0)
+                                 for match in matches)
+
+        temporary_path = path + '.tmp'
+
+        with open(temporary_path, 'wb') as snapshot_file:
+            snapshot_file.write(_HEADER.pack(SNAPSHOT_MAGIC, accepted_orders, journal_offset, next_trade_sequence,
+                                             next_order_number, len(levels), len(queue), len(orders),
+                                             len(match_records)))
+            for section in (levels, queue, order_records, match_records):
+                snapshot_file.write(b''.join(section))
+
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+
+        os.replace(temporary_path, path)
+
+    def load_order_book(self, find_order, price_levels_factory=SortedDict):
+        """
+        Rebuild the order book. The orders in each level are read when the level is first used.
+        :param find_order: function returning the Order for an order number, used so that the order book holds the same
+                           Order objects as the OrderStore
+        :param price_levels_factory: backend for the price levels, see UnmatchedOrderBook
+        :return: UnmatchedOrderBook
+        """
+        buy_levels = []
+        sell_levels = []
+
+        for index in range(self._level_count):
+            side, price, total_size, queue_start, order_count = \
+                _LEVEL.unpack_from(self._mmap, self._levels_offset + index * _LEVEL.size)
+
+            level = _SnapshotPriceLevel(
+                price=_unpack_int(price),
+                total_size=_unpack_int(total_size),
+                order_count=order_count,
+                load_orders=self.__order_loader(queue_start, order_count, find_order)
+            )
+
+            if _ORDER_TYPES_BY_CODE[side] == OrderType.BUY:
+                buy_levels.append(level)
+            else:
+                sell_levels.append(level)
+
+        return UnmatchedOrderBook.from_levels(buy_levels, sell_levels, price_levels_factory)
+
+    def find_order(self, order_id):
+        """
+        Read an order out of the snapshot. Each order is only returned once, after that the caller owns it.
+        :param order_id: int order number
+        :return: Order or None if the order is not in the snapshot or has already been read
+        """
+        # Binary search of the order records, which are sorted by id
+        low = 0
+        high = self._order_count
+
+        while low < high:
+            middle = (low + high) // 2
+            middle_id, = _ORDER_ID.unpack_from(self._mmap, self._orders_offset + middle * _ORDER.size)
+
+            if middle_id < order_id:
+                low = middle + 1
+            elif middle_id > order_id:
+                high = middle
+            else:
+                return self.__load_order(middle)
+
+        return None
+
+    def iter_unloaded_orders(self):
+        """
+        Orders that have not been read out of the snapshot yet. They are not marked as read.
+        :return: generator of Order
+        """
+        for index in range(self._order_count):
+            if not self._loaded[index]:
+                yield self.__read_order(index)
+
+    def close(self):
+        self._mmap.close()
+
+    def __order_loader(self, queue_start, order_count, find_order):
+        def load_orders():
+            orders = []
+
+            for position in range(queue_start, queue_start + order_count):
+                order_index, = _QUEUE_ENTRY.unpack_from(self._mmap, self._queue_offset + position * _QUEUE_ENTRY.size)
+                order_id, = _ORDER_ID.unpack_from(self._mmap, self._orders_offset + order_index * _ORDER.size)
+                orders.append(find_order(order_id))
+
+            return orders
+
+        return load_orders
+
+    def __load_order(self, index):
+        if self._loaded[index]:
+            return None
+
+        self._loaded[index] = 1
+        return self.__read_order(index)
+
+    def __read_order(self, index):
+        order_id, order_type, price, size, unmatched_size, match_start, match_count = \
+            _ORDER.unpack_from(self._mmap, self._orders_offset + index * _ORDER.size)
+
+        matches = []
+        for match_index in range(match_start, match_start + match_count):
+            buy_order_id, sell_order_id, match_size, match_price, sequence = \
+                _MATCH.unpack_from(self._mmap, self._matches_offset + match_index * _MATCH.size)
+
+            matches.append(Match.restore(buy_order_id, sell_order_id,
+                                         _unpack_int(match_size), _unpack_int(match_price), sequence or None))
+
+        return Order.restore(
+            order_id=order_id,
+            order_type=_ORDER_TYPES_BY_CODE[order_type & ~_CANCELLED_FLAG],
+            price=_unpack_int(price),
+            size=_unpack_int(size),
+            unmatched_size=_unpack_int(unmatched_size),
+            matches=matches,
+            cancelled=bool(order_type & _CANCELLED_FLAG)
+        )
+
+
+class _SnapshotPriceLevel(PriceLevel):
+    """
+    A PriceLevel restored from a snapshot. The total size is known up front, the orders are only read from the snapshot
+    the first time the queue is used.
+    """
+    def __init__(self, price, total_size, order_count, load_orders):
+        super().__init__(price)
+        self.total_size = total_size
+        self._order_count = order_count
+        self._load_orders = load_orders
+
+    def append(self, order):
+        self.__load()
+        super().append(order)
+
+    def peek(self):
+        self.__load()
+        return super().peek()
+
+    def popleft(self):
+        self.__load()
+        return super().popleft()
+
+    def cancel(self, order):
+        self.__load()
+        super().cancel(order)
+
+    def __len__(self):
+        if self._load_orders is not None:
+            return self._order_count
+
+        return super().__len__()
+
+    def __iter__(self):
+        self.__load()
+        return super().__iter__()
+
+    def __load(self):
+        if self._load_orders is not None:
+            self._orders.extend(self._load_orders())
+            self._load_orders = None
+
+
+def _pack_int(value):
+    try:
+        return value.to_bytes(_INT_BYTES, 'little')
+    except OverflowError:
+        raise ValueError('{0} is too large to snapshot'.format(value))
+
+
+def _unpack_int(packed):
+    return int.from_bytes(packed, 'little')
+
@@ -0,0 +1,99 @@
+from unittest import TestCase
+
+from exchange.components.admission_control import AdmissionController
+from exchange.components.metrics import Metrics
+
+
+class TestAdmissionController(TestCase):
+    def setUp(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def test_rate_limit(self):
+        controller = AdmissionController(rate=10, burst=3, clock=self.clock)
+
+        # The burst is admitted straight away, then a token every 0.1 seconds
+        self.assertEqual([controller.admit('a') for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(controller.admit('a'), 0.1)
+
+        # Other clients have buckets of their own
+        self.assertEqual(controller.admit('b'), 0)
+
+        self.now = 0.1
+        self.assertEqual(controller.admit('a'), 0)
+        self.assertGreater(controller.admit('a'), 0)
+
+        # Tokens are not saved up past the burst
+        self.now = 100
+        self.assertEqual([controller.admit('a') for _ in range(4)], [0, 0, 0, 0.1])
+
+        self.assertEqual(controller.get_counts(), (8, 3, 0))
+
+    def test_batches_go_into_debt(self):
+        controller = AdmissionController(rate=10, burst=5, clock=self.clock)
+
+        # A batch bigger than the burst is admitted while there is a token, then paid off before the next request
+        self.assertEqual(controller.admit('a', cost=25), 0)
+        self.assertAlmostEqual(controller.admit('a'), 2.1)
+
+        self.now = 2.1
+        self.assertEqual(controller.admit('a'), 0)
+
+    def test_charge_after_admitting(self):
+        controller = AdmissionController(rate=10, burst=5, clock=self.clock)
+
+        # Admitted for one order before the batch is read, then charged for the rest of it
+        self.assertEqual(controller.admit('a'), 0)
+        controller.charge('a', 24)
+        self.assertAlmostEqual(controller.admit('a'), 2.1)
+
+        # Nothing to charge without a rate limit
+        AdmissionController(max_in_flight=1).charge('a', 10)
+
+    def test_max_in_flight(self):
+        controller = AdmissionController(max_in_flight=2, clock=self.clock)
+
+        self.assertEqual(controller.admit('a'), 0)
+        self.assertEqual(controller.admit('b'), 0)
+        self.assertGreater(controller.admit('c'), 0)
+        self.assertEqual(controller.get_in_flight(), 2)
+
+        controller.release()
+        self.assertEqual(controller.admit('c'), 0)
+        self.assertEqual(controller.get_counts(), (3, 0, 1))
+
+    def test_forgets_least_recently_seen_clients(self):
+        controller = AdmissionController(rate=1, max_clients=2, clock=self.clock)
+
+        controller.admit('a')
+        controller.admit('b')
+        self.assertGreater(controller.admit('a'), 0)
+
+        # b is forgotten for c, a is still limited
+        controller.admit('c')
+        self.assertGreater(controller.admit('a'), 0)
+        self.assertEqual(controller.admit('b'), 0)
+
+    def test_metrics(self):
+        metrics = Metrics()
+        controller = AdmissionController(rate=1, max_in_flight=1, metrics=metrics, clock=self.clock)
+
+        controller.admit('a')
+        controller.admit('b')
+        controller.release()
+        controller.admit('a')
+
+        exported = metrics.to_prometheus()
+        self.assertIn('exchange_admitted_requests_total 1\n', exported)
+        self.assertIn('exchange_overloaded_requests_total 1\n', exported)
+        self.assertIn('exchange_rate_limited_requests_total 1\n', exported)
+        self.assertIn('exchange_in_flight_requests 0\n', exported)
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            AdmissionController(rate=0)
+
+        with self.assertRaises(ValueError):
+            AdmissionController(rate=10, burst=0.5)
@@ -1,8 +1,10 @@
+from random import Random
 from unittest import TestCase
 
 from sortedcontainers import SortedDict
 
 from exchange.components.exchange import Exchange
+from exchange.components.order import OrderType
 
 
 class TestExchange(TestCase):
@@ -110,7 +112,7 @@ class TestExchange(TestCase):
         # buy3 should match with sell 2 and shift the exchange price
         buy3_id = exchange.submit_buy(size=25, price=150)
         buy3 = exchange.get_order(buy3_id)
-        self.assertEquals(buy3._matches[0].sell_order, sell2)
+        self.assertEquals(buy3._matches[0].sell_order_id, sell2.id)
         # sell2 should now be fully matched
         self.assertEquals(sell2.get_unmatched_size(), 0)
 
@@ -144,3 +146,161 @@ class TestExchange(TestCase):
         order_id = exchange.submit_sell(size=10, price=30)
 
         self.assertIsNotNone(exchange.find_order(order_id))
+
+    def test_get_exchange_depth(self):
+        exchange = Exchange()
+
+        exchange.submit_sell(size=10, price=30)
+        exchange.submit_sell(size=10, price=20)
+        exchange.submit_sell(size=10, price=10)
+        exchange.submit_buy(size=15, price=20)
+
+        self.assertEqual(exchange.get_exchange_depth(1).sell_dict, SortedDict({20: 5}))
+        self.assertEqual(exchange.get_exchange_depth(1).buy_dict, SortedDict())
+
+    def test_submit_batch_matches_sequential_submission(self):
+        orders = [
+            (OrderType.BUY, 50, 400),
+            (OrderType.SELL, 10, 200),
+            (OrderType.BUY, 10, 450),
+            (OrderType.SELL, -5, 200),
+            (OrderType.SELL, 30, 500),
+            (OrderType.BUY, 5, 500),
+            (OrderType.BUY, 40, 300),
+        ]
+
+        sequential_exchange = Exchange()
+        for order_type, size, price in orders:
+            if size <= 0:
+                continue
+
+            if order_type == OrderType.BUY:
+                sequential_exchange.submit_buy(size=size, price=price)
+            else:
+                sequential_exchange.submit_sell(size=size, price=price)
+
+        batch_exchange = Exchange()
+        results = batch_exchange.submit_batch(orders)
+
+        self.assertEqual(len(results), 7)
+        self.assertEqual(results[3], {'rejected': 'Size -5 must be greater than 0'})
+        self.assertEqual(batch_exchange.get_order(results[5]['order_id']).get_unmatched_size(), 0)
+
+        self.assertEqual(batch_exchange.get_exchange_summary().buy_dict,
+                         sequential_exchange.get_exchange_summary().buy_dict)
+        self.assertEqual(batch_exchange.get_exchange_summary().sell_dict,
+                         sequential_exchange.get_exchange_summary().sell_dict)
+
+    def test_cancel(self):
+        exchange = Exchange()
+        first_sell_id = exchange.submit_sell(size=10, price=100)
+        second_sell_id = exchange.submit_sell(size=20, price=100)
+        third_sell_id = exchange.submit_sell(size=30, price=110)
+
+        # Only the unmatched size is cancelled
+        buy_id = exchange.submit_buy(size=5, price=100)
+        cancelled_order = exchange.cancel(first_sell_id)
+        self.assertTrue(cancelled_order.cancelled)
+        self.assertEqual(cancelled_order.get_unmatched_size(), 5)
+        self.assertEqual(exchange.get_exchange_summary().sell_dict, SortedDict({100: 20, 110: 30}))
+
+        # Cancelled or fully matched orders can not be cancelled
+        self.assertIsNone(exchange.cancel(first_sell_id))
+        self.assertIsNone(exchange.cancel(buy_id))
+
+        with self.assertRaises(KeyError):
+            exchange.cancel('no such order')
+
+        # The cancelled order is skipped by matching
+        exchange.submit_buy(size=25, price=110)
+        self.assertEqual(exchange.get_order(second_sell_id).get_unmatched_size(), 0)
+        self.assertEqual(exchange.get_order(third_sell_id).get_unmatched_size(), 25)
+        self.assertEqual(exchange.get_order(first_sell_id).get_unmatched_size(), 5)
+        self.assertEqual(exchange.get_order(first_sell_id).get_summary()['cancelled'], True)
+
+        # Cancelling the last order at a price removes the price level
+        exchange.cancel(third_sell_id)
+        self.assertEqual(exchange.get_exchange_summary().sell_dict, SortedDict())
+        self.assertIsNone(exchange._unmatched_order_book.peek_best_sell_order())
+
+    def test_sweeping_whole_price_levels(self):
+        exchange = Exchange()
+        first_sell_id = exchange.submit_sell(size=10, price=100)
+        cancelled_sell_id = exchange.submit_sell(size=20, price=100)
+        last_sell_id = exchange.submit_sell(size=5, price=100)
+        next_level_sell_id = exchange.submit_sell(size=10, price=101)
+        exchange.cancel(cancelled_sell_id)
+
+        # Exactly the size of the level at 100, the cancelled order is skipped
+        buy_id = exchange.submit_buy(size=15, price=101)
+
+        matches = [match.get_summary() for match in exchange.get_order(buy_id).get_matches()]
+        self.assertEqual([(match['sell_order_id'], match['size']) for match in matches],
+                         [(first_sell_id, 10), (last_sell_id, 5)])
+        self.assertEqual(exchange.get_order(cancelled_sell_id).get_unmatched_size(), 20)
+        self.assertEqual(exchange.get_exchange_summary().sell_dict, SortedDict({101: 10}))
+
+        # Bigger than the level, the rest of the buy order is stored
+        buy_id = exchange.submit_buy(size=12, price=101)
+        self.assertEqual(exchange.get_order(next_level_sell_id).get_unmatched_size(), 0)
+        self.assertEqual(exchange.get_order(buy_id).get_unmatched_size(), 2)
+        self.assertEqual(exchange.get_exchange_summary().sell_dict, SortedDict())
+        self.assertEqual(exchange.get_exchange_summary().buy_dict, SortedDict({101: 2}))
+        self.assertIsNone(exchange.cancel(next_level_sell_id))
+
+    def test_matching_agrees_with_reference_matcher(self):
+        """
+        Random orders and cancels matched by the exchange make the same trades as matching them against one list per
+        side, one order at a time in price then time priority
+        """
+        random = Random(7)
+        exchange = Exchange()
+        resting = {OrderType.BUY: [], OrderType.SELL: []}
+        expected_trades = []
+
+        for _ in range(2000):
+            if random.random() < 0.1 and (resting[OrderType.BUY] or resting[OrderType.SELL]):
+                side = resting[OrderType.BUY] or resting[OrderType.SELL]
+                order = side.pop(random.randrange(len(side)))
+                exchange.cancel(order[0])
+                continue
+
+            order_type = random.choice([OrderType.BUY, OrderType.SELL])
+            size = random.choice([1, 5, 10, 50, 200])
+            price = random.randint(95, 105)
+
+            if order_type == OrderType.BUY:
+                order = [exchange.submit_buy(size=size, price=price), price, size]
+                opposite, crosses = resting[OrderType.SELL], lambda best: best[1] <= price
+            else:
+                order = [exchange.submit_sell(size=size, price=price), price, size]
+                opposite, crosses = resting[OrderType.BUY], lambda best: best[1] >= price
+
+            while order[2] > 0 and opposite and crosses(opposite[0]):
+                best = opposite[0]
+                matched_size = min(order[2], best[2])
+                expected_trades.append((best[1], matched_size) + ((order[0], best[0]) if order_type == OrderType.BUY
+                                                                  else (best[0], order[0])))
+                order[2] -= matched_size
+                best[2] -= matched_size
+
+                if best[2] == 0:
+                    opposite.pop(0)
+
+            if order[2] > 0:
+                side = resting[order_type]
+                side.append(order)
+                # Stable, so orders at the same price stay in time order
+                side.sort(key=lambda resting_order: -resting_order[1] if order_type == OrderType.BUY
+                          else resting_order[1])
+
+        trades = [match.get_summary() for match in exchange.get_trades(0, len(expected_trades) + 1)]
+        self.assertEqual([(trade['price'], trade['size'], trade['buy_order_id'], trade['sell_order_id'])
+                          for trade in trades], expected_trades)
+
+        for order_type, summary in ((OrderType.BUY, exchange.get_exchange_summary().buy_dict),
+                                    (OrderType.SELL, exchange.get_exchange_summary().sell_dict)):
+            expected_summary = SortedDict()
+            for _, price, size in resting[order_type]:
+                expected_summary[price] = expected_summary.get(price, 0) + size
+            self.assertEqual(summary, expected_summary)
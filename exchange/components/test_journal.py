@@ -0,0 +1,101 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.components.journal import Journal
+
+
+class TestJournal(TestCase):
+    def setUp(self):
+        self.journal_path = os.path.join(tempfile.mkdtemp(), 'journal')
+
+    def test_recover_from_journal(self):
+        journal = Journal(self.journal_path, fsync_every_events=3)
+        exchange = Exchange(journal=journal)
+
+        order_ids = [
+            exchange.submit_buy(size=50, price=400),
+            exchange.submit_sell(size=10, price=200),
+            exchange.submit_buy(size=10, price=450),
+            exchange.submit_sell(size=30, price=500),
+            exchange.submit_buy(price=9223372036854775808, size=10),
+        ]
+        journal.close()
+
+        recovered_exchange = Exchange(journal=Journal(self.journal_path))
+        self.assertEqual(recovered_exchange.recover_from_journal(), 5)
+
+        self.assertEqual(recovered_exchange.get_exchange_summary().buy_dict, exchange.get_exchange_summary().buy_dict)
+        self.assertEqual(recovered_exchange.get_exchange_summary().sell_dict, exchange.get_exchange_summary().sell_dict)
+
+        for order_id in order_ids:
+            self.assertEqual(recovered_exchange.get_order(order_id).get_summary(),
+                             exchange.get_order(order_id).get_summary())
+
+        # New orders are appended after the recovered ones and are never given a recovered order's id
+        self.assertNotIn(recovered_exchange.submit_sell(size=5, price=100), order_ids)
+        self.assertEqual(len(list(Journal(self.journal_path).entries())), 6)
+
+    def test_idle_records_are_synced(self):
+        journal = Journal(self.journal_path, fsync_every_events=1000, fsync_interval_us=100000)
+        self.addCleanup(journal.close)
+        exchange = Exchange(journal=journal)
+
+        exchange.submit_buy(size=10, price=100)
+        exchange.submit_sell(size=5, price=200)
+        self.assertEqual(journal.get_unsynced_events(), 2)
+
+        # No more orders arrive, the interval still syncs the records
+        deadline = time.monotonic() + 5
+
+        while journal.get_unsynced_events():
+            self.assertLess(time.monotonic(), deadline, 'Timed out')
+            time.sleep(0.001)
+
+        journal.close()
+        self.assertEqual(len(list(Journal(self.journal_path).entries())), 2)
+
+    def test_recover_cancels_from_journal(self):
+        journal = Journal(self.journal_path)
+        exchange = Exchange(journal=journal)
+
+        buy_order_id = exchange.submit_buy(size=50, price=400)
+        exchange.submit_buy(size=20, price=400)
+        exchange.cancel(buy_order_id)
+        sell_order_id = exchange.submit_sell(size=30, price=400)
+        journal.close()
+
+        recovered_exchange = Exchange(journal=Journal(self.journal_path))
+        self.assertEqual(recovered_exchange.recover_from_journal(), 4)
+
+        self.assertTrue(recovered_exchange.get_order(buy_order_id).cancelled)
+        self.assertEqual(recovered_exchange.get_order(sell_order_id).get_summary(),
+                         exchange.get_order(sell_order_id).get_summary())
+        self.assertEqual(recovered_exchange.get_exchange_summary().sell_dict, exchange.get_exchange_summary().sell_dict)
+
+    def test_partial_record_is_truncated(self):
+        journal = Journal(self.journal_path)
+        exchange = Exchange(journal=journal)
+        exchange.submit_buy(size=50, price=400)
+        exchange.submit_buy(size=50, price=300)
+        journal.close()
+
+        # Simulate a crash part way through writing the last record
+        with open(self.journal_path, 'r+b') as journal_file:
+            journal_file.truncate(os.path.getsize(self.journal_path) - 2)
+
+        journal = Journal(self.journal_path)
+        exchange = Exchange(journal=journal)
+        self.assertEqual(exchange.recover_from_journal(), 1)
+
+        exchange.submit_sell(size=10, price=400)
+        self.assertEqual(len(list(journal.entries())), 2)
+
+    def test_not_a_journal(self):
+        with open(self.journal_path, 'wb') as journal_file:
+            journal_file.write(b'something else')
+
+        with self.assertRaises(ValueError):
+            Journal(self.journal_path)
@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from sortedcontainers import SortedDict
+
+from exchange.components.exchange import Exchange
+from exchange.components.market_data_feed import MarketDataFeed
+from exchange.components.order import OrderType
+
+
+class TestMarketDataFeed(TestCase):
+    def setUp(self):
+        self.exchange = Exchange()
+        self.exchange.submit_sell(size=10, price=100)
+
+        self.feed = MarketDataFeed(self.exchange.get_exchange_summary(), max_updates=2)
+        self.exchange.set_level_listener(self.feed.on_level_change)
+
+    def test_snapshot_then_updates(self):
+        sequence, summary = self.feed.get_snapshot()
+        self.assertEqual(summary.sell_dict, SortedDict({100: 10}))
+        self.assertIsNone(self.feed.get_update(sequence))
+
+        self.exchange.submit_buy(size=4, price=100)
+        self.exchange.submit_buy(size=5, price=90)
+        self.feed.publish()
+
+        update = self.feed.get_update(sequence)
+        self.assertEqual(update.sequence, sequence + 1)
+        self.assertEqual(update.changes, {(OrderType.SELL, 100): 6, (OrderType.BUY, 90): 5})
+
+        self.assertEqual(self.feed.get_snapshot()[1].buy_dict, SortedDict({90: 5}))
+
+    def test_slow_subscribers_get_conflated_updates(self):
+        sequence, summary = self.feed.get_snapshot()
+
+        self.exchange.submit_buy(size=4, price=100)
+        self.feed.publish()
+        self.exchange.submit_buy(size=6, price=100)
+        self.feed.publish()
+
+        # Only the newest size of each level, the level has been removed
+        update = self.feed.get_update(sequence)
+        self.assertEqual(update.sequence, sequence + 2)
+        self.assertEqual(update.changes, {(OrderType.SELL, 100): 0})
+
+        self.exchange.submit_buy(size=6, price=100)
+        self.feed.publish()
+
+        # The window only keeps 2 updates, so the first one has gone
+        with self.assertRaises(LookupError):
+            self.feed.get_update(sequence)
+
+        self.assertEqual(self.feed.get_snapshot()[1].buy_dict, SortedDict({100: 6}))
@@ -0,0 +1,67 @@
+import os
+from unittest import TestCase
+
+from sortedcontainers import SortedDict
+
+from exchange.components.exchange import Exchange
+from exchange.components.matching_engine import MatchingEngine, QueueFullError
+from exchange.components.order_book_replica import OrderBookReplica, OrderBookReplicaPublisher
+from exchange.components.order_id import decode_order_id
+
+
+class TestMatchingEngine(TestCase):
+    def test_execute_and_publish_summary(self):
+        engine = MatchingEngine(Exchange())
+        engine.start()
+
+        sell_order_id = engine.execute(Exchange.submit_sell, 10, 100).result()
+        engine.execute(Exchange.submit_buy, 4, 100).result()
+
+        # The summary is published before the result is returned
+        self.assertEqual(engine.get_published_summary().sell_dict, SortedDict({100: 6}))
+
+        order = engine.read(Exchange.find_order, sell_order_id).result()
+        self.assertEqual(order.get_unmatched_size(), 6)
+
+        version, summary = engine.get_published_order_book()
+
+        with self.assertRaises(ValueError):
+            engine.execute(Exchange.submit_buy, -4, 100).result()
+
+        # The rejected order did not change the order book, so it was not summarised again
+        self.assertEqual(engine.get_published_order_book(), (version, summary))
+        self.assertIs(engine.get_published_summary(), summary)
+
+        engine.stop()
+
+    def test_publishes_to_replicas(self):
+        exchange = Exchange()
+        name = 'test-engine-replica-{0}'.format(os.getpid())
+        publisher = OrderBookReplicaPublisher(exchange, name)
+        replica = OrderBookReplica(name)
+
+        engine = MatchingEngine(exchange, replica_publisher=publisher)
+        engine.start()
+
+        sell_order_id = engine.execute(Exchange.submit_sell, 10, 100).result()
+
+        # Published before the result is returned, so the client can read its own order from a replica straight away
+        self.assertEqual(replica.read_order_book()[1].sell_dict, SortedDict({100: 10}))
+        self.assertEqual(replica.read_order_page(decode_order_id(sell_order_id))['unmatched_size'], 10)
+
+        engine.stop()
+        replica.close()
+        publisher.close()
+
+    def test_rejects_when_queue_is_full(self):
+        engine = MatchingEngine(Exchange(), max_queue_size=1)
+
+        # Nothing is taking requests off the queue until the engine is started
+        first = engine.execute(Exchange.submit_sell, 10, 100)
+
+        with self.assertRaises(QueueFullError):
+            engine.execute(Exchange.submit_sell, 10, 100)
+
+        engine.start()
+        self.assertIsNotNone(first.result())
+        engine.stop()
@@ -0,0 +1,152 @@
+import json
+import tracemalloc
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.components.memory_report import MemoryMonitor, add_top_allocators, create_memory_report, sample, \
+    take_allocation_snapshot
+from exchange.components.metrics import Metrics
+
+
+class TestMemoryReport(TestCase):
+    def setUp(self):
+        self.exchange = Exchange()
+
+        for price in range(100, 110):
+            self.exchange.submit_sell(size=10, price=price)
+            self.exchange.submit_buy(size=10, price=price - 20)
+
+        # Takes the two best sell levels in two matches
+        self.exchange.submit_buy(size=20, price=101)
+
+    def test_memory_usage(self):
+        usage = self.exchange.get_memory_usage()
+
+        self.assertEqual(usage['live_orders']['count'], 18)
+        self.assertEqual(usage['cached_orders']['count'], 3)
+        self.assertEqual(usage['matches']['count'], 2)
+        self.assertEqual(usage['buy_levels']['count'], 10)
+        self.assertEqual(usage['sell_levels']['count'], 8)
+        self.assertEqual(usage['trade_tape']['count'], 2)
+        self.assertEqual(usage['pending_archive']['count'], 0)
+
+        for structure in usage.values():
+            self.assertGreater(structure['bytes'], 0)
+
+    def test_sampled_memory_usage(self):
+        for _ in range(1000):
+            self.exchange.submit_buy(size=1, price=50)
+
+        exact = self.exchange.get_memory_usage()
+        sampled = self.exchange.get_memory_usage(sample_size=10)
+
+        # The counts are exact and the bytes estimated from the sample
+        self.assertEqual(sampled['live_orders']['count'], exact['live_orders']['count'])
+        self.assertAlmostEqual(sampled['live_orders']['bytes'] / exact['live_orders']['bytes'], 1, delta=0.1)
+
+    def test_sample(self):
+        self.assertEqual(sample(range(5), 5, 10), [0, 1, 2, 3, 4])
+        self.assertEqual(sample(range(1999), 1999, 1000), list(range(0, 1999, 2)))
+
+    def test_report(self):
+        report = create_memory_report(self.exchange)
+
+        self.assertGreater(report['process']['resident_bytes'], 0)
+        self.assertEqual(report['structures_bytes'], sum(value['bytes'] for value in report['structures'].values()))
+        self.assertIsNone(report['tracemalloc'])
+        self.assertNotIn('thresholds', report)
+
+        json.dumps(report)
+
+    def test_report_with_tracemalloc(self):
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+
+        for _ in range(1000):
+            self.exchange.submit_sell(size=1, price=200)
+
+        report = create_memory_report(self.exchange)
+        add_top_allocators(report, take_allocation_snapshot(), 3)
+
+        self.assertGreater(report['tracemalloc']['traced_bytes'], 0)
+        self.assertEqual(len(report['tracemalloc']['top_allocators']), 3)
+        self.assertIn('.py:', report['tracemalloc']['top_allocators'][0]['location'])
+
+
+class TestMemoryMonitor(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.used_bytes = 100
+
+    def create_monitor(self, **kwargs):
+        return MemoryMonitor(read_memory=lambda: self.used_bytes, clock=lambda: self.now, **kwargs)
+
+    def test_thresholds(self):
+        monitor = self.create_monitor(warning_bytes=200, reject_bytes=300, check_interval=1)
+
+        monitor.check()
+        self.assertFalse(monitor.is_rejecting())
+
+        self.used_bytes = 250
+
+        with self.assertLogs('exchange.components.memory_report', level='WARNING') as logs:
+            # Not read again until the interval has passed
+            monitor.check()
+            self.assertEqual(monitor.get_used_bytes(), 100)
+
+            self.now = 1
+            monitor.check()
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertFalse(monitor.is_rejecting())
+
+        self.used_bytes = 300
+        self.now = 2
+
+        with self.assertLogs('exchange.components.memory_report', level='WARNING'):
+            monitor.check()
+
+        self.assertTrue(monitor.is_rejecting())
+        self.assertEqual(monitor.get_thresholds(), {'used_bytes': 300, 'warning_bytes': 200, 'reject_bytes': 300,
+                                                    'resume_bytes': 270, 'rejecting': True})
+
+        self.used_bytes = 100
+        self.now = 3
+
+        with self.assertLogs('exchange.components.memory_report', level='WARNING'):
+            monitor.check()
+
+        self.assertFalse(monitor.is_rejecting())
+
+    def test_resume_under_lower_threshold(self):
+        monitor = self.create_monitor(reject_bytes=300, resume_bytes=200, check_interval=0)
+        self.used_bytes = 300
+
+        with self.assertLogs('exchange.components.memory_report', level='WARNING'):
+            monitor.check()
+
+        # Still rejecting until the memory is under the resume threshold
+        self.used_bytes = 250
+        monitor.check()
+        self.assertTrue(monitor.is_rejecting())
+
+        self.used_bytes = 199
+
+        with self.assertLogs('exchange.components.memory_report', level='WARNING') as logs:
+            monitor.check()
+
+        self.assertIn('resume threshold of 200 bytes', logs.output[0])
+        self.assertFalse(monitor.is_rejecting())
+
+        # And rejecting again only over the reject threshold
+        self.used_bytes = 250
+        monitor.check()
+        self.assertFalse(monitor.is_rejecting())
+
+    def test_metrics(self):
+        metrics = Metrics()
+        monitor = self.create_monitor(warning_bytes=1000, metrics=metrics)
+        monitor.check()
+
+        self.assertIn('exchange_resident_memory_bytes 100\n', metrics.to_prometheus())
+        self.assertIn('thresholds', create_memory_report(Exchange(), monitor))
@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.components.metrics import Histogram, Metrics
+from exchange.components.unmatched_order_book import UnmatchedOrderBook
+
+
+class TestMetrics(TestCase):
+    def test_histogram_quantiles(self):
+        histogram = Histogram('latency', 'Latency')
+
+        self.assertEqual(histogram.get_quantile(0.5), 0)
+
+        for value in range(1, 1001):
+            histogram.record(value * 1000)
+
+        self.assertEqual(histogram.get_count(), 1000)
+        self.assertEqual(histogram.get_sum(), 500500000)
+
+        # Every bucket is within about 3% of the values in it
+        for quantile, expected in ((0.5, 500000), (0.99, 990000), (1, 1000000)):
+            self.assertAlmostEqual(histogram.get_quantile(quantile) / expected, 1, delta=0.035)
+
+        # Small values are exact and huge values are clamped
+        histogram = Histogram('latency', 'Latency')
+        histogram.record(0)
+        histogram.record(63)
+        histogram.record(2 ** 50)
+        self.assertEqual(histogram.get_quantile(0.3), 0)
+        self.assertEqual(histogram.get_quantile(0.6), 63)
+        self.assertEqual(histogram.get_quantile(1), 2 ** 40 - 1)
+
+    def test_exchange_metrics(self):
+        metrics = Metrics()
+        exchange = Exchange(metrics=metrics)
+
+        exchange.submit_sell(size=10, price=100)
+        exchange.submit_sell(size=10, price=101)
+        exchange.submit_buy(size=15, price=101)
+        exchange.submit_buy(size=10, price=90)
+        exchange.submit_batch([(None, 10, 100)])
+
+        text = metrics.to_prometheus()
+
+        self.assertIn('# TYPE exchange_orders_total counter\nexchange_orders_total 4\n', text)
+        self.assertIn('exchange_matches_total 2\n', text)
+        self.assertIn('exchange_levels_touched_per_order_count 4\n', text)
+        self.assertIn('exchange_levels_touched_per_order_sum 2\n', text)
+        self.assertIn('exchange_buy_price_levels 1\n', text)
+        self.assertIn('exchange_sell_price_levels 1\n', text)
+
+        # The rejected order was still validated
+        self.assertIn('exchange_order_validation_seconds_count 5\n', text)
+        self.assertIn('exchange_matching_seconds_count 4\n', text)
+        self.assertIn('exchange_order_book_insert_seconds_count 3\n', text)
+        # The buy of 15 takes the whole level at 100 off the order book in one sweep instead of popping its order
+        self.assertIn('exchange_order_book_pop_seconds_count 0\n', text)
+        self.assertIn('exchange_order_book_level_sweep_seconds_count 1\n', text)
+        self.assertIn('# TYPE exchange_matching_seconds summary\nexchange_matching_seconds{quantile="0.5"} ', text)
+
+    def test_exchange_without_metrics_is_not_instrumented(self):
+        exchange = Exchange()
+
+        self.assertIsNone(exchange.get_metrics())
+        self.assertEqual(exchange._execute_order.__func__, Exchange._execute_order)
+        self.assertNotIn('add_buy_order', vars(exchange._unmatched_order_book))
+        self.assertEqual(UnmatchedOrderBook.add_buy_order, type(exchange._unmatched_order_book).add_buy_order)
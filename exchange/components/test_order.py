@@ -2,6 +2,7 @@ from unittest import TestCase
 
 from exchange.components.match import Match
 from exchange.components.order import Order, OrderType
+from exchange.components.order_id import encode_order_id
 
 
 class TestOrder(TestCase):
@@ -12,7 +13,7 @@ class TestOrder(TestCase):
             order_type=OrderType.BUY
         )
 
-        order.id = '03a13310886d4ced9a28bc947ed56202'
+        order.id = 7
 
         order.add_match(
             Match(
@@ -32,6 +33,55 @@ class TestOrder(TestCase):
             )
         )
 
-        expected_dict = {'order_type': 'BUY', 'price': 20, 'size': 20, 'matches': [{'sell_order_id': '03a13310886d4ced9a28bc947ed56202', 'size': 10, 'price': 20, 'buy_order_id': '03a13310886d4ced9a28bc947ed56202'}, {'sell_order_id': '03a13310886d4ced9a28bc947ed56202', 'size': 5, 'price': 20, 'buy_order_id': '03a13310886d4ced9a28bc947ed56202'}], 'unmatched_size': 5}
+        expected_dict = {'order_type': 'BUY', 'price': 20, 'size': 20, 'matches': [{'sell_order_id': encode_order_id(7), 'size': 10, 'price': 20, 'buy_order_id': encode_order_id(7)}, {'sell_order_id': encode_order_id(7), 'size': 5, 'price': 20, 'buy_order_id': encode_order_id(7)}], 'unmatched_size': 5, 'cancelled': False}
 
         self.assertEqual(order.get_summary(), expected_dict)
+
+    def test_get_summary_without_matches(self):
+        order = Order(
+            price=20,
+            size=20,
+            order_type=OrderType.SELL
+        )
+
+        self.assertEqual(order.get_unmatched_size(), 20)
+        self.assertEqual(order.get_summary()['matches'], [])
+
+    def test_get_summary_page(self):
+        order = Order(
+            price=20,
+            size=100,
+            order_type=OrderType.SELL
+        )
+
+        first_page = order.get_summary_page(limit=2)
+        self.assertEqual(first_page['matches'], [])
+        self.assertEqual(first_page['match_count'], 0)
+        self.assertIsNone(first_page['next_after'])
+
+        for size in range(1, 6):
+            order.add_match(Match(buy_order=order, sell_order=order, size=size, price=20))
+
+        # The cached summary is kept up to date as matches are added
+        first_page = order.get_summary_page(limit=2)
+        self.assertEqual(first_page['unmatched_size'], 85)
+        self.assertEqual([match['size'] for match in first_page['matches']], [1, 2])
+        self.assertEqual(first_page['match_count'], 5)
+        self.assertEqual(first_page['next_after'], 2)
+
+        last_page = order.get_summary_page(after=4, limit=2)
+        self.assertEqual([match['size'] for match in last_page['matches']], [5])
+        self.assertIsNone(last_page['next_after'])
+
+        order.add_match(Match(buy_order=order, sell_order=order, size=10, price=20))
+        order.cancel()
+
+        # Every match, the same as get_summary
+        summary_page = order.get_summary_page()
+        self.assertEqual(summary_page['unmatched_size'], 75)
+        self.assertTrue(summary_page['cancelled'])
+        self.assertIsNone(summary_page['next_after'])
+
+        del summary_page['match_count']
+        del summary_page['next_after']
+        self.assertEqual(summary_page, order.get_summary())
@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+from unittest import TestCase
+
+from sortedcontainers import SortedDict
+
+from exchange.components.exchange import Exchange
+from exchange.components.order_book_replica import OrderBookReplica, OrderBookReplicaPublisher
+from exchange.components.order_id import decode_order_id
+
+
+class TestOrderBookReplica(TestCase):
+    def setUp(self):
+        self.name = 'test-replica-{0}'.format(os.getpid())
+        self.exchange = Exchange()
+        self.publisher = OrderBookReplicaPublisher(self.exchange, self.name, max_levels=3, order_slots=16,
+                                                   matches_per_order=2)
+        self.replica = OrderBookReplica(self.name)
+
+    def tearDown(self):
+        self.replica.close()
+        self.publisher.close()
+
+    def assert_order_replicated(self, order_id, after=0, limit=None):
+        self.assertEqual(self.replica.read_order_page(decode_order_id(order_id), after, limit),
+                         self.exchange.get_order(order_id).get_summary_page(after, limit))
+
+    def test_order_book(self):
+        version, summary = self.replica.read_order_book()
+        self.assertEqual((summary.buy_dict, summary.sell_dict), (SortedDict(), SortedDict()))
+
+        self.exchange.submit_sell(size=10, price=101)
+        self.exchange.submit_sell(size=10, price=102)
+        self.exchange.submit_buy(size=5, price=90)
+
+        # Nothing is visible until it is published
+        self.assertEqual(self.replica.read_version(), version)
+        self.assertTrue(self.publisher.publish())
+        self.assertFalse(self.publisher.publish())
+
+        version, summary = self.replica.read_order_book()
+        self.assertEqual(version, self.exchange.get_order_book_version())
+        self.assertEqual(summary.buy_dict, self.exchange.get_exchange_summary().buy_dict)
+        self.assertEqual(summary.sell_dict, self.exchange.get_exchange_summary().sell_dict)
+        self.assertEqual(self.replica.read_order_book(1)[1].sell_dict, SortedDict({101: 10}))
+
+    def test_truncated_order_book(self):
+        for price in range(100, 105):
+            self.exchange.submit_sell(size=10, price=price)
+            self.exchange.submit_buy(size=10, price=price - 10)
+
+        self.publisher.publish()
+
+        # Only the best 3 levels of each side are published
+        self.assertIsNone(self.replica.read_order_book())
+        self.assertIsNone(self.replica.read_order_book(4))
+
+        summary = self.replica.read_order_book(3)[1]
+        self.assertEqual(summary.buy_dict, self.exchange.get_exchange_depth(3).buy_dict)
+        self.assertEqual(summary.sell_dict, SortedDict({100: 10, 101: 10, 102: 10}))
+
+    def test_prices_over_64_bits(self):
+        buy_id = self.exchange.submit_buy(size=10, price=2 ** 64 + 1)
+        self.publisher.publish()
+
+        # The order book is read from the exchange instead, the order is replicated as it is
+        self.assertIsNone(self.replica.read_order_book(1))
+        self.assert_order_replicated(buy_id)
+
+        sell_id = self.exchange.submit_sell(size=2 ** 128, price=1)
+        self.publisher.publish()
+        self.assertIsNone(self.replica.read_order_page(decode_order_id(sell_id)))
+        self.assertEqual(self.replica.read_version(), self.exchange.get_order_book_version())
+
+    def test_orders(self):
+        sell_ids = [self.exchange.submit_sell(size=10, price=100) for _ in range(3)]
+        buy_id = self.exchange.submit_buy(size=25, price=100)
+        self.exchange.cancel(sell_ids[2])
+        self.publisher.publish()
+
+        for order_id in sell_ids:
+            self.assert_order_replicated(order_id)
+
+        self.assertTrue(self.replica.read_order_page(decode_order_id(sell_ids[2]))['cancelled'])
+
+        # Only the first 2 matches of an order are kept
+        self.assertIsNone(self.replica.read_order_page(decode_order_id(buy_id)))
+        self.assert_order_replicated(buy_id, limit=2)
+        self.assert_order_replicated(buy_id, after=1, limit=1)
+        self.assert_order_replicated(buy_id, after=3)
+        self.assert_order_replicated(buy_id, limit=0)
+
+        # The slot of an order is taken by the order numbered 16 after it
+        for _ in range(16):
+            self.exchange.submit_buy(size=1, price=1)
+
+        self.publisher.publish()
+        self.assertIsNone(self.replica.read_order_page(decode_order_id(sell_ids[0])))
+        self.assertIsNone(self.replica.read_order_page(0))
+
+    def test_replica_follows_restarted_publisher(self):
+        self.publisher.close()
+
+        exchange = Exchange()
+        exchange.submit_sell(size=10, price=100)
+        self.publisher = OrderBookReplicaPublisher(exchange, self.name)
+
+        self.assertEqual(self.replica.read_order_book()[1].sell_dict, SortedDict({100: 10}))
+
+    def test_reads_are_consistent_while_publishing(self):
+        for price in range(200, 202):
+            self.exchange.submit_sell(size=1, price=price)
+            self.exchange.submit_buy(size=1, price=price - 150)
+
+        self.publisher.publish()
+        without_order = self.replica.read_order_book()[1]
+
+        # Another process adds and takes the same order over and over, publishing every change
+        writer = multiprocessing.get_context('fork').Process(target=_add_and_take_order, args=(self.exchange,
+                                                                                              self.publisher))
+        writer.start()
+
+        while writer.is_alive():
+            summary = self.replica.read_order_book()[1]
+            summary.sell_dict.pop(100, None)
+
+            self.assertEqual(summary.sell_dict, without_order.sell_dict)
+            self.assertEqual(summary.buy_dict, without_order.buy_dict)
+
+        writer.join()
+        self.assertEqual(writer.exitcode, 0)
+
+
+def _add_and_take_order(exchange, publisher):
+    for _ in range(2000):
+        exchange.submit_sell(size=10, price=100)
+        publisher.publish()
+        exchange.submit_buy(size=10, price=100)
+        publisher.publish()
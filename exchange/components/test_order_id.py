@@ -0,0 +1,61 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.components.order_id import MAX_ORDER_NUMBER, OrderIdCodec, load_or_create_key
+
+
+class TestOrderIdCodec(TestCase):
+    def setUp(self):
+        self.codec = OrderIdCodec(bytes(range(16)))
+
+    def test_round_trip(self):
+        rng = random.Random(1)
+        numbers = [0, 1, 2, MAX_ORDER_NUMBER] + [rng.getrandbits(64) for _ in range(1000)]
+
+        for number in numbers:
+            order_id = self.codec.encode(number)
+            self.assertEqual(len(order_id), 16)
+            self.assertEqual(self.codec.decode(order_id), number)
+
+        self.assertEqual(len(set(self.codec.encode(number) for number in range(1, 10001))), 10000)
+
+    def test_key_changes_ids(self):
+        other_codec = OrderIdCodec(bytes(range(1, 17)))
+
+        self.assertNotEqual(self.codec.encode(1), other_codec.encode(1))
+        self.assertNotEqual(other_codec.decode(self.codec.encode(1)), 1)
+
+    def test_invalid(self):
+        for order_id in ('I dont exist', '', None, 1, '0123456789ABCDEF', '+123456789abcdef', '0_23456789abcdef'):
+            self.assertIsNone(self.codec.decode(order_id))
+
+        for number in (-1, MAX_ORDER_NUMBER + 1, '1', None):
+            with self.assertRaises(ValueError):
+                self.codec.encode(number)
+
+        with self.assertRaises(ValueError):
+            OrderIdCodec(b'short')
+
+    def test_load_or_create_key(self):
+        path = os.path.join(tempfile.mkdtemp(), 'journal.key')
+
+        key = load_or_create_key(path)
+        self.assertEqual(len(key), 16)
+        self.assertEqual(load_or_create_key(path), key)
+
+    def test_exchange_numbers_orders(self):
+        exchange = Exchange()
+        order_ids = [exchange.submit_buy(size=10, price=100) for _ in range(3)]
+
+        self.assertEqual([exchange.get_order(order_id).id for order_id in order_ids], [1, 2, 3])
+        self.assertEqual(exchange.get_order(order_ids[0]).get_external_id(), order_ids[0])
+
+        # A given number is never given out again
+        exchange.submit_sell(size=10, price=200, order_number=100)
+        self.assertEqual(exchange.get_order(exchange.submit_sell(size=10, price=200)).id, 101)
+
+        with self.assertRaises(ValueError):
+            exchange.submit_sell(size=10, price=200, order_number=0)
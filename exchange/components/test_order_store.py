@@ -0,0 +1,52 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.components.order_store import OrderStore
+
+
+class TestOrderStore(TestCase):
+    def test_keeps_everything_by_default(self):
+        exchange = Exchange()
+
+        sell_order_id = exchange.submit_sell(size=10, price=100)
+        buy_order_id = exchange.submit_buy(size=10, price=100)
+
+        self.assertIsNotNone(exchange.find_order(sell_order_id))
+        self.assertIsNotNone(exchange.find_order(buy_order_id))
+        self.assertEqual(exchange.get_order_store_metrics()['evictions'], 0)
+
+    def test_evicted_orders_are_loaded_from_archive(self):
+        archive_path = os.path.join(tempfile.mkdtemp(), 'archive.sqlite')
+        exchange = Exchange(order_store=OrderStore(max_cached_orders=1, archive_path=archive_path,
+                                                   archive_batch_size=1))
+
+        sell_order_id = exchange.submit_sell(size=10, price=100)
+
+        # The sell order and the first buy order are both filled, so the sell order is evicted from the cache
+        buy_order_id = exchange.submit_buy(size=10, price=100)
+        resting_order_id = exchange.submit_buy(size=10, price=50)
+
+        metrics = exchange.get_order_store_metrics()
+        self.assertEqual(metrics['live_orders'], 1)
+        self.assertEqual(metrics['cached_orders'], 1)
+        self.assertEqual(metrics['evictions'], 1)
+        self.assertEqual(metrics['archived_orders'], 1)
+
+        expected_summary = {'order_type': 'SELL', 'price': 100, 'size': 10, 'unmatched_size': 0, 'cancelled': False,
+                            'matches': [{'buy_order_id': buy_order_id, 'sell_order_id': sell_order_id, 'size': 10,
+                                         'price': 100}]}
+        self.assertEqual(exchange.get_order(sell_order_id).get_summary(), expected_summary)
+        self.assertEqual(exchange.get_order(buy_order_id).get_unmatched_size(), 0)
+        self.assertEqual(exchange.get_order(resting_order_id).get_unmatched_size(), 10)
+        self.assertEqual(exchange.get_order_store_metrics()['archive_hits'], 1)
+
+    def test_evicted_orders_are_discarded_without_archive(self):
+        exchange = Exchange(order_store=OrderStore(max_cached_orders=0))
+
+        sell_order_id = exchange.submit_sell(size=10, price=100)
+        exchange.submit_buy(size=10, price=100)
+
+        self.assertIsNone(exchange.find_order(sell_order_id))
+        self.assertEqual(exchange.get_order_store_metrics()['discarded_orders'], 2)
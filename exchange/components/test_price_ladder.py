@@ -0,0 +1,80 @@
+import random
+from functools import partial
+from unittest import TestCase
+
+from sortedcontainers import SortedDict
+
+from exchange.benchmarks.order_flow import OrderFlowGenerator
+from exchange.components.exchange import Exchange
+from exchange.components.order import OrderType
+from exchange.components.price_ladder import ArrayPriceLadder
+
+
+class TestArrayPriceLadder(TestCase):
+    def test_same_as_sorted_dict(self):
+        rng = random.Random(1)
+        ladder = ArrayPriceLadder(100, 200)
+        sorted_dict = SortedDict()
+
+        # Mostly inside the band, some either side of it
+        for _ in range(5000):
+            price = rng.randint(80, 220)
+
+            if price in sorted_dict and rng.random() < 0.5:
+                del ladder[price]
+                del sorted_dict[price]
+            else:
+                ladder[price] = sorted_dict[price] = 'level {0}'.format(price)
+
+            self.assertEqual(len(ladder), len(sorted_dict))
+            self.assertEqual(price in ladder, price in sorted_dict)
+
+            if sorted_dict:
+                self.assertEqual(ladder.peekitem(0), sorted_dict.peekitem(0))
+                self.assertEqual(ladder.peekitem(-1), sorted_dict.peekitem(-1))
+
+        self.assertEqual(list(ladder.keys()), list(sorted_dict.keys()))
+        self.assertEqual(list(ladder.values()), list(sorted_dict.values()))
+
+        for n in (0, 1, 5, 1000):
+            self.assertEqual(list(ladder.islice(stop=n)), list(sorted_dict.islice(stop=n)))
+            start = max(len(sorted_dict) - n, 0)
+            self.assertEqual(list(ladder.islice(start=start)), list(sorted_dict.islice(start=start)))
+
+        for minimum, maximum in ((None, None), (None, 90), (90, None), (150, 160), (70, 120), (190, 230), (95, 205),
+                                 (160, 150), (201, 201), (250, 300)):
+            self.assertEqual(list(ladder.irange(minimum, maximum)), list(sorted_dict.irange(minimum, maximum)))
+
+    def test_empty(self):
+        ladder = ArrayPriceLadder(100, 200)
+
+        self.assertFalse(ladder)
+        self.assertIsNone(ladder.get(150))
+
+        with self.assertRaises(IndexError):
+            ladder.peekitem(0)
+
+        with self.assertRaises(KeyError):
+            del ladder[150]
+
+        with self.assertRaises(ValueError):
+            ArrayPriceLadder(200, 100)
+
+    def test_exchange_with_price_ladder(self):
+        flow = list(OrderFlowGenerator(seed=3, mid_price=150).orders(5000))
+        flow.append((OrderType.BUY, 10, 9223372036854775808))
+        flow.append((OrderType.SELL, 10, 9223372036854775809))
+
+        sorted_dict_exchange = Exchange()
+        sorted_dict_exchange.submit_batch(flow)
+
+        ladder_exchange = Exchange(price_levels_factory=partial(ArrayPriceLadder, 140, 160))
+        ladder_exchange.submit_batch(flow)
+
+        self.assertEqual(ladder_exchange.get_exchange_summary().buy_dict,
+                         sorted_dict_exchange.get_exchange_summary().buy_dict)
+        self.assertEqual(ladder_exchange.get_exchange_summary().sell_dict,
+                         sorted_dict_exchange.get_exchange_summary().sell_dict)
+        self.assertEqual(ladder_exchange.get_exchange_depth(3).buy_dict,
+                         sorted_dict_exchange.get_exchange_depth(3).buy_dict)
+        self.assertEqual(ladder_exchange.get_last_trade_sequence(), sorted_dict_exchange.get_last_trade_sequence())
@@ -0,0 +1,250 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.components.journal import Journal
+from exchange.components.metrics import Metrics
+from exchange.components.replication import ReplicationPublisher, ReplicationStandby, decode_frame, encode_frame, \
+    parse_address
+
+
+class TestReplication(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, 'replication.sock')
+
+    def create_primary(self, journal=None):
+        publisher = ReplicationPublisher(self.address, journal, heartbeat_interval=0.01)
+        self.addCleanup(publisher.close)
+
+        return Exchange(journal=publisher), publisher
+
+    def create_standby(self, exchange=None, **kwargs):
+        standby = ReplicationStandby(exchange if exchange is not None else Exchange(), self.address,
+                                     reconnect_interval=0.01, **kwargs)
+        self.addCleanup(standby.promote)
+        standby.start()
+
+        return standby
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'Timed out')
+            time.sleep(0.001)
+
+    def wait_until_caught_up(self, standby, publisher):
+        self.wait_for(lambda: standby.get_lag()['applied_sequence'] == publisher.get_sequence())
+
+    def assert_same(self, primary, standby_exchange, order_ids):
+        self.assertEqual(standby_exchange.get_exchange_summary().buy_dict, primary.get_exchange_summary().buy_dict)
+        self.assertEqual(standby_exchange.get_exchange_summary().sell_dict, primary.get_exchange_summary().sell_dict)
+        self.assertEqual(standby_exchange.get_last_trade_sequence(), primary.get_last_trade_sequence())
+
+        for order_id in order_ids:
+            self.assertEqual(standby_exchange.get_order(order_id).get_summary(),
+                             primary.get_order(order_id).get_summary())
+
+    def test_standby_follows_primary(self):
+        primary, publisher = self.create_primary()
+        standby_exchange = Exchange()
+        standby = self.create_standby(standby_exchange)
+        self.wait_for(lambda: publisher.get_status()['standbys'])
+
+        order_ids = [
+            primary.submit_sell(size=10, price=100),
+            primary.submit_sell(size=20, price=101),
+            primary.submit_buy(size=15, price=101),
+            primary.submit_buy(size=5, price=90),
+        ]
+        primary.cancel(order_ids[1])
+
+        self.wait_until_caught_up(standby, publisher)
+
+        with standby.lock:
+            self.assert_same(primary, standby_exchange, order_ids)
+
+        lag = standby.get_lag()
+        self.assertTrue(lag['connected'])
+        self.assertEqual(lag['applied_sequence'], 5)
+        self.assertEqual(lag['lag_records'], 0)
+
+        # Heartbeats keep telling the standby the primary is there
+        self.wait_for(lambda: standby.get_lag()['lag_seconds'] == 0)
+        self.assertLess(standby.get_lag()['seconds_since_primary'], 1)
+
+    def test_catch_up_from_journal(self):
+        journal_path = os.path.join(self.directory, 'journal')
+        primary, publisher = self.create_primary(Journal(journal_path))
+
+        order_ids = [primary.submit_buy(size=1, price=price) for price in range(1, 2000)]
+        order_ids.append(primary.submit_sell(size=500, price=1))
+
+        standby_journal_path = os.path.join(self.directory, 'standby-journal')
+        standby_exchange = Exchange(journal=Journal(standby_journal_path))
+        standby = self.create_standby(standby_exchange)
+        self.wait_until_caught_up(standby, publisher)
+
+        with standby.lock:
+            self.assert_same(primary, standby_exchange, order_ids)
+
+        # A standby restarted from its own journal only asks for the records it does not have
+        standby.promote()
+        order_ids.append(primary.submit_sell(size=1, price=1))
+
+        restarted_exchange = Exchange(journal=Journal(standby_journal_path))
+        restarted_exchange.recover_from_journal()
+        restarted = self.create_standby(restarted_exchange)
+        self.wait_until_caught_up(restarted, publisher)
+
+        with restarted.lock:
+            self.assert_same(primary, restarted_exchange, order_ids)
+
+    def test_connect_while_orders_are_submitted(self):
+        journal_path = os.path.join(self.directory, 'journal')
+        primary, publisher = self.create_primary(Journal(journal_path, fsync_every_events=1000))
+        order_ids = []
+
+        def submit():
+            for price in range(1, 5000):
+                order_ids.append(primary.submit_buy(size=1, price=price))
+
+        submitting = threading.Thread(target=submit)
+        submitting.start()
+
+        # Every record is applied once whether it was read from the journal or queued for the standby
+        standbys = []
+
+        for _ in range(10):
+            standby_exchange = Exchange()
+            standbys.append((self.create_standby(standby_exchange), standby_exchange))
+            time.sleep(0.002)
+
+        submitting.join()
+
+        for standby, standby_exchange in standbys:
+            self.wait_until_caught_up(standby, publisher)
+
+            with standby.lock:
+                self.assert_same(primary, standby_exchange, order_ids)
+
+    def test_failed_standby_stops(self):
+        primary, publisher = self.create_primary()
+        standby_exchange = Exchange()
+
+        def fail(size, price, order_number=None):
+            raise RuntimeError('Broken')
+
+        standby_exchange.submit_buy = fail
+
+        with self.assertLogs('exchange.components.replication', level='ERROR'):
+            standby = self.create_standby(standby_exchange)
+            primary.submit_buy(size=1, price=1)
+            self.wait_for(lambda: standby.get_lag()['failed'])
+
+        self.assertFalse(standby.get_lag()['connected'])
+
+    def test_catch_up_from_memory(self):
+        primary, publisher = self.create_primary()
+        order_ids = [primary.submit_sell(size=1, price=price) for price in range(1, 100)]
+
+        standby_exchange = Exchange()
+        standby = self.create_standby(standby_exchange)
+        self.wait_until_caught_up(standby, publisher)
+
+        with standby.lock:
+            self.assert_same(primary, standby_exchange, order_ids)
+
+        self.assertEqual(len(list(publisher.entries())), 99)
+
+    def test_promote(self):
+        primary, publisher = self.create_primary()
+        standby_exchange = Exchange()
+        standby = self.create_standby(standby_exchange)
+
+        primary.submit_buy(size=10, price=100)
+        self.wait_until_caught_up(standby, publisher)
+
+        start = time.monotonic()
+        self.assertEqual(standby.promote(), 1)
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertTrue(standby.is_promoted())
+
+        # Nothing is applied after the promotion, and new orders are numbered after the replicated ones
+        primary.submit_sell(size=10, price=100)
+        time.sleep(0.05)
+
+        self.assertEqual(standby_exchange.get_accepted_orders(), 1)
+        self.assertFalse(standby.get_lag()['connected'])
+        self.assertNotEqual(standby_exchange.submit_sell(size=3, price=100), primary.submit_sell(size=3, price=100))
+
+    def test_reconnects_to_a_restarted_primary(self):
+        journal_path = os.path.join(self.directory, 'journal')
+        primary, publisher = self.create_primary(Journal(journal_path))
+        standby_exchange = Exchange()
+        standby = self.create_standby(standby_exchange)
+
+        order_ids = [primary.submit_buy(size=10, price=100)]
+        self.wait_until_caught_up(standby, publisher)
+        publisher.close()
+
+        self.wait_for(lambda: not standby.get_lag()['connected'])
+
+        restarted_primary, restarted_publisher = self.create_primary(Journal(journal_path))
+        restarted_primary.recover_from_journal()
+        order_ids.append(restarted_primary.submit_sell(size=4, price=100))
+
+        self.wait_until_caught_up(standby, restarted_publisher)
+
+        with standby.lock:
+            self.assert_same(restarted_primary, standby_exchange, order_ids)
+
+    def test_standby_ahead_of_primary_is_refused(self):
+        primary, publisher = self.create_primary()
+        standby_exchange = Exchange()
+        standby_exchange.submit_buy(size=1, price=1)
+
+        with self.assertLogs('exchange.components.replication', level='WARNING'):
+            standby = self.create_standby(standby_exchange)
+            self.wait_for(lambda: standby.get_lag()['connected'])
+            time.sleep(0.05)
+
+        self.assertEqual(standby.get_lag()['applied_sequence'], 1)
+
+    def test_metrics(self):
+        metrics = Metrics()
+        primary, publisher = self.create_primary()
+        standby = self.create_standby(metrics=metrics)
+
+        primary.submit_buy(size=1, price=1)
+        self.wait_until_caught_up(standby, publisher)
+
+        exported = metrics.to_prometheus()
+        self.assertIn('exchange_replication_lag_records 0\n', exported)
+        self.assertIn('exchange_replication_lag_seconds', exported)
+
+
+class TestReplicationStream(TestCase):
+    def test_frame(self):
+        frame = encode_frame(300, 301, 1700000000.5, b'records') + encode_frame(300, 301, 1700000000.6, b'')
+
+        first, end = decode_frame(frame, 0)
+        self.assertEqual(first, (300, 301, 1700000000.5, b'records'))
+
+        second, second_end = decode_frame(frame, end)
+        self.assertEqual(second, (300, 301, 1700000000.6, b''))
+        self.assertEqual(second_end, len(frame))
+
+        # Partial frames are left until the rest has been received
+        self.assertEqual(decode_frame(frame[:end - 1], 0), (None, 0))
+        self.assertEqual(decode_frame(frame[:2], 0), (None, 0))
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('127.0.0.1:5003'), (socket.AF_INET, ('127.0.0.1', 5003)))
+        self.assertEqual(parse_address(':5003'), (socket.AF_INET, ('127.0.0.1', 5003)))
+        self.assertEqual(parse_address('/tmp/exchange.sock'), (socket.AF_UNIX, '/tmp/exchange.sock'))
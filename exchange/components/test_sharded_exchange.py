@@ -0,0 +1,91 @@
+import os
+import tempfile
+from functools import partial
+from unittest import TestCase
+
+from sortedcontainers import SortedDict
+
+from exchange.components.exchange import Exchange
+from exchange.components.order import OrderType
+from exchange.components.sharded_exchange import ShardedExchange
+
+
+class TestShardedExchange(TestCase):
+    def setUp(self):
+        self.exchange = ShardedExchange(number_of_shards=2)
+
+    def tearDown(self):
+        self.exchange.close()
+
+    def test_symbols_are_traded_independently(self):
+        sell_order_id = self.exchange.submit_sell('ABC', size=10, price=100)
+        self.exchange.submit_sell('XYZ', size=10, price=100)
+        buy_order_id = self.exchange.submit_buy('ABC', size=4, price=100)
+
+        self.assertEqual(self.exchange.get_exchange_summary('ABC').sell_dict, SortedDict({100: 6}))
+        self.assertEqual(self.exchange.get_exchange_summary('XYZ').sell_dict, SortedDict({100: 10}))
+        self.assertEqual(self.exchange.get_exchange_depth('XYZ', 0).sell_dict, SortedDict())
+
+        # The order ids route back to the shard and symbol and the matches use the same ids
+        self.assertTrue(sell_order_id.startswith('{0}-ABC-'.format(self.exchange.get_shard('ABC'))))
+        summary = self.exchange.find_order_summary(sell_order_id)
+        self.assertEqual(summary['unmatched_size'], 6)
+        self.assertEqual(summary['matches'][0]['buy_order_id'], buy_order_id)
+        self.assertEqual(summary['matches'][0]['sell_order_id'], sell_order_id)
+
+        summary = self.exchange.find_order_summary(sell_order_id, after=1, limit=10)
+        self.assertEqual(summary['matches'], [])
+        self.assertEqual(summary['match_count'], 1)
+
+    def test_submit_batch(self):
+        results = self.exchange.submit_batch('ABC', [(OrderType.SELL, 10, 100), (OrderType.BUY, -1, 100)])
+
+        self.assertEqual(self.exchange.find_order_summary(results[0]['order_id'])['size'], 10)
+        self.assertIn('rejected', results[1])
+
+    def test_invalid_symbols_and_ids(self):
+        with self.assertRaises(ValueError):
+            self.exchange.submit_buy('A/B', size=10, price=100)
+
+        with self.assertRaises(ValueError):
+            self.exchange.submit_buy('ABC', size=-10, price=100)
+
+        self.assertIsNone(self.exchange.find_order_summary('I dont exist'))
+        self.assertIsNone(self.exchange.find_order_summary('9-ABC-123'))
+
+    def test_reads_do_not_create_exchanges(self):
+        directory = tempfile.mkdtemp()
+        exchange = ShardedExchange(number_of_shards=1, exchange_factory=partial(_create_recorded_exchange, directory))
+        self.addCleanup(exchange.close)
+
+        # A well formed id of a symbol without an exchange is not found and creates nothing
+        self.assertIsNone(exchange.find_order_summary('0-ABC-123'))
+
+        with self.assertRaises(KeyError):
+            exchange.cancel('0-ABC-123')
+
+        self.assertEqual(exchange.get_exchange_summary('ABC').sell_dict, SortedDict())
+        self.assertEqual(exchange.get_exchange_range('ABC', bucket=10).sell_dict, SortedDict())
+        self.assertEqual(os.listdir(directory), [])
+
+        exchange.submit_sell('ABC', size=10, price=100)
+        self.assertEqual(os.listdir(directory), ['ABC'])
+        self.assertEqual(exchange.get_exchange_summary('ABC').sell_dict, SortedDict({100: 10}))
+
+    def test_cancel(self):
+        sell_order_id = self.exchange.submit_sell('ABC', size=10, price=100)
+
+        self.assertTrue(self.exchange.cancel(sell_order_id)['cancelled'])
+        self.assertIsNone(self.exchange.cancel(sell_order_id))
+        self.assertEqual(self.exchange.get_exchange_summary('ABC').sell_dict, SortedDict())
+
+        with self.assertRaises(KeyError):
+            self.exchange.cancel('0-ABC-123')
+
+        with self.assertRaises(KeyError):
+            self.exchange.cancel('I dont exist')
+
+
+def _create_recorded_exchange(directory, symbol):
+    open(os.path.join(directory, symbol), 'w').close()
+    return Exchange()
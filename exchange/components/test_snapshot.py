@@ -0,0 +1,130 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from sortedcontainers import SortedDict
+
+from exchange.components.exchange import Exchange
+from exchange.components.journal import JOURNAL_HEADER, Journal
+from exchange.components.snapshot import Snapshot
+
+
+class TestSnapshot(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(directory, 'snapshot')
+        self.journal_path = os.path.join(directory, 'journal')
+
+    @staticmethod
+    def submit_orders(exchange):
+        return [
+            exchange.submit_buy(size=50, price=400),
+            exchange.submit_sell(size=10, price=200),
+            exchange.submit_buy(size=10, price=450),
+            exchange.submit_buy(size=20, price=450),
+            exchange.submit_sell(size=30, price=500),
+            exchange.submit_sell(size=5, price=500),
+            exchange.submit_buy(price=9223372036854775808, size=10),
+        ]
+
+    def test_restore_matches_original(self):
+        exchange = Exchange()
+        order_ids = self.submit_orders(exchange)
+        exchange.write_snapshot(self.snapshot_path)
+
+        restored_exchange = Exchange.from_snapshot(self.snapshot_path)
+
+        self.assertEqual(restored_exchange.get_exchange_summary().buy_dict, exchange.get_exchange_summary().buy_dict)
+        self.assertEqual(restored_exchange.get_exchange_summary().sell_dict, exchange.get_exchange_summary().sell_dict)
+
+        for order_id in order_ids:
+            self.assertEqual(restored_exchange.get_order(order_id).get_summary(),
+                             exchange.get_order(order_id).get_summary())
+
+        self.assertIsNone(restored_exchange.find_order('I dont exist'))
+
+    def test_restored_exchange_keeps_matching_in_fifo_order(self):
+        exchange = Exchange()
+        order_ids = self.submit_orders(exchange)
+        exchange.write_snapshot(self.snapshot_path)
+
+        restored_exchange = Exchange.from_snapshot(self.snapshot_path)
+
+        # Load one of the orders in the level before the level is used, it must be the same object the level matches
+        first_at_450 = restored_exchange.get_order(order_ids[2])
+
+        for current_exchange in (exchange, restored_exchange):
+            current_exchange.submit_sell(size=15, price=450)
+
+        self.assertEqual(first_at_450.get_unmatched_size(), 0)
+        self.assertEqual(restored_exchange.get_order(order_ids[3]).get_unmatched_size(), 15)
+        self.assertEqual(restored_exchange.get_exchange_summary().buy_dict, exchange.get_exchange_summary().buy_dict)
+
+        # New orders are never given the id of an order in the snapshot
+        self.assertNotIn(restored_exchange.submit_sell(size=5, price=1000), order_ids)
+
+        # A snapshot of a restored exchange includes the orders that were never read out of the first snapshot
+        restored_exchange.write_snapshot(self.snapshot_path)
+        restored_again = Exchange.from_snapshot(self.snapshot_path)
+
+        for order_id in order_ids:
+            self.assertEqual(restored_again.get_order(order_id).get_summary(),
+                             restored_exchange.get_order(order_id).get_summary())
+
+    def test_restore_then_replay_journal(self):
+        journal = Journal(self.journal_path)
+        exchange = Exchange(journal=journal, snapshot_path=self.snapshot_path, snapshot_every_orders=4)
+        order_ids = self.submit_orders(exchange)
+        journal.close()
+
+        restored_exchange = Exchange.from_snapshot(self.snapshot_path, journal=Journal(self.journal_path))
+
+        # The snapshot was written after 4 orders, the rest are replayed from the journal
+        self.assertEqual(restored_exchange.recover_from_journal(), 3)
+        self.assertEqual(restored_exchange.get_last_trade_sequence(), exchange.get_last_trade_sequence())
+
+        self.assertEqual(restored_exchange.get_exchange_summary().buy_dict, exchange.get_exchange_summary().buy_dict)
+        self.assertEqual(restored_exchange.get_exchange_summary().sell_dict, exchange.get_exchange_summary().sell_dict)
+
+        for order_id in order_ids:
+            self.assertEqual(restored_exchange.get_order(order_id).get_summary(),
+                             exchange.get_order(order_id).get_summary())
+
+    def test_only_journal_after_snapshot_is_read(self):
+        journal = Journal(self.journal_path)
+        exchange = Exchange(journal=journal, snapshot_path=self.snapshot_path, snapshot_every_orders=4)
+        self.submit_orders(exchange)
+        journal.close()
+
+        journal_offset = Snapshot.read_journal_offset(self.snapshot_path)
+        self.assertGreater(journal_offset, len(JOURNAL_HEADER))
+
+        # The records before the snapshot can not even be decoded any more, they must not be read
+        with open(self.journal_path, 'r+b') as journal_file:
+            journal_file.seek(len(JOURNAL_HEADER))
+            journal_file.write(b'\xff' * (journal_offset - len(JOURNAL_HEADER)))
+
+        restored_exchange = Exchange.from_snapshot(self.snapshot_path,
+                                                   journal=Journal(self.journal_path, scan_from=journal_offset))
+
+        self.assertEqual(restored_exchange.recover_from_journal(), 3)
+        self.assertEqual(restored_exchange.get_exchange_summary().buy_dict, exchange.get_exchange_summary().buy_dict)
+        self.assertEqual(restored_exchange.get_exchange_summary().sell_dict, exchange.get_exchange_summary().sell_dict)
+
+    def test_cancelled_orders_are_restored(self):
+        exchange = Exchange()
+        cancelled_order_id = exchange.submit_sell(size=10, price=100)
+        resting_order_id = exchange.submit_sell(size=20, price=100)
+        exchange.cancel(cancelled_order_id)
+        exchange.write_snapshot(self.snapshot_path)
+
+        restored_exchange = Exchange.from_snapshot(self.snapshot_path)
+        self.assertEqual(restored_exchange.get_exchange_summary().sell_dict, SortedDict({100: 20}))
+        self.assertTrue(restored_exchange.get_order(cancelled_order_id).cancelled)
+
+        buy_order_id = restored_exchange.submit_buy(size=15, price=100)
+        self.assertEqual(restored_exchange.get_order(buy_order_id).get_matches()[0].get_summary()['sell_order_id'],
+                         resting_order_id)
+
+        restored_exchange.cancel(resting_order_id)
+        self.assertEqual(restored_exchange.get_exchange_summary().sell_dict, SortedDict())
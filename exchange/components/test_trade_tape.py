@@ -0,0 +1,67 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.components.trade_tape import TradeTape, TradesUnavailableError
+
+
+class TestTradeTape(TestCase):
+    def test_matches_are_sequenced(self):
+        exchange = Exchange()
+
+        self.assertEqual(exchange.get_trades(since=0, limit=10), [])
+
+        sell_order_id = exchange.submit_sell(size=10, price=100)
+        exchange.submit_sell(size=10, price=101)
+        buy_order_id = exchange.submit_buy(size=15, price=101)
+
+        trades = exchange.get_trades(since=0, limit=10)
+        self.assertEqual([trade.sequence for trade in trades], [1, 2])
+        self.assertEqual(trades[0].get_summary()['sell_order_id'], sell_order_id)
+        self.assertEqual(trades[1].get_summary()['buy_order_id'], buy_order_id)
+        self.assertEqual(trades[1].size, 5)
+
+        self.assertEqual([trade.sequence for trade in exchange.get_trades(since=1, limit=10)], [2])
+        self.assertEqual([trade.sequence for trade in exchange.get_trades(since=0, limit=1)], [1])
+        self.assertEqual(exchange.get_trades(since=2, limit=10), [])
+        self.assertEqual(exchange.get_last_trade_sequence(), 2)
+
+    def test_gap_when_trades_have_been_dropped(self):
+        exchange = Exchange(trade_tape=TradeTape(max_trades=2))
+
+        for _ in range(3):
+            exchange.submit_sell(size=10, price=100)
+            exchange.submit_buy(size=10, price=100)
+
+        self.assertEqual([trade.sequence for trade in exchange.get_trades(since=1, limit=10)], [2, 3])
+
+        with self.assertRaises(TradesUnavailableError) as context:
+            exchange.get_trades(since=0, limit=10)
+
+        self.assertEqual(context.exception.first_available_sequence, 2)
+
+    def test_restored_exchange_has_no_earlier_trades(self):
+        snapshot_path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        exchange = Exchange()
+
+        for _ in range(3):
+            exchange.submit_sell(size=10, price=100)
+            exchange.submit_buy(size=10, price=100)
+
+        exchange.write_snapshot(snapshot_path)
+        restored_exchange = Exchange.from_snapshot(snapshot_path)
+
+        # The trades before the snapshot are not on the tape of the restored exchange
+        with self.assertRaises(TradesUnavailableError) as context:
+            restored_exchange.get_trades(since=0, limit=10)
+
+        self.assertEqual(context.exception.first_available_sequence, 4)
+        self.assertEqual(restored_exchange.get_trades(since=3, limit=10), [])
+        self.assertEqual(restored_exchange.get_memory_usage()['trade_tape']['count'], 0)
+
+        restored_exchange.submit_sell(size=10, price=100)
+        restored_exchange.submit_buy(size=10, price=100)
+
+        self.assertEqual([trade.sequence for trade in restored_exchange.get_trades(since=3, limit=10)], [4])
+        self.assertEqual(restored_exchange.get_memory_usage()['trade_tape']['count'], 1)
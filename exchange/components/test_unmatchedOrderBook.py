@@ -1,5 +1,7 @@
 from unittest import TestCase
 
+from sortedcontainers import SortedDict
+
 from exchange.components.order import Order, OrderType
 from exchange.components.unmatched_order_book import UnmatchedOrderBook
 
@@ -67,3 +69,131 @@ class TestUnmatchedOrderBook(TestCase):
         self.assertEqual(unmatched_order_book.pop_best_buy_order(), second_order)
         self.assertEqual(unmatched_order_book.pop_best_buy_order(), third_order)
         self.assertEqual(unmatched_order_book.pop_best_buy_order(), fourth_low_buy_order)
+
+    def test_get_summary_tracks_partial_fills(self):
+        unmatched_order_book = UnmatchedOrderBook()
+
+        unmatched_order_book.add_sell_order(Order(100, 30, OrderType.SELL))
+        unmatched_order_book.add_sell_order(Order(100, 20, OrderType.SELL))
+        unmatched_order_book.add_sell_order(Order(200, 10, OrderType.SELL))
+
+        self.assertEqual(unmatched_order_book.get_summary().sell_dict, SortedDict({100: 50, 200: 10}))
+
+        unmatched_order_book.fill_best_sell_order(5)
+        self.assertEqual(unmatched_order_book.get_summary().sell_dict, SortedDict({100: 45, 200: 10}))
+
+    def test_get_depth(self):
+        unmatched_order_book = UnmatchedOrderBook()
+
+        for price in [100, 101, 102, 103]:
+            unmatched_order_book.add_buy_order(Order(price, 10, OrderType.BUY))
+
+        for price in [110, 111, 112]:
+            unmatched_order_book.add_sell_order(Order(price, 20, OrderType.SELL))
+
+        summary = unmatched_order_book.get_depth(2)
+        self.assertEqual(summary.buy_dict, SortedDict({102: 10, 103: 10}))
+        self.assertEqual(summary.sell_dict, SortedDict({110: 20, 111: 20}))
+
+        summary = unmatched_order_book.get_depth(10)
+        self.assertEqual(summary.buy_dict, unmatched_order_book.get_summary().buy_dict)
+        self.assertEqual(summary.sell_dict, unmatched_order_book.get_summary().sell_dict)
+
+        self.assertEqual(unmatched_order_book.get_depth(0).buy_dict, SortedDict())
+
+        with self.assertRaises(ValueError):
+            unmatched_order_book.get_depth(-1)
+
+    def test_get_range(self):
+        unmatched_order_book = UnmatchedOrderBook()
+
+        for price in [95, 100, 101, 102, 103]:
+            unmatched_order_book.add_buy_order(Order(price, 10, OrderType.BUY))
+
+        for price in [110, 111, 112, 125]:
+            unmatched_order_book.add_sell_order(Order(price, 20, OrderType.SELL))
+
+        summary = unmatched_order_book.get_range(101, 111)
+        self.assertEqual(summary.buy_dict, SortedDict({101: 10, 102: 10, 103: 10}))
+        self.assertEqual(summary.sell_dict, SortedDict({110: 20, 111: 20}))
+
+        # Either bound can be left open
+        self.assertEqual(unmatched_order_book.get_range(max_price=100).buy_dict, SortedDict({95: 10, 100: 10}))
+        self.assertEqual(unmatched_order_book.get_range(min_price=112).sell_dict, SortedDict({112: 20, 125: 20}))
+
+        # Buckets are keyed by their lowest price
+        summary = unmatched_order_book.get_range(bucket=10)
+        self.assertEqual(summary.buy_dict, SortedDict({90: 10, 100: 40}))
+        self.assertEqual(summary.sell_dict, SortedDict({110: 60, 120: 20}))
+
+        summary = unmatched_order_book.get_range(96, 111, bucket=5)
+        self.assertEqual(summary.buy_dict, SortedDict({100: 40}))
+        self.assertEqual(summary.sell_dict, SortedDict({110: 40}))
+
+        # A summary is cut the same way as the order book
+        whole_summary = unmatched_order_book.get_summary().get_range(96, 111, bucket=5)
+        self.assertEqual(whole_summary.buy_dict, summary.buy_dict)
+        self.assertEqual(whole_summary.sell_dict, summary.sell_dict)
+
+        self.assertEqual(unmatched_order_book.get_range(104, 109).buy_dict, SortedDict())
+
+        with self.assertRaises(ValueError):
+            unmatched_order_book.get_range(111, 101)
+
+        with self.assertRaises(ValueError):
+            unmatched_order_book.get_range(bucket=0)
+
+    def test_cancelled_orders_are_skipped_and_compacted(self):
+        unmatched_order_book = UnmatchedOrderBook()
+        orders = [Order(price=100, size=1, order_type=OrderType.BUY) for _ in range(200)]
+
+        for order in orders:
+            unmatched_order_book.add_buy_order(order)
+
+        # Cancel every order but the last of each 4
+        for position, order in enumerate(orders):
+            if position % 4 != 3:
+                order.cancel()
+                unmatched_order_book.cancel_order(order)
+
+        self.assertEqual(unmatched_order_book.get_summary().buy_dict, SortedDict({100: 50}))
+
+        level = unmatched_order_book.get_buy_levels()[0]
+        self.assertEqual(len(level), 50)
+        self.assertEqual(list(level), orders[3::4])
+
+        # Once cancelled orders were most of the queue it was rebuilt without them
+        self.assertLess(len(level._orders), 100)
+
+        for order in orders[3::4]:
+            self.assertIs(unmatched_order_book.peek_best_buy_order(), order)
+            self.assertIs(unmatched_order_book.pop_best_buy_order(), order)
+
+        self.assertIsNone(unmatched_order_book.peek_best_buy_order())
+
+    def test_version_changes_with_every_change(self):
+        unmatched_order_book = UnmatchedOrderBook()
+        versions = [unmatched_order_book.get_version()]
+
+        first_order = Order(100, 10, OrderType.BUY)
+        second_order = Order(100, 10, OrderType.BUY)
+        unmatched_order_book.add_buy_order(first_order)
+        versions.append(unmatched_order_book.get_version())
+        unmatched_order_book.add_buy_order(second_order)
+        versions.append(unmatched_order_book.get_version())
+
+        # Reading the order book does not change it
+        unmatched_order_book.peek_best_buy_order()
+        unmatched_order_book.get_summary()
+        unmatched_order_book.get_depth(1)
+        self.assertEqual(unmatched_order_book.get_version(), versions[-1])
+
+        unmatched_order_book.fill_best_buy_order(4)
+        versions.append(unmatched_order_book.get_version())
+        unmatched_order_book.pop_best_buy_order()
+        versions.append(unmatched_order_book.get_version())
+        second_order.cancel()
+        unmatched_order_book.cancel_order(second_order)
+        versions.append(unmatched_order_book.get_version())
+
+        self.assertEqual(len(set(versions)), len(versions))
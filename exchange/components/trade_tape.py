@@ -0,0 +1,71 @@
+import sys
+
+
+class TradesUnavailableError(LookupError):
+    """
+    The trades asked for have already been dropped from the TradeTape
+    """
+    def __init__(self, since, first_available_sequence):
+        super().__init__('Trades after {0} are no longer available, the first available trade is {1}'.format(
+            since, first_available_sequence))
+        self.first_available_sequence = first_available_sequence
+
+
+class TradeTape:
+    """
+    Every Match made by the Exchange, in the order they were made, for downstream consumers to tail.
+
+    Each match gets the next global sequence number when it is appended. Only the most recent max_trades matches are
+    kept, in a ring buffer, so reading the matches after a sequence number costs O(number of matches returned).
+    """
+    def __init__(self, max_trades=100000):
+        if max_trades < 1:
+            raise ValueError('max_trades {0} must be at least 1'.format(max_trades))
+
+        self._trades = [None] * max_trades
+        self._next_sequence = 1
+
+        # Sequence number of the first match put on the tape, later than 1 once restored, see set_next_sequence
+        self._first_sequence = 1
+
+    def append(self, match):
+        """Give the match the next sequence number and add it to the tape"""
+        match.sequence = self._next_sequence
+        self._trades[self._next_sequence % len(self._trades)] = match
+        self._next_sequence += 1
+
+    def get_last_sequence(self):
+        """:return: int sequence number of the last match, 0 if there have not been any"""
+        return self._next_sequence - 1
+
+    def get_first_available_sequence(self):
+        """:return: int sequence number of the oldest match still on the tape"""
+        return max(self._next_sequence - len(self._trades), self._first_sequence)
+
+    def set_next_sequence(self, next_sequence):
+        """Continue the sequence numbers of a restored exchange. The matches before it are not on the tape."""
+        self._trades = [None] * len(self._trades)
+        self._next_sequence = next_sequence
+        self._first_sequence = next_sequence
+
+    def get_memory_usage(self):
+        """:return: dict of the count of matches on the tape and the bytes of the tape, the Matches are counted apart"""
+        return {
+            'count': self.get_last_sequence() - self.get_first_available_sequence() + 1,
+            'bytes': sys.getsizeof(self._trades),
+        }
+
+    def get_trades(self, since, limit):
+        """
+        :param since: int sequence number of the last match the caller has seen, 0 to start from the beginning
+        :param limit: int max number of matches to return
+        :return: list of Match with a sequence number greater than since, oldest first
+        :raises TradesUnavailableError: if matches after since have already been dropped from the tape
+        """
+        if since + 1 < self.get_first_available_sequence() and since < self.get_last_sequence():
+            raise TradesUnavailableError(since, self.get_first_available_sequence())
+
+        first = max(since + 1, 1)
+        last = min(first + max(limit, 0), self._next_sequence)
+
+        return [self._trades[sequence % len(self._trades)] for sequence in range(first, last)]
@@ -1,5 +1,10 @@
+import sys
+
 from sortedcontainers import SortedDict
-from collections import deque
+
+from exchange.components.memory_report import POINTER_SIZE, SAMPLE_SIZE, estimate_bytes, sample
+from exchange.components.order import OrderType
+from exchange.components.price_level import PriceLevel
 
 
 class UnmatchedOrderBook:
@@ -9,12 +14,49 @@ class UnmatchedOrderBook:
     Never put an order that can be matched into this order book. Orders come in and they are either executed
     immediately, stored or partially executed and the remainder is stored. This is an UnmatchedOrderBook
     """
-    def __init__(self):
-        # orders will be stored in a SortedDict of Queues. The price will be the key to the sorted dict
+    def __init__(self, price_levels_factory=SortedDict):
+        """
+        :param price_levels_factory: function returning an empty map of price to PriceLevel for each side of the book.
+                                     SortedDict by default, see ArrayPriceLadder for a bounded band of prices. The map
+                                     only needs the part of the SortedDict API used here: get, in, [], del, len, update,
+                                     peekitem(0) / peekitem(-1), keys, values, islice and irange.
+        """
+        # orders will be stored in a SortedDict of PriceLevels (Queues). The price will be the key to the sorted dict
         # The lowest / highest price is at the start / end of the SortedDict
         # SortedDict maintains a sorted list of the keys, sorting on insertion.
-        self._buy_orders = SortedDict()
-        self._sell_orders = SortedDict()
+        # Each PriceLevel tracks the total unmatched size it holds so summaries never walk the queues.
+        self._buy_orders = price_levels_factory()
+        self._sell_orders = price_levels_factory()
+
+        # Told about every change to the total size of a price level, see set_level_listener
+        self._level_listener = None
+
+        # Bumped by every change to the order book, see get_version
+        self._version = 0
+
+    @classmethod
+    def from_levels(cls, buy_levels, sell_levels, price_levels_factory=SortedDict):
+        """
+        Rebuild an order book from its price levels, e.g. when it is loaded from a snapshot
+        :param buy_levels: iterable of PriceLevel
+        :param sell_levels: iterable of PriceLevel
+        :param price_levels_factory: see __init__
+        :return: UnmatchedOrderBook
+        """
+        order_book = cls(price_levels_factory)
+
+        order_book._buy_orders.update((level.price, level) for level in buy_levels)
+        order_book._sell_orders.update((level.price, level) for level in sell_levels)
+
+        return order_book
+
+    def set_level_listener(self, level_listener):
+        """
+        :param level_listener: function(OrderType, price, total size) called whenever the total size of a price level
+                               changes. The total size is 0 when the level is removed. It is called on the matching path
+                               so it must be cheap.
+        """
+        self._level_listener = level_listener
 
     def add_sell_order(self, order):
         self.__add_order(self._sell_orders, order)
@@ -34,7 +76,7 @@ class UnmatchedOrderBook:
 
         # Get the last (highest pried) item from it's queue in the SortedDict
         price, queue = self._buy_orders.peekitem()
-        return queue[0]
+        return queue.peek()
 
     def peek_best_sell_order(self):
         """
@@ -48,7 +90,7 @@ class UnmatchedOrderBook:
 
         # Get the first (lowest pried) item from it's queue in the SortedDict
         price, queue = self._sell_orders.peekitem(0)
-        return queue[0]
+        return queue.peek()
 
     def pop_best_buy_order(self):
         """
@@ -63,11 +105,15 @@ class UnmatchedOrderBook:
         price, queue = self._buy_orders.peekitem()
 
         best_price_order = queue.popleft()
+        self._version += 1
 
         # delete the key from the orderbook if there are no more orders at that price (deque is empty)
         if not queue:
             del self._buy_orders[price]
 
+        if self._level_listener is not None:
+            self._level_listener(OrderType.BUY, price, queue.total_size if queue else 0)
+
         return best_price_order
 
     def pop_best_sell_order(self):
@@ -78,54 +124,239 @@ class UnmatchedOrderBook:
         price, queue = self._sell_orders.peekitem(0)
 
         best_price_order = queue.popleft()
+        self._version += 1
 
         # delete the key from the orderbook if there are no more orders at that price (deque is empty)
         if not queue:
             del self._sell_orders[price]
 
+        if self._level_listener is not None:
+            self._level_listener(OrderType.SELL, price, queue.total_size if queue else 0)
+
         return best_price_order
 
+    def peek_best_buy_level(self):
+        """
+        The price level with the highest price. Keep it in the order book, it must not be changed.
+        :return: PriceLevel or None if there are no buy orders
+        """
+        if not self._buy_orders:
+            return None
+
+        return self._buy_orders.peekitem()[1]
+
+    def peek_best_sell_level(self):
+        """
+        The price level with the lowest price. Keep it in the order book, it must not be changed.
+        :return: PriceLevel or None if there are no sell orders
+        """
+        if not self._sell_orders:
+            return None
+
+        return self._sell_orders.peekitem(0)[1]
+
+    def pop_best_buy_level(self):
+        """
+        Remove the whole best buy price level at once, e.g. when every order in it is about to be fully matched
+        :return: PriceLevel, iterate it for its orders in FIFO order
+        """
+        price, queue = self._buy_orders.peekitem()
+        del self._buy_orders[price]
+        self._version += 1
+
+        if self._level_listener is not None:
+            self._level_listener(OrderType.BUY, price, 0)
+
+        return queue
+
+    def pop_best_sell_level(self):
+        """
+        Remove the whole best sell price level at once, e.g. when every order in it is about to be fully matched
+        :return: PriceLevel, iterate it for its orders in FIFO order
+        """
+        price, queue = self._sell_orders.peekitem(0)
+        del self._sell_orders[price]
+        self._version += 1
+
+        if self._level_listener is not None:
+            self._level_listener(OrderType.SELL, price, 0)
+
+        return queue
+
+    def cancel_order(self, order):
+        """
+        Remove a cancelled order from the order book. The order is left in its price level as a tombstone and skipped
+        when it reaches the front of the queue, so this does not search the queue, see PriceLevel.cancel
+        :param order: Order in the order book that has just been cancelled
+        """
+        order_dict = self._buy_orders if order.order_type == OrderType.BUY else self._sell_orders
+
+        queue = order_dict[order.price]
+        queue.cancel(order)
+        self._version += 1
+
+        # delete the key from the orderbook if there are no more orders at that price
+        if not queue:
+            del order_dict[order.price]
+
+        if self._level_listener is not None:
+            self._level_listener(order.order_type, order.price, queue.total_size if queue else 0)
+
+    def fill_best_buy_order(self, size):
+        """
+        The best buy order has been matched against an incoming sell order. Keep the size of its price level up to date.
+        The matched order stays in the queue, pop it once it has been fully matched.
+        :param size: int number of units matched
+        """
+        price, queue = self._buy_orders.peekitem()
+        queue.reduce_total_size(size)
+        self._version += 1
+
+        if self._level_listener is not None:
+            self._level_listener(OrderType.BUY, price, queue.total_size)
+
+    def fill_best_sell_order(self, size):
+        """
+        The best sell order has been matched against an incoming buy order. Keep the size of its price level up to date.
+        The matched order stays in the queue, pop it once it has been fully matched.
+        :param size: int number of units matched
+        """
+        price, queue = self._sell_orders.peekitem(0)
+        queue.reduce_total_size(size)
+        self._version += 1
+
+        if self._level_listener is not None:
+            self._level_listener(OrderType.SELL, price, queue.total_size)
+
+    def get_version(self):
+        """
+        :return: int that changes whenever an order is added, filled, popped or cancelled. Anything derived from the
+                 order book, e.g. an encoded summary, can be reused for as long as the version stays the same.
+        """
+        return self._version
+
+    def get_buy_levels(self):
+        """:return: iterable of PriceLevel from the lowest to the highest price"""
+        return self._buy_orders.values()
+
+    def get_sell_levels(self):
+        """:return: iterable of PriceLevel from the lowest to the highest price"""
+        return self._sell_orders.values()
+
+    def get_buy_level_count(self):
+        return len(self._buy_orders)
+
+    def get_sell_level_count(self):
+        return len(self._sell_orders)
+
     def get_summary(self):
         summary = UnmatchedOrderBookSummary()
 
-        summary.buy_dict = self.__summarise_order_dict(self._buy_orders)
-        summary.sell_dict = self.__summarise_order_dict(self._sell_orders)
+        summary.buy_dict = self.__summarise_order_dict(self._buy_orders, self._buy_orders.keys())
+        summary.sell_dict = self.__summarise_order_dict(self._sell_orders, self._sell_orders.keys())
 
         return summary
 
-    @staticmethod
-    def __summarise_order_dict(order_dict):
+    def get_depth(self, n):
         """
-        This could be faster. I could eliminate the need to itterate over the queue by making a queue class that
-        tracks the size of the orders that it contains. It will always need to check the order at the end of the
-        queue as this order's unmatched size can change.
+        Summarise the best n price levels on each side of the book.
+        Only the returned levels are visited, so this is O(n) however many orders or levels are on the book.
+        :param n: int number of price levels per side
+        :return: UnmatchedOrderBookSummary
         """
-        order_dict_summary = SortedDict()
+        if n < 0:
+            raise ValueError('Depth {0} must not be negative'.format(n))
+
+        summary = UnmatchedOrderBookSummary()
 
-        for price in order_dict.iterkeys():
+        # The best buy prices are at the end of the SortedDict, the best sell prices are at the start
+        best_buy_prices = self._buy_orders.islice(start=max(len(self._buy_orders) - n, 0))
+        best_sell_prices = self._sell_orders.islice(stop=n)
 
-            total_size = 0
-            new_queue = deque()
+        summary.buy_dict = self.__summarise_order_dict(self._buy_orders, best_buy_prices)
+        summary.sell_dict = self.__summarise_order_dict(self._sell_orders, best_sell_prices)
 
-            for order in order_dict[price]:
-                new_queue.append(order)
-                total_size += order.get_unmatched_size()
+        return summary
+
+    def get_range(self, min_price=None, max_price=None, bucket=None):
+        """
+        Summarise the price levels from min_price to max_price on each side of the book. The prices are found by
+        bisecting the sorted prices, so only the k levels in the range are visited: O(log n + k).
+        :param min_price: int lowest price, inclusive, None for no lower bound
+        :param max_price: int highest price, inclusive, None for no upper bound
+        :param bucket: int, add the levels up into buckets of this many ticks keyed by the lowest price of each bucket,
+                       None for every level on its own
+        :return: UnmatchedOrderBookSummary
+        """
+        _check_range(min_price, max_price, bucket)
 
-                order_dict[price] = new_queue
+        summary = UnmatchedOrderBookSummary()
 
-            order_dict_summary[price] = total_size
+        summary.buy_dict = _add_up(((price, self._buy_orders[price].total_size)
+                                    for price in self._buy_orders.irange(min_price, max_price)), bucket)
+        summary.sell_dict = _add_up(((price, self._sell_orders[price].total_size)
+                                     for price in self._sell_orders.irange(min_price, max_price)), bucket)
 
-        return order_dict_summary
+        return summary
+
+    def get_best_levels(self, n):
+        """
+        The best n price levels on each side of the book as flat lists, cheaper than get_depth when the levels are only
+        going to be copied somewhere else
+        :param n: int number of price levels per side
+        :return: (buy prices, buy sizes, sell prices, sell sizes), lists from the lowest to the highest price
+        """
+        buy_prices = list(self._buy_orders.islice(start=max(len(self._buy_orders) - n, 0)))
+        sell_prices = list(self._sell_orders.islice(stop=n))
+
+        return buy_prices, [self._buy_orders[price].total_size for price in buy_prices], \
+            sell_prices, [self._sell_orders[price].total_size for price in sell_prices]
+
+    def get_memory_usage(self, sample_size=SAMPLE_SIZE):
+        """
+        Approximate memory of the price levels of each side, estimated from sample_size levels of each. The orders in
+        the levels are counted by the OrderStore.
+        :return: dict of structure name to dict of its count and bytes
+        """
+        usage = dict()
+
+        for name, levels in (('buy_levels', self._buy_orders), ('sell_levels', self._sell_orders)):
+            sampled = sample(levels.items(), len(levels), sample_size)
+
+            # The hash table and the sorted keys, then each price and level
+            usage[name] = {
+                'count': len(levels),
+                'bytes': sys.getsizeof(levels) + POINTER_SIZE * len(levels) + estimate_bytes(
+                    sampled, len(levels), lambda item: sys.getsizeof(item[0]) + item[1].get_memory_size()),
+            }
+
+        return usage
 
     @staticmethod
-    def __add_order(sorted_dict, order):
+    def __summarise_order_dict(order_dict, prices):
+        """
+        Each PriceLevel tracks its own total unmatched size, so this only visits each price once
+        """
+        order_dict_summary = SortedDict()
+
+        for price in prices:
+            order_dict_summary[price] = order_dict[price].total_size
+
+        return order_dict_summary
+
+    def __add_order(self, sorted_dict, order):
+        queue = sorted_dict.get(order.price)
+
         # No current orders at this price, create a new queue at this price containing the orders
-        if order.price not in sorted_dict:
-            sorted_dict[order.price] = deque([order])
-            return
+        if queue is None:
+            queue = sorted_dict[order.price] = PriceLevel(order.price)
 
         # Add the order to the queue at it's price
-        sorted_dict[order.price].append(order)
+        queue.append(order)
+        self._version += 1
+
+        if self._level_listener is not None:
+            self._level_listener(order.order_type, order.price, queue.total_size)
 
 
 class UnmatchedOrderBookSummary:
@@ -137,3 +368,67 @@ class UnmatchedOrderBookSummary:
     def __init__(self):
         self.buy_dict = SortedDict()
         self.sell_dict = SortedDict()
+
+    def get_depth(self, n):
+        """
+        :param n: int number of price levels per side
+        :return: UnmatchedOrderBookSummary of the best n price levels on each side of this summary
+        """
+        if n < 0:
+            raise ValueError('Depth {0} must not be negative'.format(n))
+
+        summary = UnmatchedOrderBookSummary()
+
+        # The best buy prices are at the end of the SortedDict, the best sell prices are at the start
+        summary.buy_dict = SortedDict(
+            (price, self.buy_dict[price]) for price in self.buy_dict.islice(start=max(len(self.buy_dict) - n, 0)))
+        summary.sell_dict = SortedDict((price, self.sell_dict[price]) for price in self.sell_dict.islice(stop=n))
+
+        return summary
+
+    def get_range(self, min_price=None, max_price=None, bucket=None):
+        """
+        :return: UnmatchedOrderBookSummary of the price levels of this summary from min_price to max_price, in buckets
+                 of bucket ticks when it is set, see UnmatchedOrderBook.get_range
+        """
+        _check_range(min_price, max_price, bucket)
+
+        summary = UnmatchedOrderBookSummary()
+
+        summary.buy_dict = _add_up(((price, self.buy_dict[price])
+                                    for price in self.buy_dict.irange(min_price, max_price)), bucket)
+        summary.sell_dict = _add_up(((price, self.sell_dict[price])
+                                     for price in self.sell_dict.irange(min_price, max_price)), bucket)
+
+        return summary
+
+
+def _check_range(min_price, max_price, bucket):
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValueError('min price {0} must not be greater than max price {1}'.format(min_price, max_price))
+
+    if bucket is not None and bucket < 1:
+        raise ValueError('Bucket {0} must be at least 1'.format(bucket))
+
+
+def _add_up(levels, bucket):
+    """
+    :param levels: iterable of (price, size) from the lowest to the highest price
+    :param bucket: int ticks per bucket, or None to keep every level on its own
+    :return: SortedDict of price, or lowest price of the bucket, to size
+    """
+    if bucket is None:
+        return SortedDict(levels)
+
+    buckets = []
+
+    for price, size in levels:
+        bucket_price = price - price % bucket
+
+        # The levels are in order of price, so a bucket only ever grows while it is the last one
+        if buckets and buckets[-1][0] == bucket_price:
+            buckets[-1][1] += size
+        else:
+            buckets.append([bucket_price, size])
+
+    return SortedDict(buckets)
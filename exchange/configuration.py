@@ -0,0 +1,210 @@
+"""
+Build the Exchange served by the APIs from environment variables, see README.txt
+"""
+import os
+from functools import partial
+
+from sortedcontainers import SortedDict
+
+from exchange.components.admission_control import AdmissionController
+from exchange.components.exchange import Exchange
+from exchange.components.journal import Journal
+from exchange.components.memory_report import MemoryMonitor
+from exchange.components.metrics import Metrics
+from exchange.components.order_book_replica import MAX_LEVELS, ORDER_SLOTS, OrderBookReplicaPublisher
+from exchange.components.order_id import load_or_create_key, set_key
+from exchange.components.order_store import OrderStore
+from exchange.components.price_ladder import ArrayPriceLadder
+from exchange.components.replication import ReplicationPublisher, ReplicationStandby
+from exchange.components.snapshot import Snapshot
+
+
+def create_exchange(environ=os.environ, name=None):
+    """
+    Build the exchange and recover its state from the last snapshot and the journal, if they are configured
+    :param environ: dict of settings, defaults to the environment variables
+    :param name: set when there is more than one exchange (one per symbol), appended to every file path
+    :return: Exchange
+    """
+    _configure_order_id_key(environ)
+
+    # Fully matched orders are kept in memory unless a cache size is set. Orders evicted from the cache are archived on
+    # disk when an archive path is set, otherwise they are discarded
+    order_store = OrderStore(
+        max_cached_orders=_get_int(environ, 'EXCHANGE_ORDER_CACHE_SIZE'),
+        archive_path=_get_path(environ, 'EXCHANGE_ORDER_ARCHIVE_PATH', name)
+    )
+
+    # Latency histograms and counters are recorded unless EXCHANGE_METRICS is 0, which leaves the hot path untouched
+    metrics = Metrics() if environ.get('EXCHANGE_METRICS', '1') != '0' else None
+
+    # A snapshot is written every so many orders when a snapshot path is set. Startup restores the last snapshot and
+    # only reads the journal written after it, from the journal offset recorded in the snapshot.
+    snapshot_path = _get_path(environ, 'EXCHANGE_SNAPSHOT_PATH', name)
+    snapshot_every_orders = _get_int(environ, 'EXCHANGE_SNAPSHOT_EVERY_ORDERS')
+    snapshot_exists = bool(snapshot_path) and os.path.exists(snapshot_path)
+    journal_offset = Snapshot.read_journal_offset(snapshot_path) if snapshot_exists else 0
+
+    # Every accepted order is journaled when a journal path is set. The journal is replayed on startup.
+    journal = None
+    journal_path = _get_path(environ, 'EXCHANGE_JOURNAL_PATH', name)
+
+    if journal_path:
+        journal = Journal(
+            journal_path,
+            fsync_every_events=_get_int(environ, 'EXCHANGE_JOURNAL_FSYNC_EVENTS') or 1,
+            fsync_interval_us=_get_int(environ, 'EXCHANGE_JOURNAL_FSYNC_INTERVAL_US'),
+            scan_from=journal_offset or None
+        )
+
+    # Every accepted order is also streamed to the hot standbys that connect to EXCHANGE_REPLICATION_ADDRESS when it is
+    # set, see replication. Only one exchange per process can listen on it, so not one per symbol.
+    replication_address = environ.get('EXCHANGE_REPLICATION_ADDRESS')
+
+    if replication_address and not name:
+        journal = ReplicationPublisher(replication_address, journal, metrics=metrics)
+
+    # Price levels inside the band are held in a preallocated array when a band is set, any other price still works
+    price_levels_factory = SortedDict
+    min_price = _get_int(environ, 'EXCHANGE_PRICE_BAND_MIN')
+    max_price = _get_int(environ, 'EXCHANGE_PRICE_BAND_MAX')
+
+    if min_price is not None and max_price is not None:
+        price_levels_factory = partial(ArrayPriceLadder, min_price, max_price)
+
+    if snapshot_exists:
+        exchange = Exchange.from_snapshot(snapshot_path, order_store, journal, snapshot_path, snapshot_every_orders,
+                                          metrics=metrics, price_levels_factory=price_levels_factory)
+    else:
+        exchange = Exchange(order_store, journal, snapshot_path, snapshot_every_orders, metrics=metrics,
+                            price_levels_factory=price_levels_factory)
+
+    if journal is not None:
+        exchange.recover_from_journal()
+
+    return exchange
+
+
+def create_symbol_exchange(symbol):
+    """
+    Build the exchange for one symbol of a ShardedExchange from the environment variables
+    :param symbol: str
+    :return: Exchange
+    """
+    return create_exchange(name=symbol)
+
+
+def create_replica_publisher(exchange, environ=os.environ):
+    """
+    Publish the exchange into shared memory for the read replicas of replica_api.py when EXCHANGE_REPLICA_NAME is set
+    :param exchange: Exchange owned by the caller
+    :return: OrderBookReplicaPublisher or None
+    """
+    name = environ.get('EXCHANGE_REPLICA_NAME')
+
+    if not name:
+        return None
+
+    return OrderBookReplicaPublisher(
+        exchange,
+        name,
+        max_levels=_get_int(environ, 'EXCHANGE_REPLICA_LEVELS') or MAX_LEVELS,
+        order_slots=_get_int(environ, 'EXCHANGE_REPLICA_ORDER_SLOTS') or ORDER_SLOTS
+    )
+
+
+def create_admission_controller(metrics=None, environ=os.environ):
+    """
+    Limit the orders of each client and the requests in flight when EXCHANGE_RATE_LIMIT_PER_SECOND or
+    EXCHANGE_MAX_IN_FLIGHT_REQUESTS is set
+    :param metrics: Metrics to count admitted and rejected requests in
+    :return: AdmissionController or None
+    """
+    rate = _get_float(environ, 'EXCHANGE_RATE_LIMIT_PER_SECOND')
+    max_in_flight = _get_int(environ, 'EXCHANGE_MAX_IN_FLIGHT_REQUESTS')
+
+    if rate is None and max_in_flight is None:
+        return None
+
+    return AdmissionController(
+        rate=rate,
+        burst=_get_float(environ, 'EXCHANGE_RATE_LIMIT_BURST'),
+        max_in_flight=max_in_flight,
+        metrics=metrics
+    )
+
+
+def create_memory_monitor(metrics=None, environ=os.environ):
+    """
+    Warn about or reject new orders over a resident memory threshold when EXCHANGE_MEMORY_WARNING_MB or
+    EXCHANGE_MEMORY_REJECT_MB is set, taking them again under EXCHANGE_MEMORY_RESUME_MB
+    :param metrics: Metrics to export the memory in use in
+    :return: MemoryMonitor or None
+    """
+    warning_mb = _get_int(environ, 'EXCHANGE_MEMORY_WARNING_MB')
+    reject_mb = _get_int(environ, 'EXCHANGE_MEMORY_REJECT_MB')
+    resume_mb = _get_int(environ, 'EXCHANGE_MEMORY_RESUME_MB')
+
+    if warning_mb is None and reject_mb is None:
+        return None
+
+    return MemoryMonitor(
+        warning_bytes=warning_mb * 1024 * 1024 if warning_mb is not None else None,
+        reject_bytes=reject_mb * 1024 * 1024 if reject_mb is not None else None,
+        resume_bytes=resume_mb * 1024 * 1024 if resume_mb is not None else None,
+        metrics=metrics
+    )
+
+
+def create_standby(exchange, environ=os.environ):
+    """
+    Make the exchange a hot standby of the primary at EXCHANGE_STANDBY_OF when it is set. Start it once everything
+    that reads the exchange holds its lock.
+    :param exchange: Exchange recovered from the journal of the standby, if it has one
+    :return: ReplicationStandby or None
+    """
+    address = environ.get('EXCHANGE_STANDBY_OF')
+
+    if not address:
+        return None
+
+    return ReplicationStandby(exchange, address, metrics=exchange.get_metrics())
+
+
+def _configure_order_id_key(environ):
+    """
+    Order ids are encoded with a secret key, see order_id. Ids given out before a restart have to keep working when the
+    orders are persisted, so the key is either set in EXCHANGE_ORDER_ID_KEY as hex or kept in a file next to the
+    journal, snapshot or archive. It is the same file for every symbol. Otherwise a random key is used.
+    """
+    key = environ.get('EXCHANGE_ORDER_ID_KEY')
+
+    if key:
+        set_key(bytes.fromhex(key))
+        return
+
+    for name in ('EXCHANGE_JOURNAL_PATH', 'EXCHANGE_SNAPSHOT_PATH', 'EXCHANGE_ORDER_ARCHIVE_PATH'):
+        path = environ.get(name)
+
+        if path:
+            set_key(load_or_create_key(path + '.key'))
+            return
+
+
+def _get_path(environ, name, suffix):
+    path = environ.get(name)
+
+    if path and suffix:
+        return '{0}.{1}'.format(path, suffix)
+
+    return path
+
+
+def _get_int(environ, name):
+    value = environ.get(name)
+    return int(value) if value else None
+
+
+def _get_float(environ, name):
+    value = environ.get(name)
+    return float(value) if value else None
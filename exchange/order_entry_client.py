@@ -0,0 +1,184 @@
+"""
+Blocking client of the binary order entry protocol, see order_entry_gateway.py
+
+    client = OrderEntryClient('127.0.0.1', 5002)
+    ack = client.submit_buy(size=10, price=100)
+    fill = client.read_message()
+
+submit_buy and submit_sell wait for the ack of each order. To send many orders without waiting, call send_new_order for
+each of them and read the answers with read_message as they come.
+"""
+import socket
+
+from exchange.components.order import OrderType
+from exchange.order_entry_protocol import ACK, FILL, MESSAGES, REJECT, REJECT_REASONS, encode_new_order, \
+    format_order_id
+
+# Bytes read from the socket at once
+_READ_SIZE = 65536
+
+
+class Ack:
+    __slots__ = ('client_order_id', 'order_id', 'unmatched_size')
+
+    def __init__(self, client_order_id, order_id, unmatched_size):
+        self.client_order_id = client_order_id
+        self.order_id = order_id
+        self.unmatched_size = unmatched_size
+
+    def __repr__(self):
+        return 'Ack({0}, {1}, {2})'.format(self.client_order_id, self.order_id, self.unmatched_size)
+
+
+class Fill:
+    __slots__ = ('client_order_id', 'order_id', 'size', 'price', 'unmatched_size')
+
+    def __init__(self, client_order_id, order_id, size, price, unmatched_size):
+        self.client_order_id = client_order_id
+        self.order_id = order_id
+        self.size = size
+        self.price = price
+        self.unmatched_size = unmatched_size
+
+    def __repr__(self):
+        return 'Fill({0}, {1}, {2}, {3}, {4})'.format(self.client_order_id, self.order_id, self.size, self.price,
+                                                       self.unmatched_size)
+
+
+class Reject:
+    __slots__ = ('client_order_id', 'reason')
+
+    def __init__(self, client_order_id, reason):
+        self.client_order_id = client_order_id
+        self.reason = reason
+
+    def __repr__(self):
+        return 'Reject({0}, {1})'.format(self.client_order_id, self.reason)
+
+
+class OrderRejectedError(ValueError):
+    def __init__(self, reject):
+        super().__init__(REJECT_REASONS.get(reject.reason, 'Order rejected with reason {0}'.format(reject.reason)))
+        self.reject = reject
+
+
+class OrderEntryClient:
+    """
+    One connection to an OrderEntryGateway. Order ids in the answers are the order ids of the REST API, so an order
+    entered here can be looked up or cancelled there. Not thread safe.
+    """
+    def __init__(self, host, port, timeout=None):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self._buffer = bytearray()
+        self._next_client_order_id = 1
+
+        # Messages read while waiting for an ack, returned by read_message first
+        self._pending = []
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def send_new_order(self, order_type, size, price):
+        """
+        Send an order without waiting for its answer
+        :param order_type: OrderType
+        :return: int client order id of the order, given in its answers
+        """
+        client_order_id = self._next_client_order_id
+        self._next_client_order_id += 1
+
+        self._socket.sendall(encode_new_order(client_order_id, order_type, size, price))
+
+        return client_order_id
+
+    def send_new_orders(self, orders):
+        """
+        Send orders in one write without waiting for their answers
+        :param orders: iterable of (OrderType, size, price)
+        :return: list of the client order ids of the orders
+        """
+        client_order_ids = []
+        messages = []
+
+        for order_type, size, price in orders:
+            client_order_ids.append(self._next_client_order_id)
+            messages.append(encode_new_order(self._next_client_order_id, order_type, size, price))
+            self._next_client_order_id += 1
+
+        self._socket.sendall(b''.join(messages))
+
+        return client_order_ids
+
+    def submit_buy(self, size, price):
+        """
+        :return: Ack of the order, its fills are read with read_message
+        :raises OrderRejectedError: if the order is rejected
+        """
+        return self.__submit(OrderType.BUY, size, price)
+
+    def submit_sell(self, size, price):
+        """
+        :return: Ack of the order, its fills are read with read_message
+        :raises OrderRejectedError: if the order is rejected
+        """
+        return self.__submit(OrderType.SELL, size, price)
+
+    def read_message(self):
+        """
+        Wait for the next message from the gateway
+        :return: Ack, Fill or Reject
+        :raises ConnectionError: if the gateway closed the connection
+        """
+        if self._pending:
+            return self._pending.pop(0)
+
+        return self.__read_message()
+
+    def __submit(self, order_type, size, price):
+        client_order_id = self.send_new_order(order_type, size, price)
+
+        while True:
+            message = self.__read_message()
+
+            if message.client_order_id == client_order_id and not isinstance(message, Fill):
+                break
+
+            self._pending.append(message)
+
+        if isinstance(message, Reject):
+            raise OrderRejectedError(message)
+
+        return message
+
+    def __read_message(self):
+        while not self._buffer or len(self._buffer) < MESSAGES.get(self._buffer[0], MESSAGES[ACK]).size:
+            data = self._socket.recv(_READ_SIZE)
+
+            if not data:
+                raise ConnectionError('The gateway closed the connection')
+
+            self._buffer += data
+
+        message_type = self._buffer[0]
+        message = MESSAGES.get(message_type)
+
+        if message is None or message_type not in (ACK, FILL, REJECT):
+            raise ConnectionError('Unexpected message type {0} from the gateway'.format(message_type))
+
+        fields = message.unpack_from(self._buffer)
+        del self._buffer[:message.size]
+
+        if message_type == ACK:
+            return Ack(fields[1], format_order_id(fields[2]), fields[3])
+        elif message_type == FILL:
+            return Fill(fields[1], format_order_id(fields[2]), *fields[3:])
+
+        return Reject(fields[1], fields[2])
@@ -0,0 +1,326 @@
+"""
+Binary order entry over TCP, alongside the REST API
+
+Clients that send a lot of orders pay for HTTP, JSON and Flask on every order in the REST API, which costs far more than
+matching it. The gateway takes orders in the fixed size binary format of order_entry_protocol.py instead, over a plain
+TCP connection that stays open, and answers with an ack or reject for every order and a fill for every match.
+
+Run on its own, owning the exchange: EXCHANGE_ORDER_ENTRY_PORT=5002 python3 -m exchange.order_entry_gateway
+or next to the REST API of asgi_api.py, sharing its exchange, by setting EXCHANGE_ORDER_ENTRY_PORT for it.
+"""
+import asyncio
+import os
+import socket
+from collections import defaultdict, deque
+
+from exchange.components.matching_engine import QueueFullError
+from exchange.components.order import OrderType
+from exchange.components.trade_tape import TradesUnavailableError
+from exchange.configuration import create_exchange
+from exchange.order_entry_protocol import ACK, ACK_MESSAGE, EXCHANGE_BUSY, FILL, FILL_MESSAGE, INVALID_ORDER, \
+    ORDER_TYPES_BY_SIDE, OUT_OF_MEMORY, REJECT, REJECT_MESSAGE, ProtocolError, parse_order_id, read_messages
+
+# Bytes read from a connection at once. Messages that arrive while a batch is being submitted wait in the socket.
+READ_BUFFER_SIZE = 65536
+
+# Matches read from the TradeTape at once when looking for fills
+_TRADES_PER_READ = 10000
+
+# Open orders tracked before the ones cancelled through the other APIs are looked for the first time
+_MIN_PRUNE_ORDERS = 10000
+
+
+class OrderEntryGateway:
+    """
+    Accepts orders in the binary order entry protocol and submits them to an Exchange with submit_buy and submit_sell.
+
+    Every complete message in a read is parsed in place and the whole batch is submitted in one call on the thread that
+    owns the exchange, then answered with one write per connection. A connection is not read again until its batch has
+    been answered, so a client that pipelines its orders has them read in bigger batches the busier the exchange is.
+
+    Fills are found on the TradeTape of the exchange, so the owner of an order entered here is told about every match of
+    it, including the matches made by orders from other APIs while it rests on the order book.
+    """
+    def __init__(self, exchange, engine=None, memory_monitor=None):
+        """
+        :param exchange: Exchange to submit orders to
+        :param engine: MatchingEngine that owns the exchange, orders are then submitted on its matching thread. Without
+                       one the exchange is owned by the event loop of the gateway and used straight away.
+        :param memory_monitor: MemoryMonitor, orders are rejected while it is rejecting, optional
+        """
+        self._exchange = exchange
+        self._engine = engine
+        self._memory_monitor = memory_monitor
+        self._loop = None
+
+        # Only used on the thread that owns the exchange:
+        # order number to (connection, client order id, Order, order id of messages) of every order entered here that
+        # has not been fully matched
+        self._open_orders = dict()
+        self._last_trade_sequence = exchange.get_last_trade_sequence()
+
+        # Orders cancelled through the other APIs have no more fills, they are only found by looking at every open
+        # order, which is done whenever the open orders have doubled so that it costs O(1) per order
+        self._prune_at = _MIN_PRUNE_ORDERS
+
+        # Messages for each connection and the connections to read from again, handed to the event loop together so
+        # that the ack of an order is always sent before its fills
+        self._replies = defaultdict(list)
+        self._submitted_connections = []
+
+        # Closed connections whose open orders could not be forgotten because the matching engine was busy, added on
+        # the event loop and forgotten after the next batch on the matching thread
+        self._closed_connections = deque()
+
+        if engine is not None:
+            engine.add_batch_listener(self.__hand_over_replies)
+
+    async def start_server(self, host, port):
+        """:return: asyncio.Server accepting connections on host and port"""
+        self._loop = asyncio.get_running_loop()
+        return await self._loop.create_server(lambda: _Connection(self), host, port)
+
+    def _submit_batch(self, connection, messages):
+        """Called on the event loop with every message of one read of a connection"""
+        if self._memory_monitor is not None and self._memory_monitor.is_rejecting():
+            self.__reject_all(connection, messages, OUT_OF_MEMORY)
+            return
+
+        if self._engine is None:
+            self.__submit_orders(self._exchange, connection, messages)
+            self.__deliver(*self.__take_replies(self._exchange))
+            return
+
+        try:
+            future = self._engine.execute(self.__submit_orders, connection, messages)
+        except QueueFullError:
+            self.__reject_all(connection, messages, EXCHANGE_BUSY)
+            return
+
+        # The answers are handed over by the batch listener, only a failure is seen here
+        asyncio.wrap_future(future, loop=self._loop).add_done_callback(
+            lambda done: self.__check_submitted(connection, done))
+
+    def _close_connection(self, connection):
+        """Called on the event loop when a connection is lost, its open orders stay on the order book"""
+        if self._engine is None:
+            self.__forget_connection(self._exchange, connection)
+            return
+
+        try:
+            self._engine.execute(self.__forget_connection, connection)
+        except QueueFullError:
+            # Fills of its orders are written to the closed connection and dropped until then
+            self._closed_connections.append(connection)
+
+    @staticmethod
+    def __reject_all(connection, messages, reason):
+        connection.write(b''.join(REJECT_MESSAGE.pack(REJECT, client_order_id, reason)
+                                  for _, _, client_order_id, _, _ in messages))
+        connection.resume_reading()
+
+    @staticmethod
+    def __check_submitted(connection, done):
+        if done.exception() is not None:
+            # Its orders can not all be answered, the client would wait forever
+            connection.close()
+            raise done.exception()
+
+    @staticmethod
+    def __deliver(replies, connections):
+        """
+        :param replies: dict of connection to the list of messages for it, in order
+        :param connections: list of connections whose batches have been answered
+        """
+        for connection, messages in replies.items():
+            connection.write(b''.join(messages))
+
+        for connection in connections:
+            connection.resume_reading()
+
+    def __hand_over_replies(self, exchange):
+        """Runs on the matching thread after every batch, including the batches of the other APIs"""
+        replies, connections = self.__take_replies(exchange)
+
+        if replies or connections:
+            self._loop.call_soon_threadsafe(self.__deliver, replies, connections)
+
+    def __take_replies(self, exchange):
+        """:return: (replies, connections) for __deliver, with the fills of every match made since the last time"""
+        self.__report_fills(exchange, self._replies)
+
+        while self._closed_connections:
+            self.__forget_connection(exchange, self._closed_connections.popleft())
+
+        if len(self._open_orders) >= self._prune_at:
+            self.__prune_closed_orders()
+
+        replies, connections = self._replies, self._submitted_connections
+        self._replies, self._submitted_connections = defaultdict(list), []
+
+        return replies, connections
+
+    def __submit_orders(self, exchange, connection, messages):
+        """Runs on the thread that owns the exchange, adds the answers to the replies to hand over"""
+        replies = self._replies[connection]
+
+        for _, side, client_order_id, size, price in messages:
+            order_type = ORDER_TYPES_BY_SIDE.get(side)
+
+            try:
+                if order_type == OrderType.BUY:
+                    order_id = exchange.submit_buy(size=size, price=price)
+                elif order_type == OrderType.SELL:
+                    order_id = exchange.submit_sell(size=size, price=price)
+                else:
+                    raise ValueError('Unknown side {0}'.format(side))
+            except ValueError:
+                replies.append(REJECT_MESSAGE.pack(REJECT, client_order_id, INVALID_ORDER))
+                continue
+
+            order = exchange.get_order(order_id)
+            message_order_id = parse_order_id(order_id)
+            replies.append(ACK_MESSAGE.pack(ACK, client_order_id, message_order_id, order.get_unmatched_size()))
+
+            # Registered before its own matches are reported, it is forgotten again once fully matched
+            self._open_orders[order.id] = connection, client_order_id, order, message_order_id
+            connection.order_numbers.add(order.id)
+
+            self.__report_fills(exchange, self._replies)
+
+        self._submitted_connections.append(connection)
+
+    def __report_fills(self, exchange, replies):
+        """Add a fill to replies for each order entered here in every match made since the last report"""
+        # Every match is read before the unmatched sizes are worked out, they depend on all of the later fills
+        trades = []
+
+        while True:
+            try:
+                read = exchange.get_trades(self._last_trade_sequence, _TRADES_PER_READ)
+            except TradesUnavailableError as error:
+                # More matches than the tape keeps were made in one go, the fills of the dropped ones are lost
+                self._last_trade_sequence = error.first_available_sequence - 1
+                continue
+
+            if not read:
+                break
+
+            trades.extend(read)
+            self._last_trade_sequence = read[-1].sequence
+
+        if not trades:
+            return
+
+        fills = []
+
+        # Total size of the fills of each order, its unmatched size after a fill is its unmatched size now plus the
+        # size of the fills after it
+        filled_sizes = dict()
+
+        for match in trades:
+            for order_number in (match.buy_order_id, match.sell_order_id):
+                owner = self._open_orders.get(order_number)
+
+                if owner is not None:
+                    fills.append((owner, match))
+                    filled_sizes[order_number] = filled_sizes.get(order_number, 0) + match.size
+
+        for (connection, client_order_id, order, message_order_id), match in fills:
+            filled_sizes[order.id] -= match.size
+            unmatched_size = order.get_unmatched_size() + filled_sizes[order.id]
+
+            replies[connection].append(FILL_MESSAGE.pack(FILL, client_order_id, message_order_id, match.size,
+                                                         match.price, unmatched_size))
+
+            if unmatched_size <= 0:
+                del self._open_orders[order.id]
+                connection.order_numbers.discard(order.id)
+
+    def __prune_closed_orders(self):
+        """Forget the orders that are no longer open without a fill telling us, i.e. that have been cancelled"""
+        for order_number, (connection, _, order, _) in list(self._open_orders.items()):
+            if not order.is_open():
+                del self._open_orders[order_number]
+                connection.order_numbers.discard(order_number)
+
+        self._prune_at = max(2 * len(self._open_orders), _MIN_PRUNE_ORDERS)
+
+    def __forget_connection(self, exchange, connection):
+        for order_number in connection.order_numbers:
+            self._open_orders.pop(order_number, None)
+
+        connection.order_numbers.clear()
+
+
+class _Connection(asyncio.BufferedProtocol):
+    """
+    One client connection. Data is read straight into a fixed buffer and the messages are parsed out of it in place.
+    """
+    def __init__(self, gateway):
+        self._gateway = gateway
+        self._transport = None
+
+        self._buffer = bytearray(READ_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._end = 0
+
+        # Numbers of the open orders entered on this connection, only used on the thread that owns the exchange
+        self.order_numbers = set()
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+        # Answers are written as soon as they are ready, never held back to be sent with more
+        transport.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def get_buffer(self, sizehint):
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        self._end += nbytes
+
+        try:
+            messages, parsed = read_messages(self._view, 0, self._end)
+        except ProtocolError:
+            self._transport.close()
+            return
+
+        # Keep the start of a message that has not all arrived yet for the next read
+        remaining = self._end - parsed
+        self._view[:remaining] = self._view[parsed:self._end]
+        self._end = remaining
+
+        if messages:
+            self._transport.pause_reading()
+            self._gateway._submit_batch(self, messages)
+
+    def connection_lost(self, exc):
+        self._gateway._close_connection(self)
+
+    def write(self, data):
+        if not self._transport.is_closing():
+            self._transport.write(data)
+
+    def resume_reading(self):
+        if not self._transport.is_closing():
+            self._transport.resume_reading()
+
+    def close(self):
+        self._transport.close()
+
+
+def serve(exchange, host, port):
+    """Serve the gateway on its own, owning the exchange, until it is stopped"""
+    async def run():
+        server = await OrderEntryGateway(exchange).start_server(host, port)
+
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    serve(create_exchange(), os.environ.get('EXCHANGE_ORDER_ENTRY_HOST', '0.0.0.0'),
+          int(os.environ.get('EXCHANGE_ORDER_ENTRY_PORT', 5002)))
@@ -0,0 +1,108 @@
+"""
+Binary order entry protocol, see order_entry_gateway.py and order_entry_client.py
+
+Every message is a fixed size little endian record that starts with its one byte type, so a reader always knows how
+long a message is from its first byte and can parse it in place. Any number of messages can be sent back to back
+without waiting for the answers.
+
+Client to gateway:
+    NEW_ORDER  type, side (0 BUY, 1 SELL), client order id, size, price
+
+Gateway to client:
+    ACK        type, client order id, order id, unmatched size once the order has been matched
+    FILL       type, client order id, order id, size, price, unmatched size left, for every match of an order, including
+               matches made while the order was resting on the order book
+    REJECT     type, client order id, reason
+
+The client order id is any 64 bit number the client chooses to tell its orders apart. The order id is the 64 bit value
+of the order id used by the REST API, which is the same number written as 16 hex characters, see format_order_id.
+Sizes and prices are 64 bit unsigned ints.
+"""
+import struct
+
+from exchange.components.order import OrderType
+
+NEW_ORDER = ord('N')
+ACK = ord('A')
+FILL = ord('F')
+REJECT = ord('R')
+
+NEW_ORDER_MESSAGE = struct.Struct('<BBQQQ')
+ACK_MESSAGE = struct.Struct('<BQQQ')
+FILL_MESSAGE = struct.Struct('<BQQQQQ')
+REJECT_MESSAGE = struct.Struct('<BQB')
+
+MESSAGES = {
+    NEW_ORDER: NEW_ORDER_MESSAGE,
+    ACK: ACK_MESSAGE,
+    FILL: FILL_MESSAGE,
+    REJECT: REJECT_MESSAGE,
+}
+
+MAX_MESSAGE_SIZE = max(message.size for message in MESSAGES.values())
+
+SIDES = {
+    OrderType.BUY: 0,
+    OrderType.SELL: 1,
+}
+ORDER_TYPES_BY_SIDE = {side: order_type for order_type, side in SIDES.items()}
+
+# Reasons an order is rejected
+INVALID_ORDER = 1
+EXCHANGE_BUSY = 2
+OUT_OF_MEMORY = 3
+
+REJECT_REASONS = {
+    INVALID_ORDER: 'Orders need a side of BUY or SELL and a size and price greater than 0',
+    EXCHANGE_BUSY: 'The exchange has too many orders waiting, try again later',
+    OUT_OF_MEMORY: 'The exchange is low on memory, new orders are rejected',
+}
+
+
+class ProtocolError(ValueError):
+    """
+    A message with an unknown type. The stream can not be read past it, so the connection has to be closed.
+    """
+
+
+def encode_new_order(client_order_id, order_type, size, price):
+    """
+    :param client_order_id: int
+    :param order_type: OrderType
+    :return: bytes
+    """
+    return NEW_ORDER_MESSAGE.pack(NEW_ORDER, SIDES[order_type], client_order_id, size, price)
+
+
+def format_order_id(order_id):
+    """:return: str order id of the REST API for the order id of a message"""
+    return format(order_id, '016x')
+
+
+def parse_order_id(order_id):
+    """:return: int order id of a message for the order id of the REST API"""
+    return int(order_id, 16)
+
+
+def read_messages(buffer, start, end):
+    """
+    Parse every complete message in buffer[start:end] in place
+    :param buffer: bytearray or memoryview
+    :return: (list of tuples of the fields of each message, int position of the first byte not parsed)
+    :raises ProtocolError: if a message has an unknown type
+    """
+    messages = []
+
+    while start < end:
+        message = MESSAGES.get(buffer[start])
+
+        if message is None:
+            raise ProtocolError('Unknown message type {0}'.format(buffer[start]))
+
+        if end - start < message.size:
+            break
+
+        messages.append(message.unpack_from(buffer, start))
+        start += message.size
+
+    return messages, start
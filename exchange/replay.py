@@ -0,0 +1,185 @@
+"""
+Replay captured order flow through an Exchange for what-if analysis, without going through the REST API
+
+Orders are streamed from a CSV file or from a journal (the compact binary format the exchange records every order in,
+see Journal) straight into Exchange.submit_buy and submit_sell. The resulting trades, and a summary of the order book
+every so many orders, are streamed out as JSON lines. Nothing is read or kept in full, fully matched orders are
+discarded and only the most recent trades are kept, so memory use only grows with the size of the resting book however
+long the input is. The replay throughput is reported on stderr when the input has been replayed.
+
+CSV rows are order_type,size,price with an optional order_number column, e.g. BUY,10,150. Orders without a number are
+numbered by the exchange, see order_id. A row of CANCEL,,,<order_number> cancels the order with that number. A header
+row is skipped.
+
+Run with: python3 -m exchange.replay orders.csv --summary-every 10000 --depth 5 --output replay.jsonl
+          python3 -m exchange.replay /data/journal --format journal
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+from exchange.components.exchange import Exchange
+from exchange.components.journal import JournalEntry, read_journal
+from exchange.components.order import OrderType
+from exchange.components.order_id import encode_order_id
+from exchange.components.order_store import OrderStore
+from exchange.components.trade_tape import TradeTape
+from exchange.serialization import order_book_to_json
+
+_CANCEL = 'CANCEL'
+
+
+class ReplayStatistics:
+    def __init__(self):
+        self.orders = 0
+        self.cancels = 0
+        self.rejected = 0
+        self.trades = 0
+        self.seconds = 0.0
+
+    def to_json(self):
+        return {
+            'orders': self.orders,
+            'cancels': self.cancels,
+            'rejected': self.rejected,
+            'trades': self.trades,
+            'seconds': self.seconds,
+            'orders_per_second': (self.orders + self.cancels) / self.seconds if self.seconds else None,
+        }
+
+
+def read_csv(lines):
+    """
+    :param lines: iterable of str CSV lines, e.g. an open file
+    :return: generator of JournalEntry, the order id is the int order number or None unless the row has one
+    """
+    for row_number, row in enumerate(csv.reader(lines)):
+        if not row:
+            continue
+
+        order_type = row[0].strip().upper()
+
+        try:
+            order_number = int(row[3]) if len(row) > 3 and row[3].strip() else None
+
+            if order_type == _CANCEL:
+                entry = JournalEntry(None, order_number, None, None, cancel=True)
+            else:
+                entry = JournalEntry(OrderType(order_type), order_number, int(row[1]), int(row[2]))
+        except (IndexError, ValueError):
+            # The header
+            if row_number == 0:
+                continue
+
+            raise ValueError('Row {0} is not order_type,size,price[,order_number]: {1}'.format(row_number + 1, row))
+
+        yield entry
+
+
+def replay(entries, exchange, statistics, summary_every=None, depth=None):
+    """
+    Submit every order to the exchange, one at a time in the order they were captured
+    :param entries: iterable of JournalEntry
+    :param exchange: Exchange to replay into
+    :param statistics: ReplayStatistics updated as the replay goes
+    :param summary_every: int number of orders between order book summaries, no summaries by default
+    :param depth: int number of price levels per side in the summaries, every level by default
+    :return: generator of ('trade', Match) for every trade and ('book', int orders replayed, UnmatchedOrderBookSummary)
+             every summary_every orders
+    """
+    last_trade_sequence = exchange.get_last_trade_sequence()
+    start = time.perf_counter()
+
+    for entry in entries:
+        try:
+            if entry.cancel:
+                statistics.cancels += 1
+                exchange.cancel(encode_order_id(entry.order_id))
+            elif entry.order_type == OrderType.BUY:
+                statistics.orders += 1
+                exchange.submit_buy(size=entry.size, price=entry.price, order_number=entry.order_id)
+            else:
+                statistics.orders += 1
+                exchange.submit_sell(size=entry.size, price=entry.price, order_number=entry.order_id)
+        except (KeyError, ValueError):
+            statistics.rejected += 1
+
+        if exchange.get_last_trade_sequence() != last_trade_sequence:
+            trades = exchange.get_trades(last_trade_sequence, exchange.get_last_trade_sequence() - last_trade_sequence)
+            last_trade_sequence = exchange.get_last_trade_sequence()
+            statistics.trades += len(trades)
+
+            for trade in trades:
+                yield 'trade', trade
+
+        if summary_every and not (statistics.orders + statistics.cancels) % summary_every:
+            summary = exchange.get_exchange_summary() if depth is None else exchange.get_exchange_depth(depth)
+            yield 'book', statistics.orders + statistics.cancels, summary
+
+        statistics.seconds = time.perf_counter() - start
+
+
+def create_replay_exchange(max_trades=100000):
+    """
+    :param max_trades: int trades kept by the exchange, the most one order can match against
+    :return: Exchange that discards fully matched orders so that memory does not grow with the length of the replay
+    """
+    return Exchange(order_store=OrderStore(max_cached_orders=0), trade_tape=TradeTape(max_trades=max_trades))
+
+
+def write_json_lines(events, output):
+    """
+    :param events: generator returned by replay
+    :param output: file to write a JSON object per line to
+    """
+    for event in events:
+        if event[0] == 'trade':
+            trade = event[1]
+            trade_json = trade.get_summary()
+            trade_json['sequence'] = trade.sequence
+            output.write(json.dumps({'trade': trade_json}))
+        else:
+            book_json = order_book_to_json(event[2])
+            book_json['orders'] = event[1]
+            output.write(json.dumps({'book': book_json}))
+
+        output.write('\n')
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='CSV file, - for stdin, or journal file')
+    parser.add_argument('--format', choices=['csv', 'journal'], default='csv')
+    parser.add_argument('--summary-every', type=int, help='write a summary of the order book every N orders')
+    parser.add_argument('--depth', type=int, help='price levels per side in each summary (default: every level)')
+    parser.add_argument('--output', default='-', help='JSON lines file for the trades and summaries (default: stdout)')
+    parser.add_argument('--max-trades', type=int, default=100000, help='most trades a single order can make')
+    arguments = parser.parse_args(arguments)
+
+    statistics = ReplayStatistics()
+    exchange = create_replay_exchange(arguments.max_trades)
+    input_file = None
+    output = sys.stdout if arguments.output == '-' else open(arguments.output, 'w')
+
+    try:
+        if arguments.format == 'journal':
+            entries = read_journal(arguments.input)
+        else:
+            input_file = sys.stdin if arguments.input == '-' else open(arguments.input, newline='')
+            entries = read_csv(input_file)
+
+        write_json_lines(replay(entries, exchange, statistics, arguments.summary_every, arguments.depth), output)
+    finally:
+        if input_file not in (None, sys.stdin):
+            input_file.close()
+
+        if output is not sys.stdout:
+            output.close()
+
+    print(json.dumps(statistics.to_json()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Read only version of the REST API in rest_api.py, served by worker processes from a read replica of the exchange
+
+The process that owns the exchange (rest_api.py or asgi_api.py with EXCHANGE_REPLICA_NAME set) publishes the order book
+and recently changed orders into shared memory, see OrderBookReplicaPublisher. Each worker here attaches to it and
+answers GET /orderBook and GET /order/<order_id> from a consistent copy, so reads are served in parallel on every core
+and never wait for, or slow down, the matching of orders. Anything that is not in the replica, e.g. an order that has
+not changed for a long time, is forwarded to the primary at EXCHANGE_PRIMARY_URL.
+
+Send every order, cancel and any other request to the primary.
+
+Run with: EXCHANGE_REPLICA_NAME=exchange EXCHANGE_PRIMARY_URL=http://127.0.0.1:5000 python3 -m exchange.replica_api
+"""
+import json
+import multiprocessing
+import os
+import socket
+import urllib.error
+import urllib.request
+from functools import partial
+
+from flask import Flask, Response, jsonify, request, abort
+from werkzeug.serving import make_server
+
+from exchange.components.order_book_replica import OrderBookReplica
+from exchange.components.order_id import decode_order_id, set_key
+from exchange.serialization import DEFAULT_MATCHES_LIMIT, MAX_MATCHES_LIMIT, OrderBookJsonCache, OrderBookQuery
+
+app = Flask(__name__)
+
+primary_url = os.environ.get('EXCHANGE_PRIMARY_URL', 'http://127.0.0.1:5000').rstrip('/')
+
+# Compact, the same as jsonify outside debug mode. The standard library json works with every version of Flask.
+encode_json = partial(json.dumps, separators=(',', ':'))
+
+# Attached in each worker process, see attach
+replica = None
+order_book_cache = None
+
+
+class _NotReplicated(Exception):
+    """The answer is not in the replica, ask the primary"""
+
+
+def attach(name):
+    """
+    Attach this process to the replica published with name
+    :param name: str, see OrderBookReplicaPublisher
+    """
+    global replica
+
+    replica = OrderBookReplica(name)
+
+    # Order ids are encoded and decoded the same way as in the primary
+    set_key(replica.get_key())
+
+
+@app.route('/order/<order_id>', methods=['GET'])
+def get_order(order_id):
+    """
+    The order with a page of its matches, see rest_api.get_order
+    """
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', DEFAULT_MATCHES_LIMIT))
+    except ValueError:
+        abort(400)
+
+    if after < 0 or limit < 0:
+        abort(400)
+
+    order_number = decode_order_id(order_id)
+
+    if order_number is None:
+        abort(404)
+
+    page = replica.read_order_page(order_number, after, min(limit, MAX_MATCHES_LIMIT))
+
+    if page is None:
+        return _forward_to_primary()
+
+    return jsonify(page)
+
+
+@app.route('/orderBook', methods=['GET'])
+def get_order_book():
+    """
+    The order book with an ETag, see rest_api.get_order_book. Every worker gives the same ETag to the same version.
+    """
+    try:
+        query = OrderBookQuery.from_args(request.args)
+    except ValueError:
+        abort(400)
+
+    version = replica.read_version()
+
+    if version is None:
+        return _forward_to_primary()
+
+    try:
+        etag, body = _get_order_book_cache().get(version, query, _summarise_order_book)
+    except _NotReplicated:
+        return _forward_to_primary()
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+
+    return response.make_conditional(request)
+
+
+def _get_order_book_cache():
+    """:return: OrderBookJsonCache of the exchange that is published now, a new one once the primary has restarted"""
+    global order_book_cache
+
+    if order_book_cache is None or order_book_cache.get_token() != replica.get_token():
+        order_book_cache = OrderBookJsonCache(encode_json, token=replica.get_token())
+
+    return order_book_cache
+
+
+def _summarise_order_book(query):
+    # The summary may be of a newer version than the one it is cached as, which is never older than asked for. A range
+    # is taken from every level, which are only all published when the book is shallow enough.
+    published = replica.read_order_book(None if query.is_range() else query.depth)
+
+    if published is None:
+        raise _NotReplicated()
+
+    return query.summarise(published[1]) if query.is_range() else published[1]
+
+
+def _forward_to_primary():
+    headers = dict()
+
+    if 'If-None-Match' in request.headers:
+        headers['If-None-Match'] = request.headers['If-None-Match']
+
+    primary_request = urllib.request.Request(primary_url + request.full_path, headers=headers)
+
+    try:
+        with urllib.request.urlopen(primary_request, timeout=10) as primary_response:
+            status, body, primary_headers = primary_response.status, primary_response.read(), primary_response.headers
+    except urllib.error.HTTPError as error:
+        status, body, primary_headers = error.code, error.read(), error.headers
+    except urllib.error.URLError:
+        abort(502)
+
+    response = Response(body, status=status, content_type=primary_headers.get('Content-Type'))
+
+    if 'ETag' in primary_headers:
+        response.headers['ETag'] = primary_headers['ETag']
+
+    return response
+
+
+def serve(name, host, port, workers):
+    """
+    Serve the API from workers processes that all accept connections on the same listening socket
+    :param name: str name of the replica, see OrderBookReplicaPublisher
+    :param workers: int number of processes
+    """
+    listener = socket.create_server((host, port), backlog=1024)
+
+    # The workers inherit the listening socket
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=_run_worker, args=(name, host, port, listener.fileno()),
+                        name='exchange-replica-{0}'.format(worker))
+        for worker in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+
+
+def _run_worker(name, host, port, fd):
+    attach(name)
+    make_server(host, port, app, fd=fd).serve_forever()
+
+
+if __name__ == '__main__':
+    serve(
+        os.environ['EXCHANGE_REPLICA_NAME'],
+        os.environ.get('EXCHANGE_REPLICA_HOST', '0.0.0.0'),
+        int(os.environ.get('EXCHANGE_REPLICA_PORT', 5001)),
+        int(os.environ.get('EXCHANGE_REPLICA_WORKERS') or os.cpu_count())
+    )
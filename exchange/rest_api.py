@@ -1,11 +1,127 @@
-from flask import Flask, jsonify, request, abort
+import json
+import math
+from functools import partial
 
-from exchange.components.exchange import Exchange
+from flask import Flask, Response, g, jsonify, request, abort
+
+from exchange.components.admission_control import CLIENT_ID_HEADER
+from exchange.components.memory_report import TOP_ALLOCATORS, add_top_allocators, create_memory_report, \
+    take_allocation_snapshot
 from exchange.components.order import OrderType
+from exchange.components.trade_tape import TradesUnavailableError
+from exchange.configuration import create_admission_controller, create_exchange, create_memory_monitor, \
+    create_replica_publisher, create_standby
+from exchange.serialization import DEFAULT_MATCHES_LIMIT, DEFAULT_TRADES_LIMIT, MAX_MATCHES_LIMIT, MAX_TRADES_LIMIT, \
+    OrderBookJsonCache, OrderBookQuery, parse_order, trades_to_json
 
 app = Flask(__name__)
 
-exchange = Exchange()
+exchange = create_exchange()
+
+# Compact, the same as jsonify outside debug mode. The standard library json works with every version of Flask.
+encode_json = partial(json.dumps, separators=(',', ':'))
+
+# Time the JSON encoding of every response when metrics are enabled
+if exchange.get_metrics() is not None:
+    json_encoding = 'exchange_json_encoding_seconds', 'Time to encode a response as JSON'
+    jsonify = exchange.get_metrics().timed(*json_encoding, function=jsonify)
+    encode_json = exchange.get_metrics().timed(*json_encoding, function=encode_json)
+
+# GET /orderBook is only summarised and encoded again once the order book has changed
+order_book_cache = OrderBookJsonCache(encode_json)
+
+# Endpoints that change the exchange
+_ORDER_ENDPOINTS = frozenset(('submit_limit_order', 'submit_limit_orders', 'cancel_order'))
+
+# A hot standby applies the orders streamed by the primary at EXCHANGE_STANDBY_OF on a thread of its own. It serves
+# reads and rejects orders with 503 until it is promoted with POST /replication/promote, see replication.
+standby = create_standby(exchange)
+
+_STANDBY = b'{"error":"The exchange is a standby, send orders to the primary"}'
+
+if standby is not None:
+    @app.before_request
+    def lock_standby():
+        # Promoting waits for the batch being applied, which needs the lock
+        if request.endpoint == 'promote_standby':
+            return None
+
+        standby.lock.acquire()
+        g.standby_locked = True
+
+        if request.endpoint in _ORDER_ENDPOINTS and not standby.is_promoted():
+            return Response(_STANDBY, status=503, mimetype='application/json')
+
+        return None
+
+    @app.teardown_request
+    def unlock_standby(error):
+        if g.pop('standby_locked', False):
+            standby.lock.release()
+
+# Read replicas in other processes are sent every change before it is acknowledged, see replica_api.py
+replica_publisher = create_replica_publisher(exchange)
+
+if replica_publisher is not None:
+    @app.after_request
+    def publish_to_replicas(response):
+        replica_publisher.publish()
+        return response
+
+    if standby is not None:
+        standby.add_batch_listener(lambda changed_exchange: replica_publisher.publish())
+
+# New orders are rejected with 503 while the process is over its memory limit, cancels are still taken
+memory_monitor = create_memory_monitor(exchange.get_metrics())
+
+_OUT_OF_MEMORY = b'{"error":"The exchange is low on memory, new orders are rejected"}'
+
+if memory_monitor is not None:
+    @app.before_request
+    def reject_orders_when_out_of_memory():
+        if memory_monitor.is_rejecting() and request.endpoint in ('submit_limit_order', 'submit_limit_orders'):
+            return Response(_OUT_OF_MEMORY, status=503, mimetype='application/json', headers={'Retry-After': '1'})
+
+        return None
+
+    @app.after_request
+    def check_memory(response):
+        memory_monitor.check()
+        return response
+
+# Orders and cancels of a client over its rate limit are rejected with 429 before their body is read. The limit on
+# requests in flight only matters under a threaded or multi worker server, the development server below answers one
+# request at a time.
+admission_controller = create_admission_controller(exchange.get_metrics())
+
+_TOO_MANY_REQUESTS = b'{"error":"Too many requests, try again later"}'
+
+if admission_controller is not None:
+    @app.before_request
+    def admit_request():
+        # Only orders and cancels are limited
+        if request.endpoint not in _ORDER_ENDPOINTS:
+            return None
+
+        # Admitted for one order before the body is read, a batch is charged for the rest once it has been parsed
+        retry_after = admission_controller.admit(_get_client())
+
+        if retry_after:
+            return Response(_TOO_MANY_REQUESTS, status=429, mimetype='application/json',
+                            headers={'Retry-After': str(math.ceil(retry_after))})
+
+        g.admitted = True
+        return None
+
+    @app.teardown_request
+    def release_request(error):
+        if g.pop('admitted', False):
+            admission_controller.release()
+
+
+def _get_client():
+    """:return: the client id header of the request, otherwise its remote address"""
+    return request.headers.get(CLIENT_ID_HEADER) or request.remote_addr
 
 
 @app.route('/order', methods=['POST'])
@@ -33,29 +149,191 @@ def submit_limit_order():
     abort(400)
 
 
+@app.route('/orders', methods=['POST'])
+def submit_limit_orders():
+    """
+    Submit a batch of limit orders in one request. The body is a list of orders in the same format as POST /order.
+    Each order gets either an order_id or the reason it was rejected, in the same position as it was submitted.
+    """
+    if not isinstance(request.json, list):
+        abort(400)
+
+    # A batch takes one token per order, the first was taken when it was admitted
+    if admission_controller is not None and len(request.json) > 1:
+        admission_controller.charge(_get_client(), len(request.json) - 1)
+
+    results = [None] * len(request.json)
+    orders = []
+    positions = []
+
+    for position, order_json in enumerate(request.json):
+        try:
+            orders.append(parse_order(order_json))
+        except ValueError as error:
+            results[position] = {'rejected': str(error)}
+            continue
+
+        positions.append(position)
+
+    for position, result in zip(positions, exchange.submit_batch(orders)):
+        results[position] = result
+
+    return jsonify({'orders': results})
+
+
 @app.route('/order/<order_id>', methods=['GET'])
 def get_order(order_id):
+    """
+    The order with a page of its matches, at most limit matches after the first after. Pass the next_after of the
+    response as after to get the next page.
+    """
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', DEFAULT_MATCHES_LIMIT))
+    except ValueError:
+        abort(400)
+
+    if after < 0 or limit < 0:
+        abort(400)
+
     order = exchange.find_order(order_id)
 
     if not order:
         abort(404)
 
-    return jsonify(order.get_summary())
+    return jsonify(order.get_summary_page(after, min(limit, MAX_MATCHES_LIMIT)))
+
+
+@app.route('/order/<order_id>', methods=['DELETE'])
+def cancel_order(order_id):
+    """
+    Cancel the unmatched size of an order. 409 Conflict if the order has already been fully matched or cancelled.
+    """
+    try:
+        order = exchange.cancel(order_id)
+    except KeyError:
+        abort(404)
+
+    if order is None:
+        abort(409)
+
+    return jsonify(order.get_summary_page(limit=DEFAULT_MATCHES_LIMIT))
 
 
 @app.route('/orderBook', methods=['GET'])
 def get_order_book():
-    summary = exchange.get_exchange_summary()
+    """
+    The response has an ETag. Send it back in If-None-Match and the response is 304 Not Modified, with no body, for as
+    long as the order book has not changed.
+    """
+    # Optionally only return the best N price levels on each side, the levels between min and max, or the levels added
+    # up into buckets of that many ticks
+    try:
+        query = OrderBookQuery.from_args(request.args)
+    except ValueError:
+        abort(400)
+
+    etag, body = order_book_cache.get(exchange.get_order_book_version(), query, _summarise_order_book)
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+
+    return response.make_conditional(request)
+
+
+def _summarise_order_book(query):
+    return query.summarise_exchange(exchange)
+
+
+@app.route('/trades', methods=['GET'])
+def get_trades():
+    """
+    Tail every trade made by the exchange in order. Pass the sequence of the last trade seen as since, the response has
+    the trades after it. If they are no longer kept the response is 410 Gone with the first sequence still available.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', DEFAULT_TRADES_LIMIT))
+    except ValueError:
+        abort(400)
+
+    if since < 0 or limit < 0:
+        abort(400)
+
+    try:
+        trades = exchange.get_trades(since, min(limit, MAX_TRADES_LIMIT))
+    except TradesUnavailableError as error:
+        response = jsonify({'error': str(error), 'first_available_sequence': error.first_available_sequence})
+        response.status_code = 410
+        return response
+
+    return jsonify(trades_to_json(trades, exchange.get_last_trade_sequence()))
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Latency histograms of each stage of an order and counters in the Prometheus text format.
+    404 when metrics are disabled with EXCHANGE_METRICS=0.
+    """
+    metrics = exchange.get_metrics()
+
+    if metrics is None:
+        abort(404)
+
+    return Response(metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/memory', methods=['GET'])
+def get_memory_report():
+    """
+    Approximate count and bytes of each structure of the exchange, the memory of the process and the memory
+    thresholds. When tracemalloc is tracing (PYTHONTRACEMALLOC=1) also the top source lines allocating memory, which
+    takes seconds with millions of orders, top=0 to leave them out.
+    """
+    top = request.args.get('top', TOP_ALLOCATORS, type=int)
+
+    report = create_memory_report(exchange, memory_monitor)
+
+    if top > 0:
+        add_top_allocators(report, take_allocation_snapshot(), top)
+
+    return jsonify(report)
+
+
+@app.route('/replication', methods=['GET'])
+def get_replication_lag():
+    """
+    How far the standby is behind the primary, see ReplicationStandby.get_lag. 404 when the exchange is not a standby.
+    """
+    if standby is None:
+        abort(404)
+
+    return jsonify(standby.get_lag())
+
+
+@app.route('/replication/promote', methods=['POST'])
+def promote_standby():
+    """
+    Stop following the primary and take orders from now on. The records the primary had not sent yet are lost, the
+    response says how many it had accepted and how many were applied.
+    """
+    if standby is None:
+        abort(404)
+
+    standby.promote()
 
-    for_json = dict()
+    return jsonify(standby.get_lag())
 
-    for_json['BUY'] = summary.buy_dict
-    for_json['SELL'] = summary.sell_dict
 
-    return jsonify(for_json)
+# Start following the primary once every hook holding the lock is in place
+if standby is not None:
+    standby.start()
 
 
 if __name__ == '__main__':
     # Exchange is not thread safe, ensure single thread
     # host 0.0.0.0 for docker
-    app.run(debug=True, threaded=False, host='0.0.0.0')
+    # No reloader: it imports this module in a second process, which would open the journal, the replica shared memory
+    # and the standby connection twice
+    app.run(debug=True, use_reloader=False, threaded=False, host='0.0.0.0')
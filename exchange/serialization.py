@@ -0,0 +1,205 @@
+"""
+Conversion between the JSON used by the APIs and the exchange components
+"""
+import os
+
+from exchange.components.order import OrderType
+
+INVALID_ORDER_MESSAGE = 'Orders need an int price and size and an order_type of BUY or SELL'
+
+# GET /trades returns at most this many trades
+DEFAULT_TRADES_LIMIT = 100
+MAX_TRADES_LIMIT = 1000
+
+# GET /order/<order_id> returns at most this many of the matches of the order
+DEFAULT_MATCHES_LIMIT = 100
+MAX_MATCHES_LIMIT = 1000
+
+# Queries of GET /orderBook (depths, price ranges) cached per version of the order book, any other query is encoded
+# every time
+MAX_CACHED_DEPTHS = 16
+
+
+def parse_order(order_json):
+    """
+    :param order_json: dict in the POST /order format
+    :return: (OrderType, int size, int price)
+    :raises ValueError: if the order is not in the POST /order format
+    """
+    try:
+        return OrderType(order_json['order_type']), int(order_json['size']), int(order_json['price'])
+    except (TypeError, KeyError, ValueError):
+        raise ValueError(INVALID_ORDER_MESSAGE)
+
+
+def order_book_to_json(summary):
+    """
+    :param summary: UnmatchedOrderBookSummary
+    :return: dict in the GET /orderBook format
+    """
+    for_json = dict()
+
+    for_json['BUY'] = summary.buy_dict
+    for_json['SELL'] = summary.sell_dict
+
+    return for_json
+
+
+class OrderBookQuery:
+    """
+    The price levels asked for with GET /orderBook: every level, the best depth levels on each side, the levels from
+    min_price to max_price, or the levels added up into buckets of bucket ticks. depth applies after the range and the
+    buckets, e.g. the best 10 buckets. Queries are hashable so that their responses can be cached, see
+    OrderBookJsonCache.
+    """
+    __slots__ = ('depth', 'min_price', 'max_price', 'bucket')
+
+    def __init__(self, depth=None, min_price=None, max_price=None, bucket=None):
+        """
+        :raises ValueError: if the depth is negative, the bucket less than 1 or min_price greater than max_price
+        """
+        if depth is not None and depth < 0:
+            raise ValueError('depth must be an int greater than or equal to 0')
+
+        if bucket is not None and bucket < 1:
+            raise ValueError('bucket must be an int greater than or equal to 1')
+
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise ValueError('min must not be greater than max')
+
+        self.depth = depth
+        self.min_price = min_price
+        self.max_price = max_price
+        self.bucket = bucket
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        :param args: dict of the query parameters depth, min, max and bucket to str
+        :return: OrderBookQuery
+        :raises ValueError: if a parameter is not an int or the query is not valid
+        """
+        values = dict()
+
+        for name in ('depth', 'min', 'max', 'bucket'):
+            value = args.get(name)
+
+            try:
+                values[name] = int(value) if value is not None else None
+            except ValueError:
+                raise ValueError('{0} must be an int'.format(name))
+
+        return cls(values['depth'], values['min'], values['max'], values['bucket'])
+
+    def is_range(self):
+        """:return: bool True if the levels are limited to a range of prices or added up into buckets"""
+        return self.min_price is not None or self.max_price is not None or self.bucket is not None
+
+    def summarise(self, summary):
+        """
+        :param summary: UnmatchedOrderBookSummary of every level, e.g. published by the matching thread
+        :return: UnmatchedOrderBookSummary of the levels asked for
+        """
+        if self.is_range():
+            summary = summary.get_range(self.min_price, self.max_price, self.bucket)
+
+        return summary if self.depth is None else summary.get_depth(self.depth)
+
+    def summarise_exchange(self, exchange):
+        """
+        Only the levels asked for are visited, except for the best depth buckets, which are found among every bucket in
+        the range
+        :param exchange: Exchange, or the SymbolOrderBook of a ShardedExchange
+        :return: UnmatchedOrderBookSummary of the levels asked for
+        """
+        if self.is_range():
+            summary = exchange.get_exchange_range(self.min_price, self.max_price, self.bucket)
+            return summary if self.depth is None else summary.get_depth(self.depth)
+
+        if self.depth is None:
+            return exchange.get_exchange_summary()
+
+        return exchange.get_exchange_depth(self.depth)
+
+    def __eq__(self, other):
+        return isinstance(other, OrderBookQuery) and self.__key() == other.__key()
+
+    def __hash__(self):
+        return hash(self.__key())
+
+    def __str__(self):
+        """:return: str for an ETag, the depth or all when there is no range"""
+        if not self.is_range():
+            return 'all' if self.depth is None else str(self.depth)
+
+        return '-'.join('{0}{1}'.format(name, value) for name, value in zip(
+            ('depth', 'min', 'max', 'bucket'), self.__key()) if value is not None)
+
+    def __key(self):
+        return self.depth, self.min_price, self.max_price, self.bucket
+
+
+class OrderBookJsonCache:
+    """
+    The encoded GET /orderBook response for the current version of the order book, see Exchange.get_order_book_version.
+
+    Pollers mostly ask for the same book over and over, so the summary is only made and encoded once per version and
+    query, and every other request for it is served the same bytes. Each body has an ETag so that a client that already
+    has it can be answered with 304 Not Modified and no body at all.
+
+    Versions start again from 0 when the exchange restarts, so every ETag includes a token that is random per cache.
+    """
+    def __init__(self, encode, max_cached_depths=MAX_CACHED_DEPTHS, token=None):
+        """
+        :param encode: function encoding the GET /orderBook dict as JSON, returning str
+        :param max_cached_depths: int number of different queries kept for the current version
+        :param token: str to put in every ETag instead of a random one, e.g. shared by the caches of every process
+                      serving the same exchange so that their ETags agree
+        """
+        self._encode = encode
+        self._max_cached_depths = max_cached_depths
+        self._token = token if token is not None else os.urandom(4).hex()
+
+        self._version = None
+        self._bodies = dict()
+
+    def get(self, version, query, summarise):
+        """
+        :param version: int version of the order book
+        :param query: OrderBookQuery
+        :param summarise: function(query) returning the UnmatchedOrderBookSummary, only called if it is not cached
+        :return: (str ETag, bytes JSON body)
+        """
+        if version != self._version:
+            self._version = version
+            self._bodies.clear()
+
+        cached = self._bodies.get(query)
+
+        if cached is None:
+            etag = '{0}-{1}-{2}'.format(self._token, version, query)
+            cached = etag, self._encode(order_book_to_json(summarise(query))).encode('utf-8')
+
+            if len(self._bodies) < self._max_cached_depths:
+                self._bodies[query] = cached
+
+        return cached
+
+    def get_token(self):
+        return self._token
+
+
+def trades_to_json(trades, last_sequence):
+    """
+    :param trades: list of Match from the TradeTape
+    :param last_sequence: int sequence number of the last match made by the exchange
+    :return: dict in the GET /trades format
+    """
+    trades_json = []
+
+    for match in trades:
+        trade_json = match.get_summary()
+        trade_json['sequence'] = match.sequence
+        trades_json.append(trade_json)
+
+    return {'trades': trades_json, 'last_sequence': last_sequence}
@@ -0,0 +1,133 @@
+"""
+Version of the REST API in rest_api.py that trades many symbols, sharded across worker processes
+
+Every order and order book request names a symbol. Each symbol is owned by one worker process, see ShardedExchange,
+and this process routes every request to the shard that owns it, so independent symbols use all the cores of the box.
+
+Run with: EXCHANGE_SHARDS=4 python3 exchange/sharded_rest_api.py
+"""
+import os
+
+from flask import Flask, jsonify, request, abort
+
+from exchange.components.order import OrderType
+from exchange.components.sharded_exchange import ShardedExchange
+from exchange.configuration import create_symbol_exchange
+from exchange.serialization import DEFAULT_MATCHES_LIMIT, MAX_MATCHES_LIMIT, OrderBookQuery, order_book_to_json, \
+    parse_order
+
+app = Flask(__name__)
+
+exchange = None
+
+
+@app.route('/order', methods=['POST'])
+def submit_limit_order():
+    if not request.json or 'symbol' not in request.json:
+        abort(400)
+
+    try:
+        order_type, size, price = parse_order(request.json)
+    except ValueError:
+        abort(400)
+
+    try:
+        if order_type == OrderType.BUY:
+            order_id = exchange.submit_buy(request.json['symbol'], size=size, price=price)
+        else:
+            order_id = exchange.submit_sell(request.json['symbol'], size=size, price=price)
+    except ValueError:
+        abort(400)
+
+    return jsonify({'order_id': order_id})
+
+
+@app.route('/orders', methods=['POST'])
+def submit_limit_orders():
+    """
+    Submit a batch of limit orders for one symbol: {"symbol": "ABC", "orders": [...]}
+    """
+    if not request.json or 'symbol' not in request.json or not isinstance(request.json.get('orders'), list):
+        abort(400)
+
+    results = [None] * len(request.json['orders'])
+    orders = []
+    positions = []
+
+    for position, order_json in enumerate(request.json['orders']):
+        try:
+            orders.append(parse_order(order_json))
+        except ValueError as error:
+            results[position] = {'rejected': str(error)}
+            continue
+
+        positions.append(position)
+
+    try:
+        batch_results = exchange.submit_batch(request.json['symbol'], orders)
+    except ValueError:
+        abort(400)
+
+    for position, result in zip(positions, batch_results):
+        results[position] = result
+
+    return jsonify({'orders': results})
+
+
+@app.route('/order/<order_id>', methods=['GET'])
+def get_order(order_id):
+    """The order with at most limit of its matches after the first after, see rest_api.get_order"""
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', DEFAULT_MATCHES_LIMIT))
+    except ValueError:
+        abort(400)
+
+    if after < 0 or limit < 0:
+        abort(400)
+
+    summary = exchange.find_order_summary(order_id, after, min(limit, MAX_MATCHES_LIMIT))
+
+    if not summary:
+        abort(404)
+
+    return jsonify(summary)
+
+
+@app.route('/order/<order_id>', methods=['DELETE'])
+def cancel_order(order_id):
+    try:
+        summary = exchange.cancel(order_id, DEFAULT_MATCHES_LIMIT)
+    except KeyError:
+        abort(404)
+
+    # The order has already been fully matched or cancelled
+    if summary is None:
+        abort(409)
+
+    return jsonify(summary)
+
+
+@app.route('/orderBook/<symbol>', methods=['GET'])
+def get_order_book(symbol):
+    # Optionally only return the best N price levels on each side, the levels between min and max, or the levels added
+    # up into buckets of that many ticks
+    try:
+        query = OrderBookQuery.from_args(request.args)
+        order_book = exchange.get_symbol_order_book(symbol)
+    except ValueError:
+        abort(400)
+
+    return jsonify(order_book_to_json(query.summarise_exchange(order_book)))
+
+
+if __name__ == '__main__':
+    exchange = ShardedExchange(
+        number_of_shards=int(os.environ.get('EXCHANGE_SHARDS', os.cpu_count())),
+        exchange_factory=create_symbol_exchange
+    )
+
+    # Each shard is single threaded, serve requests on many threads so that requests for different shards run in
+    # parallel
+    # host 0.0.0.0 for docker
+    app.run(threaded=True, host='0.0.0.0')
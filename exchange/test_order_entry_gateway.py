@@ -0,0 +1,254 @@
+import asyncio
+import socket
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from exchange.components.exchange import Exchange
+from exchange.components.matching_engine import MatchingEngine
+from exchange.components.memory_report import MemoryMonitor
+from exchange.components.order import OrderType
+from exchange.order_entry_client import Ack, Fill, OrderEntryClient, OrderRejectedError, Reject
+from exchange.order_entry_gateway import OrderEntryGateway
+from exchange.order_entry_protocol import EXCHANGE_BUSY, INVALID_ORDER, NEW_ORDER_MESSAGE, OUT_OF_MEMORY, \
+    encode_new_order, read_messages, ProtocolError
+
+
+class TestOrderEntryProtocol(TestCase):
+    def test_read_messages(self):
+        data = bytearray(encode_new_order(1, OrderType.BUY, 10, 100) + encode_new_order(2, OrderType.SELL, 5, 99))
+
+        # The start of the second message is left for the next read
+        messages, parsed = read_messages(data, 0, len(data) - 1)
+        self.assertEqual(messages, [NEW_ORDER_MESSAGE.unpack(data[:NEW_ORDER_MESSAGE.size])])
+        self.assertEqual(parsed, NEW_ORDER_MESSAGE.size)
+
+        messages, parsed = read_messages(data, parsed, len(data))
+        self.assertEqual(messages, [(ord('N'), 1, 2, 5, 99)])
+        self.assertEqual(parsed, len(data))
+
+        with self.assertRaises(ProtocolError):
+            read_messages(b'X' + bytes(NEW_ORDER_MESSAGE.size), 0, NEW_ORDER_MESSAGE.size + 1)
+
+
+class TestOrderEntryGateway(TestCase):
+    def setUp(self):
+        self.exchange = Exchange()
+        self.engine = None
+        self.memory_monitor = None
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+        if self.engine is not None:
+            self.engine.stop()
+
+    def start(self):
+        """Serve the gateway on an event loop of its own thread, as the main thread of a process would"""
+        self.gateway = OrderEntryGateway(self.exchange, self.engine, self.memory_monitor)
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(self.gateway.start_server('127.0.0.1', 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+
+    def connect(self):
+        client = OrderEntryClient('127.0.0.1', self.port, timeout=10)
+        self.addCleanup(client.close)
+        return client
+
+    def assert_fill(self, message, client_order_id, order_id, size, price, unmatched_size):
+        self.assertIsInstance(message, Fill)
+        self.assertEqual((message.client_order_id, message.order_id, message.size, message.price,
+                          message.unmatched_size), (client_order_id, order_id, size, price, unmatched_size))
+
+    def test_acks_and_fills(self):
+        self.start()
+        seller = self.connect()
+        buyer = self.connect()
+
+        first_sell = seller.submit_sell(size=10, price=100)
+        second_sell = seller.submit_sell(size=10, price=101)
+        self.assertEqual((first_sell.client_order_id, first_sell.unmatched_size), (1, 10))
+
+        # The order ids are the ones of the REST API
+        self.assertEqual(self.exchange_call(self.exchange.get_order, first_sell.order_id).get_unmatched_size(), 10)
+
+        buy = buyer.submit_buy(size=15, price=101)
+        self.assertEqual(buy.unmatched_size, 0)
+
+        # The ack comes first, then a fill for every match of the order in the order they were made
+        self.assert_fill(buyer.read_message(), 1, buy.order_id, 10, 100, 5)
+        self.assert_fill(buyer.read_message(), 1, buy.order_id, 5, 101, 0)
+
+        # The resting orders are told about their matches too
+        self.assert_fill(seller.read_message(), 1, first_sell.order_id, 10, 100, 0)
+        self.assert_fill(seller.read_message(), 2, second_sell.order_id, 5, 101, 5)
+        self.assertEqual(self.exchange_call(self.exchange.get_order, second_sell.order_id).get_unmatched_size(), 5)
+
+    def test_more_matches_than_one_read(self):
+        self.start()
+        client = self.connect()
+
+        sells = [client.submit_sell(size=1, price=100 + price) for price in range(5)]
+
+        # The fills of the buy are read from the trade tape in several reads
+        with patch('exchange.order_entry_gateway._TRADES_PER_READ', 2):
+            buy = client.submit_buy(size=6, price=200)
+
+        self.assertEqual(buy.unmatched_size, 1)
+
+        for price, sell in enumerate(sells):
+            self.assert_fill(client.read_message(), len(sells) + 1, buy.order_id, 1, 100 + price, 5 - price)
+            self.assert_fill(client.read_message(), sell.client_order_id, sell.order_id, 1, 100 + price, 0)
+
+        # The buy is still open and told about its later fills
+        other_sell = self.connect().submit_sell(size=1, price=200)
+        self.assert_fill(client.read_message(), len(sells) + 1, buy.order_id, 1, 200, 0)
+        self.assertEqual(other_sell.unmatched_size, 0)
+
+    def test_orders_cancelled_elsewhere_are_forgotten(self):
+        with patch('exchange.order_entry_gateway._MIN_PRUNE_ORDERS', 4):
+            self.start()
+            client = self.connect()
+            acks = [client.submit_sell(size=1, price=100 + price) for price in range(3)]
+
+            for ack in acks:
+                self.exchange_call(self.exchange.cancel, ack.order_id)
+
+            # The next order takes the open orders to the pruning threshold
+            resting = client.submit_sell(size=1, price=200)
+
+        self.assertEqual(self.exchange_call(lambda: list(self.gateway._open_orders)),
+                         [self.exchange_call(self.exchange.get_order, resting.order_id).id])
+
+    def test_rejects(self):
+        self.start()
+        client = self.connect()
+
+        with self.assertRaises(OrderRejectedError) as context:
+            client.submit_buy(size=0, price=100)
+
+        self.assertEqual(context.exception.reject.reason, INVALID_ORDER)
+
+        # The connection is still usable
+        self.assertIsInstance(client.submit_buy(size=1, price=100), Ack)
+
+    def test_pipelined_orders(self):
+        self.start()
+        client = self.connect()
+
+        orders = [(OrderType.SELL, 1, 100 + price) for price in range(500)] + [(OrderType.BUY, 500, 1000)]
+        client_order_ids = client.send_new_orders(orders)
+
+        acks = [client.read_message() for _ in range(len(orders) - 1)]
+        self.assertEqual([ack.client_order_id for ack in acks], client_order_ids[:-1])
+
+        # The ack of the buy comes before all of the fills of both sides of its matches
+        self.assertEqual(client.read_message().client_order_id, client_order_ids[-1])
+
+        fills = [client.read_message() for _ in range(2 * len(acks))]
+        self.assertTrue(all(isinstance(fill, Fill) for fill in fills))
+        self.assertEqual(fills[-1].unmatched_size, 0)
+        self.assertEqual(self.exchange_call(self.exchange.get_exchange_summary).sell_dict, {})
+
+    def test_unknown_message_closes_connection(self):
+        self.start()
+        connection = socket.create_connection(('127.0.0.1', self.port), timeout=10)
+        self.addCleanup(connection.close)
+
+        connection.sendall(b'X' * 100)
+        self.assertEqual(connection.recv(100), b'')
+
+        # Other connections are served as usual
+        self.assertIsInstance(self.connect().submit_sell(size=1, price=1), Ack)
+
+    def test_matching_engine_reports_fills_of_other_apis(self):
+        self.engine = MatchingEngine(self.exchange)
+        self.engine.start()
+        self.start()
+        client = self.connect()
+
+        sell = client.submit_sell(size=10, price=100)
+
+        # An order of the REST API takes some of it
+        self.engine.execute(Exchange.submit_buy, 4, 100).result()
+        self.assert_fill(client.read_message(), 1, sell.order_id, 4, 100, 6)
+
+        buy = client.submit_buy(size=6, price=100)
+        self.assert_fill(client.read_message(), 2, buy.order_id, 6, 100, 0)
+        self.assert_fill(client.read_message(), 1, sell.order_id, 6, 100, 0)
+
+    def test_busy_exchange(self):
+        self.engine = MatchingEngine(self.exchange, max_queue_size=1)
+        self.start()
+        client = self.connect()
+
+        # The matching thread is not started, so the first batch fills the queue and the second is turned away
+        client.send_new_order(OrderType.BUY, 1, 100)
+
+        while self.engine.get_queue_size() == 0:
+            pass
+
+        other = self.connect()
+        other_client_order_id = other.send_new_order(OrderType.SELL, 1, 100)
+        reject = other.read_message()
+        self.assertIsInstance(reject, Reject)
+        self.assertEqual((reject.client_order_id, reject.reason), (other_client_order_id, EXCHANGE_BUSY))
+
+        self.engine.start()
+        self.assertIsInstance(client.read_message(), Ack)
+
+    def test_busy_exchange_forgets_closed_connection_later(self):
+        self.engine = MatchingEngine(self.exchange, max_queue_size=1)
+        self.engine.start()
+        self.start()
+        client = self.connect()
+        client.submit_buy(size=1, price=100)
+
+        # Hold up the matching thread and fill the queue, so the connection is closed while the exchange is busy
+        matching = threading.Event()
+        self.engine.execute(lambda exchange: matching.wait())
+
+        while self.engine.get_queue_size():
+            pass
+
+        queued = self.engine.execute(Exchange.submit_sell, 5, 200)
+        client.close()
+
+        while not self.gateway._closed_connections:
+            pass
+
+        # The orders of the closed connection are forgotten after the next batch
+        matching.set()
+        queued.result()
+        self.assertEqual(self.engine.read(lambda exchange: len(self.gateway._open_orders)).result(), 0)
+
+    def test_out_of_memory(self):
+        used_bytes = [100]
+        self.memory_monitor = MemoryMonitor(reject_bytes=200, check_interval=0, read_memory=lambda: used_bytes[0])
+        self.start()
+        client = self.connect()
+
+        self.assertIsInstance(client.submit_sell(size=1, price=100), Ack)
+
+        used_bytes[0] = 200
+
+        with self.assertLogs('exchange.components.memory_report', level='WARNING'):
+            self.memory_monitor.check()
+
+        with self.assertRaises(OrderRejectedError) as context:
+            client.submit_sell(size=1, price=100)
+
+        self.assertEqual(context.exception.reject.reason, OUT_OF_MEMORY)
+
+    def exchange_call(self, function, *args):
+        """Call function on the event loop, which owns the exchange without a MatchingEngine"""
+        async def call():
+            return function(*args)
+
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
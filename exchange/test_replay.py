@@ -0,0 +1,73 @@
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.components.journal import Journal, read_journal
+from exchange.components.order_id import encode_order_id
+from exchange.replay import ReplayStatistics, create_replay_exchange, read_csv, replay, write_json_lines
+
+ORDERS_CSV = '''order_type,size,price,order_number
+SELL,10,100,
+SELL,10,101,1000
+BUY,15,101,
+BUY,5,90
+CANCEL,,,1000
+SELL,-5,100
+BUY,10,200
+'''
+
+
+class TestReplay(TestCase):
+    def test_replay_csv(self):
+        statistics = ReplayStatistics()
+        exchange = create_replay_exchange()
+        output = io.StringIO()
+
+        write_json_lines(replay(read_csv(io.StringIO(ORDERS_CSV)), exchange, statistics, summary_every=2), output)
+        events = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        trades = [event['trade'] for event in events if 'trade' in event]
+        self.assertEqual([(trade['sequence'], trade['size'], trade['price']) for trade in trades],
+                         [(1, 10, 100), (2, 5, 101)])
+        self.assertEqual(trades[1]['sell_order_id'], encode_order_id(1000))
+
+        books = [event['book'] for event in events if 'book' in event]
+        self.assertEqual([book['orders'] for book in books], [2, 4, 6])
+        self.assertEqual(books[1]['SELL'], {'101': 5})
+        self.assertEqual(books[2]['SELL'], {})
+
+        self.assertEqual(statistics.orders, 6)
+        self.assertEqual(statistics.cancels, 1)
+        self.assertEqual(statistics.rejected, 1)
+        self.assertEqual(statistics.trades, 2)
+
+        # Fully matched orders are not kept
+        self.assertEqual(exchange.get_order_store_metrics()['live_orders'], 2)
+
+    def test_replay_journal(self):
+        journal_path = os.path.join(tempfile.mkdtemp(), 'journal')
+        journal = Journal(journal_path, fsync_every_events=100)
+        exchange = Exchange(journal=journal)
+
+        resting_order_id = exchange.submit_buy(size=50, price=400)
+        exchange.submit_sell(size=10, price=200)
+        exchange.cancel(resting_order_id)
+        exchange.submit_sell(size=30, price=500)
+        journal.close()
+
+        statistics = ReplayStatistics()
+        replayed_exchange = create_replay_exchange()
+        events = list(replay(read_journal(journal_path), replayed_exchange, statistics))
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][1].get_summary()['buy_order_id'], resting_order_id)
+        self.assertEqual(statistics.cancels, 1)
+        self.assertEqual(replayed_exchange.get_exchange_summary().buy_dict, exchange.get_exchange_summary().buy_dict)
+        self.assertEqual(replayed_exchange.get_exchange_summary().sell_dict, exchange.get_exchange_summary().sell_dict)
+
+    def test_invalid_row(self):
+        with self.assertRaises(ValueError):
+            list(read_csv(io.StringIO('BUY,10,100\nBUY,ten,100\n')))
@@ -0,0 +1,90 @@
+import json
+from unittest import TestCase
+
+from exchange.components.exchange import Exchange
+from exchange.serialization import OrderBookJsonCache, OrderBookQuery
+
+
+class TestOrderBookJsonCache(TestCase):
+    def setUp(self):
+        self.exchange = Exchange()
+        self.summaries = 0
+
+    def summarise(self, query):
+        self.summaries += 1
+
+        return query.summarise_exchange(self.exchange)
+
+    def get(self, cache, depth=None, **kwargs):
+        return cache.get(self.exchange.get_order_book_version(), OrderBookQuery(depth, **kwargs), self.summarise)
+
+    def test_encoded_once_per_version(self):
+        cache = OrderBookJsonCache(json.dumps)
+        self.exchange.submit_buy(size=10, price=100)
+        self.exchange.submit_buy(size=5, price=90)
+
+        etag, body = self.get(cache)
+        self.assertEqual(json.loads(body.decode('utf-8')), {'BUY': {'90': 5, '100': 10}, 'SELL': {}})
+        self.assertEqual(self.get(cache), (etag, body))
+        self.assertEqual(self.summaries, 1)
+
+        depth_etag, depth_body = self.get(cache, depth=1)
+        self.assertNotEqual(depth_etag, etag)
+        self.assertEqual(json.loads(depth_body.decode('utf-8')), {'BUY': {'100': 10}, 'SELL': {}})
+        self.assertEqual(self.get(cache, depth=1), (depth_etag, depth_body))
+        self.assertEqual(self.summaries, 2)
+
+        # Any change to the order book makes a new body with a new ETag
+        self.exchange.submit_sell(size=3, price=100)
+        new_etag, new_body = self.get(cache)
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(json.loads(new_body.decode('utf-8')), {'BUY': {'90': 5, '100': 7}, 'SELL': {}})
+        self.assertEqual(self.summaries, 3)
+
+    def test_ranges_are_cached(self):
+        cache = OrderBookJsonCache(json.dumps)
+
+        for price in (90, 95, 100, 105):
+            self.exchange.submit_buy(size=10, price=price)
+
+        etag, body = self.get(cache, min_price=92, bucket=10)
+        self.assertEqual(json.loads(body.decode('utf-8')), {'BUY': {'90': 10, '100': 20}, 'SELL': {}})
+        self.assertTrue(etag.endswith('-min92-bucket10'))
+        self.assertEqual(self.get(cache, min_price=92, bucket=10), (etag, body))
+
+        # The best buckets
+        etag, body = self.get(cache, depth=1, bucket=10)
+        self.assertEqual(json.loads(body.decode('utf-8')), {'BUY': {'100': 20}, 'SELL': {}})
+        self.assertEqual(self.summaries, 2)
+
+    def test_etags_differ_between_caches(self):
+        # e.g. before and after a restart, when the version starts again
+        self.assertNotEqual(self.get(OrderBookJsonCache(json.dumps))[0], self.get(OrderBookJsonCache(json.dumps))[0])
+
+    def test_only_some_depths_are_cached(self):
+        cache = OrderBookJsonCache(json.dumps, max_cached_depths=1)
+
+        self.get(cache, depth=1)
+        self.get(cache, depth=2)
+        self.get(cache, depth=2)
+        self.get(cache, depth=1)
+
+        self.assertEqual(self.summaries, 3)
+
+
+class TestOrderBookQuery(TestCase):
+    def test_from_args(self):
+        self.assertEqual(OrderBookQuery.from_args({}), OrderBookQuery())
+        self.assertEqual(OrderBookQuery.from_args({'depth': '5'}), OrderBookQuery(depth=5))
+        self.assertEqual(OrderBookQuery.from_args({'min': '-10', 'max': '20', 'bucket': '5'}),
+                         OrderBookQuery(min_price=-10, max_price=20, bucket=5))
+
+        for args in ({'depth': 'x'}, {'depth': '-1'}, {'min': ''}, {'bucket': '0'}, {'min': '2', 'max': '1'}):
+            with self.assertRaises(ValueError):
+                OrderBookQuery.from_args(args)
+
+    def test_str(self):
+        self.assertEqual(str(OrderBookQuery()), 'all')
+        self.assertEqual(str(OrderBookQuery(depth=3)), '3')
+        self.assertEqual(str(OrderBookQuery(depth=3, max_price=100)), 'depth3-max100')
+        self.assertNotEqual(OrderBookQuery(min_price=1), OrderBookQuery(max_price=1))
@@ -0,0 +1,24 @@
+from unittest import TestCase
+
+from exchange import sharded_rest_api
+from exchange.components.sharded_exchange import ShardedExchange
+
+
+class TestShardedRestApi(TestCase):
+    def setUp(self):
+        sharded_rest_api.exchange = ShardedExchange(number_of_shards=2)
+        self.addCleanup(sharded_rest_api.exchange.close)
+        self.client = sharded_rest_api.app.test_client()
+
+    def test_order_book(self):
+        for price in (100, 101, 150):
+            self.client.post('/order', json={'symbol': 'ABC', 'order_type': 'SELL', 'size': 10, 'price': price})
+
+        self.assertEqual(self.client.get('/orderBook/ABC').get_json()['SELL'], {'100': 10, '101': 10, '150': 10})
+        self.assertEqual(self.client.get('/orderBook/ABC?depth=1').get_json()['SELL'], {'100': 10})
+        self.assertEqual(self.client.get('/orderBook/ABC?max=120&bucket=50').get_json()['SELL'], {'100': 20})
+        self.assertEqual(self.client.get('/orderBook/XYZ').get_json()['SELL'], {})
+
+    def test_invalid_symbol(self):
+        self.assertEqual(self.client.get('/orderBook/A-B').status_code, 400)
+        self.assertEqual(self.client.get('/orderBook/A B').status_code, 400)